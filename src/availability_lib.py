@@ -0,0 +1,661 @@
+#!/usr/bin/env python
+'''Fast availability of controller placements under link failures.
+
+With SSSP connectivity, a switch reaches a controller in a failure state iff
+no edge on its shortest path to that controller failed.  So availability
+splits into per-(switch, controller) terms that do not depend on the combo:
+the probability that a pair's path survives, summed over failure states
+with up to max_failures failed links.  These are computed once per graph,
+for all pairs, and each combo then only weights the terms for its closest
+(switch, controller) pairs, for whole blocks of combos at once.
+
+Four engines compute availabilities:
+    exact: closed form.  With q_e = 1 - p_e, the probability mass of the
+        states with f failures, none on path P, is
+        prod(q_e, e in P) * [x^f] prod(q_e + p_e x, e not in P),
+        and the second product is the all-edges product divided by the
+        path's, as power series truncated at degree max_failures.
+    enumerate: walks every failure set, as bitmasks tested against
+        per-pair path bitmasks in vectorized blocks, with state
+        probabilities from a shared FailureStates.
+    state_major: keeps each failure state's n x n path-clear matrix, built
+        once, and reduces whole blocks of them against whole blocks of
+        combos, so per-state connectivity of every combo is available.
+    sample: Monte Carlo estimate, for failure models too large to
+        enumerate.  Failure states are drawn from the per-link Bernoulli
+        model, stratified by # failed links so that rare multi-failure
+        states get sampled, and weighted back by the exact probability of
+        each #; each combo's estimate comes with a confidence interval.
+'''
+
+import numpy
+
+from combo_lib import combo_blocks
+from path_matrix_lib import PathMatrix, path_matrix_from_paths, _closest_pairs
+
+AVAILABILITY_MODES = ['exact', 'enumerate', 'sample', 'state_major']
+
+# The exact engine redoes a pair directly where dividing by its path's
+# series could amplify rounding errors by more than 1 / MIN_DIVISION_GAIN,
+# or where a coefficient is off by more than ROUNDING_TOLERANCE.
+MIN_DIVISION_GAIN = 1e-6
+ROUNDING_TOLERANCE = 1e-9
+
+# Max (failure sets x pairs) tested at once by the enumerate engine.
+MAX_MASK_TESTS = 1 << 22
+
+# Defaults for the sample engine.
+SAMPLES = 10000
+SEED = 0
+
+# Fewest samples the sample engine draws for any possible # failed links.
+MIN_STRATUM_SAMPLES = 2
+
+# z for two-sided 95% confidence intervals.
+CONFIDENCE_Z = 1.96
+
+
+def link_fail_probs(g, edges, weighted, link_fail_prob):
+    '''Return the failure probability of each edge.
+
+    @param g: NetworkX graph
+    @param edges: list of (src, dst) node name pairs
+    @param weighted: is graph weighted?
+    @param link_fail_prob: probability per unit weight that a link fails if
+        weighted, else probability that a link fails
+    @return probs: float NumPy array, one per edge
+    '''
+    if weighted:
+        weights = numpy.array([g[src][dst]['weight'] for src, dst in edges],
+                              dtype = float)
+        probs = link_fail_prob * weights
+    else:
+        probs = numpy.empty(len(edges))
+        probs.fill(link_fail_prob)
+    if len(probs) and (probs.min() < 0.0 or probs.max() >= 1.0):
+        raise Exception("link failure probabilities must be in [0, 1)")
+    return probs
+
+
+class FailureStates(object):
+    '''Failure states of a graph's links and their probabilities.
+
+    Probabilities are kept as logs: the all-up state's, plus each link's log
+    odds of failing, so a state's weight is a sum over its failed links
+    only.  States are enumerated once per # failures and then reused for
+    every combo and every max_failures.
+    '''
+
+    def __init__(self, edges, probs):
+        '''
+        @param edges: list of (src, dst) node name pairs
+        @param probs: failure probability of each edge, from link_fail_probs
+        '''
+        self.edges = edges
+        self.probs = probs
+        with numpy.errstate(divide = 'ignore'):
+            log_up = numpy.log1p(-probs)
+            self.log_all_up = log_up.sum()
+            self.log_odds = numpy.log(probs) - log_up
+        self.levels = []  # (failed ids, state probs) per # failures
+
+    def _add_level(self):
+        failures = len(self.levels)
+        if failures == 0:
+            failed = numpy.zeros((1, 0), dtype = numpy.intp)
+        elif failures > len(self.edges):
+            failed = numpy.zeros((0, failures), dtype = numpy.intp)
+        else:
+            failed = numpy.concatenate(list(combo_blocks(len(self.edges), failures)))
+        state_probs = numpy.exp(self.log_all_up + self.log_odds[failed].sum(axis = 1))
+        self.levels.append((failed, state_probs))
+
+    def level(self, failures):
+        '''Return the states with exactly some number of failed links.
+
+        @param failures: # failed links
+        @return failed: (F, failures) int array of failed edge ids
+        @return state_probs: (F,) array of state probabilities
+        '''
+        while len(self.levels) <= failures:
+            self._add_level()
+        return self.levels[failures]
+
+
+# Single-entry cache of the last FailureStates.
+_states_cache = {'key': None, 'states': None}
+
+def get_failure_states(g, weighted, link_fail_prob, edges = None):
+    '''Return the (cached) FailureStates for a graph and failure model.
+
+    @param g: NetworkX graph
+    @param weighted: is graph weighted?
+    @param link_fail_prob: see link_fail_probs
+    @param edges: list of (src, dst) links giving the edge id order, such as
+        PathMatrix.edges; g.edges() if None.  Graphs attached in pool
+        workers list their edges in a different order.
+    '''
+    key = (g, edges, weighted, link_fail_prob)
+    cached = _states_cache['key']
+    if (cached is None or cached[0] is not g or cached[1] is not edges or
+        cached[2:] != key[2:]):
+        if edges is None:
+            state_edges = g.edges()
+        else:
+            state_edges = edges
+        _states_cache['states'] = FailureStates(state_edges,
+            link_fail_probs(g, state_edges, weighted, link_fail_prob))
+        _states_cache['key'] = key
+    return _states_cache['states']
+
+
+def failure_polynomial(probs, max_failures):
+    '''Return [x^f] prod(1 - p_e + p_e x), for f up to max_failures.
+
+    Entry f is the probability that exactly f of the edges fail.
+    '''
+    poly = numpy.zeros(max_failures + 1)
+    poly[0] = 1.0
+    for p in probs:
+        poly[1:] = poly[1:] * (1.0 - p) + poly[:-1] * p
+        poly[0] *= 1.0 - p
+    return poly
+
+
+def coverage(probs, max_failures):
+    '''Return the probability of at most max_failures failed links.'''
+    return failure_polynomial(probs, max_failures).sum()
+
+
+def path_polynomials(pm, probs, max_failures):
+    '''Return failure polynomials of every pair's path edges.
+
+    @return polys: (n * n, max_failures + 1) array; row s * n + t is
+        failure_polynomial of the edges on the path from s to t.
+    '''
+    n = len(pm.nodes)
+    lengths = numpy.diff(pm.pair_offsets)
+    polys = numpy.zeros((n * n, max_failures + 1))
+    polys[:, 0] = 1.0
+    for step in range(lengths.max() if n else 0):
+        pairs = numpy.nonzero(lengths > step)[0]
+        p = probs[pm.pair_edges[pm.pair_offsets[pairs] + step]][:, numpy.newaxis]
+        rows = polys[pairs]
+        rows[:, 1:] = rows[:, 1:] * (1.0 - p) + rows[:, :-1] * p
+        rows[:, 0] *= 1.0 - p[:, 0]
+        polys[pairs] = rows
+    return polys
+
+
+def pair_availability(pm, probs, max_failures):
+    '''Return the probability that each pair's path survives, exactly.
+
+    Only failure states with at most max_failures failed links count.
+
+    @param pm: PathMatrix
+    @param probs: failure probability of each edge in pm.edges
+    @param max_failures: max # simultaneous failures to consider
+    @return avail: n x n array; avail[s][t] covers the path from s to t
+    '''
+    n = len(pm.nodes)
+    total = failure_polynomial(probs, max_failures)
+    paths = path_polynomials(pm, probs, max_failures)
+    # Divide the all-edges series by each path's, leaving the edges off the
+    # path; paths[:, 0] is nonzero since every probability is below 1.
+    rest = numpy.empty_like(paths)
+    for f in range(max_failures + 1):
+        rest[:, f] = total[f] - (paths[:, 1:f + 1] * rest[:, f - 1::-1][:, :f]).sum(axis = 1)
+        rest[:, f] /= paths[:, 0]
+    # Each step divides by paths[:, 0], so rounding errors grow like its
+    # inverse to the max_failures; redo pairs where that could show, or
+    # where the coefficients are plainly off, by direct multiplication.
+    with numpy.errstate(under = 'ignore'):
+        unstable = paths[:, 0] ** max_failures < MIN_DIVISION_GAIN
+    unstable |= ~numpy.isfinite(rest).all(axis = 1)
+    unstable |= ((rest < -ROUNDING_TOLERANCE) |
+                 (rest > 1.0 + ROUNDING_TOLERANCE)).any(axis = 1)
+    pairs = numpy.nonzero(unstable)[0]
+    if len(pairs):
+        rest[pairs] = off_path_polynomials(pm, probs, max_failures, pairs)
+    return (paths[:, 0] * rest.sum(axis = 1)).reshape(n, n)
+
+
+def off_path_polynomials(pm, probs, max_failures, pairs):
+    '''Return failure polynomials of the edges off some pairs' paths.
+
+    @param pairs: int array of pair indices, s * n + t
+    @return polys: (len(pairs), max_failures + 1) array
+    '''
+    on_path = numpy.zeros((len(pairs), len(probs)), dtype = bool)
+    lengths = numpy.diff(pm.pair_offsets)[pairs]
+    owner = numpy.repeat(numpy.arange(len(pairs)), lengths)
+    edge_ids = numpy.concatenate([pm.pair_edges[pm.pair_offsets[i]:pm.pair_offsets[i + 1]]
+                                  for i in pairs])
+    on_path[owner, edge_ids] = True
+    polys = numpy.zeros((len(pairs), max_failures + 1))
+    polys[:, 0] = 1.0
+    for e, p in enumerate(probs):
+        # Edges on the path contribute a factor of 1 instead.
+        p = numpy.where(on_path[:, e], 0.0, p)[:, numpy.newaxis]
+        polys[:, 1:] = polys[:, 1:] * (1.0 - p) + polys[:, :-1] * p
+        polys[:, 0] *= 1.0 - p[:, 0]
+    return polys
+
+
+def path_masks(pm):
+    '''Return the edges of every pair's path as bitmasks.
+
+    @return masks: (n * n, words) uint64 array; bit e % 64 of word e / 64 of
+        row s * n + t is set iff edge e is on the path from s to t.
+    '''
+    n = len(pm.nodes)
+    words = max((len(pm.edges) + 63) / 64, 1)
+    masks = numpy.zeros((n * n, words), dtype = numpy.uint64)
+    owner = numpy.repeat(numpy.arange(n * n), numpy.diff(pm.pair_offsets))
+    edge_ids = pm.pair_edges.astype(numpy.uint64)
+    numpy.bitwise_or.at(masks, (owner, (edge_ids / 64).astype(numpy.intp)),
+                        numpy.left_shift(numpy.uint64(1), edge_ids % 64))
+    return masks
+
+
+def failure_masks(failed, words):
+    '''Return bitmasks for a block of failure sets.
+
+    @param failed: (F, f) int array of failed edge ids
+    @param words: uint64 words per mask
+    @return masks: (F, words) uint64 array
+    '''
+    masks = numpy.zeros((len(failed), words), dtype = numpy.uint64)
+    rows = numpy.arange(len(failed))
+    for column in failed.T.astype(numpy.uint64):
+        word = (column / 64).astype(numpy.intp)
+        masks[rows, word] |= numpy.left_shift(numpy.uint64(1), column % 64)
+    return masks
+
+
+def pair_availability_enumerated(pm, states, max_failures):
+    '''Return the probability that each pair's path survives, by enumeration.
+
+    Same result as pair_availability, but visits every failure set.
+
+    @param pm: PathMatrix
+    @param states: FailureStates, over pm.edges
+    @param max_failures: max # simultaneous failures to consider
+    '''
+    n = len(pm.nodes)
+    pair_masks = path_masks(pm)
+    avail = numpy.zeros(n * n)
+    block_size = max(MAX_MASK_TESTS / max(n * n, 1), 1)
+    for failures in range(min(max_failures, len(pm.edges)) + 1):
+        failed, state_probs = states.level(failures)
+        for start in range(0, len(failed), block_size):
+            masks = failure_masks(failed[start:start + block_size],
+                                  pair_masks.shape[1])
+            hit = (masks[:, numpy.newaxis, :] & pair_masks[numpy.newaxis]).any(axis = 2)
+            avail += numpy.dot(state_probs[start:start + block_size], ~hit)
+    return avail.reshape(n, n)
+
+
+def pair_clear_bits(pm, states, max_failures):
+    '''Return the path-clear matrix of every failure state, in packed bits.
+
+    @param pm: PathMatrix
+    @param states: FailureStates, over pm.edges
+    @param max_failures: max # simultaneous failures to consider
+    @return blocks: list of (clear, state_probs); bit s * n + t of row i of
+        clear, a (F, n * n / 8) uint8 array, is set iff the path from s to
+        t survives state i, which has probability state_probs[i].
+    '''
+    n = len(pm.nodes)
+    pair_masks = path_masks(pm)
+    blocks = []
+    block_size = max(MAX_MASK_TESTS / max(n * n, 1), 1)
+    for failures in range(min(max_failures, len(pm.edges)) + 1):
+        failed, state_probs = states.level(failures)
+        for start in range(0, len(failed), block_size):
+            masks = failure_masks(failed[start:start + block_size],
+                                  pair_masks.shape[1])
+            hit = (masks[:, numpy.newaxis, :] & pair_masks[numpy.newaxis]).any(axis = 2)
+            blocks.append((numpy.packbits(~hit, axis = 1),
+                           state_probs[start:start + block_size]))
+    return blocks
+
+
+def combo_shares(dm, combos):
+    '''Return the weight of each (switch, controller) pair for some combos.
+
+    @param dm: DistMatrix
+    @param combos: (B, k) NumPy int array of matrix indices
+    @return pairs: (U,) sorted int array of the pairs used, s * n + t
+    @return weights: (U, B) array; column b weights combo b's pairs, so that
+        its availability in a state is weights[:, b] . clear[pairs] / n
+    '''
+    n = len(dm.nodes)
+    sub = dm.dist.T[combos]
+    ties = (sub == sub.min(axis = 1)[:, numpy.newaxis, :])
+    shares = ties / ties.sum(axis = 1)[:, numpy.newaxis, :].astype(float)
+    rows, slots, switches = numpy.nonzero(ties)
+    pairs, inverse = numpy.unique(switches * n + combos[rows, slots],
+                                  return_inverse = True)
+    weights = numpy.zeros((len(pairs), len(combos)))
+    numpy.add.at(weights, (inverse, rows), shares[rows, slots, switches])
+    return pairs, weights
+
+
+class StateMajorAvailability(object):
+    '''Availability by failure state, for blocks of combos at once.
+
+    Whether a switch's path to a controller is clear in a failure state does
+    not depend on the combo, so each state's path-clear matrix is built
+    once, from the path bitmasks, and kept in packed bits: about
+    n^2 / 8 bytes per state.  A block of combos then becomes a sparse
+    (pair x combo) weight matrix, and each block of states is reduced
+    against it with one product, giving the connectivity of every combo in
+    every state.
+    '''
+
+    def __init__(self, pm, states, max_failures):
+        '''
+        @param pm: PathMatrix
+        @param states: FailureStates, over pm.edges
+        @param max_failures: max # simultaneous failures to consider
+        '''
+        self.n = len(pm.nodes)
+        self.blocks = pair_clear_bits(pm, states, max_failures)
+
+    def connectivity(self, dm, combos):
+        '''Yield the connectivity of some combos in each block of states.
+
+        @param dm: DistMatrix, in the same node order
+        @param combos: (B, k) NumPy int array of matrix indices
+        @return iterator of (conn, state_probs); conn[i][b] is the fraction
+            of switches that reach a controller of combo b in state i
+        '''
+        pairs, weights = combo_shares(dm, combos)
+        weights /= float(self.n)
+        # Packed bits are big-endian within each byte.
+        byte_ids = pairs >> 3
+        shifts = (7 - (pairs & 7)).astype(numpy.uint8)
+        for clear, state_probs in self.blocks:
+            bits = (clear[:, byte_ids] >> shifts) & 1
+            yield numpy.dot(bits, weights), state_probs
+
+    def availability(self, dm, combos):
+        '''Return the availability of a block of combos.
+
+        @return values: (B,) float array
+        '''
+        values = numpy.zeros(len(combos))
+        for conn, state_probs in self.connectivity(dm, combos):
+            values += numpy.dot(state_probs, conn)
+        return values
+
+
+def conditional_fail_probs(probs, max_failures):
+    '''Return tables for drawing failure sets with a given # failed links.
+
+    Given that r of the links i..E-1 fail, link i fails with probability
+    p_i * T[i + 1][r - 1] / T[i][r], where T[i][r] = [x^r] prod(q_j + p_j x)
+    over links j >= i.  Each row of T is scaled to a max of 1, which leaves
+    these ratios unchanged and keeps deep tables from underflowing.
+
+    @return fail: (E, max_failures + 1) array; fail[i][r] is the probability
+        that link i fails, given r failures among links i onwards
+    '''
+    num_edges = len(probs)
+    tail = numpy.zeros(max_failures + 1)
+    tail[0] = 1.0
+    fail = numpy.zeros((num_edges, max_failures + 1))
+    for i in range(num_edges - 1, -1, -1):
+        p = probs[i]
+        row = tail * (1.0 - p)
+        row[1:] += tail[:-1] * p
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            fail[i, 1:] = numpy.where(row[1:] > 0, p * tail[:-1] / row[1:], 0.0)
+        tail = row / row.max()
+    return fail
+
+
+def draw_failure_sets(fail, failures, samples, rng):
+    '''Draw failure sets with exactly some # failed links.
+
+    Sets are drawn with their probabilities under the per-link Bernoulli
+    model, conditioned on the # failed links.
+
+    @param fail: table from conditional_fail_probs
+    @param failures: # failed links per set
+    @param samples: # sets to draw
+    @param rng: NumPy RandomState
+    @return failed: (samples, E) bool array
+    '''
+    num_edges = len(fail)
+    failed = numpy.zeros((samples, num_edges), dtype = bool)
+    remaining = numpy.empty(samples, dtype = numpy.intp)
+    remaining.fill(failures)
+    for i in range(num_edges):
+        failed[:, i] = rng.random_sample(samples) < fail[i, remaining]
+        remaining -= failed[:, i]
+    return failed
+
+
+class SampledAvailability(object):
+    '''Monte Carlo path survival for every pair, in packed bits.
+
+    Samples are stratified by # failed links.  With no failures every path
+    survives, so that stratum is exact; each other stratum up to
+    max_failures gets its own share of the samples, in proportion to the
+    square root of its probability, which samples rare multi-failure states
+    far more often than plain Bernoulli draws would.  Within a stratum,
+    failure sets are drawn with their conditional probabilities, so a
+    combo's estimate weights each stratum's mean connectivity by the
+    stratum's exact probability.
+
+    Bit i of row s * n + t of clear says whether the path from s to t
+    survived sample i, and strata[i] is the sample's # failed links.
+    Storage is about n^2 * samples / 8 bytes.
+    '''
+
+    def __init__(self, pm, probs, max_failures, samples = SAMPLES,
+                 seed = SEED):
+        '''
+        @param pm: PathMatrix
+        @param probs: failure probability of each edge in pm.edges
+        @param max_failures: max # simultaneous failures to consider
+        @param samples: # failure states to draw, in all
+        @param seed: seed for the random number generator
+        '''
+        n = len(pm.nodes)
+        max_failures = min(max_failures, len(probs))
+        self.stratum_probs = failure_polynomial(probs, max_failures)
+        shares = numpy.sqrt(self.stratum_probs[1:])
+        counts = numpy.zeros(max_failures + 1, dtype = numpy.intp)
+        if shares.sum() > 0:
+            counts[1:] = numpy.round(samples * shares / shares.sum())
+            counts[1:][shares > 0] = numpy.maximum(counts[1:][shares > 0],
+                                                   MIN_STRATUM_SAMPLES)
+        fail = conditional_fail_probs(probs, max_failures)
+        lengths = numpy.diff(pm.pair_offsets)
+        nonempty = numpy.nonzero(lengths)[0]
+        starts = pm.pair_offsets[nonempty]
+
+        rng = numpy.random.RandomState(seed)
+        strata = numpy.repeat(numpy.arange(max_failures + 1), counts)
+        # Multiple of 8 so that blocks pack into whole bytes.
+        block_size = max(MAX_MASK_TESTS / max(len(pm.pair_edges), 1) / 8, 1) * 8
+        clear_blocks = [numpy.zeros((n * n, 0), dtype = numpy.uint8)]
+        for start in range(0, len(strata), block_size):
+            block_strata = strata[start:start + block_size]
+            failed = numpy.zeros((len(block_strata), len(probs)), dtype = bool)
+            for failures in numpy.unique(block_strata):
+                rows = block_strata == failures
+                failed[rows] = draw_failure_sets(fail, failures, rows.sum(), rng)
+            hit = numpy.zeros((len(block_strata), n * n), dtype = bool)
+            if len(nonempty):
+                hit[:, nonempty] = numpy.logical_or.reduceat(
+                    failed[:, pm.pair_edges], starts, axis = 1)
+            clear_blocks.append(numpy.packbits(~hit.T, axis = 1))
+        self.n = n
+        self.counts = counts
+        self.strata = strata
+        self.samples = len(strata)
+        self.clear = numpy.concatenate(clear_blocks, axis = 1)
+
+    def interval(self, dm, combo_index):
+        '''Return estimated availability of a combo, with a 95% CI.
+
+        @param dm: DistMatrix, in the same node order
+        @param combo_index: int array of controller matrix indices
+        @return availability: estimate
+        @return half_width: half the width of the confidence interval
+        '''
+        srcs, dsts, shares = _closest_pairs(dm, combo_index)
+        bits = numpy.unpackbits(self.clear[srcs * self.n + dsts], axis = 1)
+        connectivity = numpy.dot(shares, bits[:, :self.samples]) / float(self.n)
+        strata = len(self.counts)
+        sums = numpy.bincount(self.strata, connectivity, strata)
+        squares = numpy.bincount(self.strata, connectivity ** 2, strata)
+        counts = self.counts.astype(float)
+        means = sums / numpy.maximum(counts, 1)
+        # No failed links: every switch stays connected.
+        means[0] = 1.0
+        # Unbiased variance of each stratum mean.
+        sample_vars = numpy.where(counts > 1, (squares - counts * means ** 2) /
+                                  numpy.maximum(counts - 1, 1), 0.0)
+        variance = (self.stratum_probs ** 2 * numpy.maximum(sample_vars, 0.0) /
+                    numpy.maximum(counts, 1)).sum()
+        availability = (self.stratum_probs * means).sum()
+        return availability, CONFIDENCE_Z * numpy.sqrt(variance)
+
+
+def combo_availability(dm, avail, combo_index):
+    '''Return availability of a combo from per-pair path availabilities.
+
+    Switches equally close to several controllers split their weight
+    equally, as in metrics_lib.connectivity_sssp.
+
+    @param dm: DistMatrix
+    @param avail: n x n pair availability, in dm order
+    @param combo_index: int array of controller matrix indices
+    '''
+    srcs, dsts, shares = _closest_pairs(dm, combo_index)
+    return (shares * avail[srcs, dsts]).sum() / float(len(dm.nodes))
+
+
+def batch_availability(dm, avail, combos):
+    '''Return availability of a block of combos from pair availabilities.
+
+    Batch version of combo_availability: gathers the (B, k, n) distances
+    and pair terms for every combo's controllers and reduces them at once.
+
+    @param dm: DistMatrix
+    @param avail: n x n pair availability, in dm order
+    @param combos: (B, k) NumPy int array of matrix indices
+    @return values: (B,) float array
+    '''
+    sub = dm.dist.T[combos]
+    ties = (sub == sub.min(axis = 1)[:, numpy.newaxis, :])
+    shares = ties / ties.sum(axis = 1)[:, numpy.newaxis, :].astype(float)
+    # avail.T[c][s] is the term for switch s and controller c.
+    return (shares * avail.T[combos]).sum(axis = 2).sum(axis = 1) / float(len(dm.nodes))
+
+
+class AvailabilityModel(object):
+    '''Pair availabilities for a graph and failure model.'''
+
+    def __init__(self, g, dm, apsp_paths, weighted, link_fail_prob,
+                 max_failures, mode = 'exact', samples = SAMPLES, seed = SEED):
+        '''
+        @param g: NetworkX graph
+        @param dm: DistMatrix
+        @param apsp_paths: all-pairs shortest paths path data, as a PathMatrix
+            in dm order or as NetworkX dicts
+        @param weighted: is graph weighted?
+        @param link_fail_prob: see link_fail_probs
+        @param max_failures: max # simultaneous failures to consider
+        @param mode: engine, in AVAILABILITY_MODES
+        @param samples: # failure states to draw, for the sample engine
+        @param seed: random seed, for the sample engine
+        '''
+        if isinstance(apsp_paths, PathMatrix):
+            pm = apsp_paths
+        else:
+            pm = path_matrix_from_paths(g, dm.nodes, apsp_paths)
+        states = get_failure_states(g, weighted, link_fail_prob, pm.edges)
+        self.dm = dm
+        self.probs = states.probs
+        self.coverage = coverage(self.probs, max_failures)
+        self.avail = None
+        self.sampled = None
+        self.state_major = None
+        self.last_combo = None
+        self.last_interval = None
+        if mode == 'exact':
+            self.avail = pair_availability(pm, self.probs, max_failures)
+        elif mode == 'enumerate':
+            self.avail = pair_availability_enumerated(pm, states, max_failures)
+        elif mode == 'sample':
+            self.sampled = SampledAvailability(pm, self.probs, max_failures,
+                                               samples, seed)
+        elif mode == 'state_major':
+            self.state_major = StateMajorAvailability(pm, states, max_failures)
+        else:
+            raise Exception("unknown availability mode: %s" % mode)
+
+    def interval(self, combo_index):
+        '''Return availability of a combo, with a 95% CI half-width.
+
+        The half-width is 0 for the exact engines.
+        '''
+        # The availability metrics each ask for the same combo in turn.
+        key = tuple(combo_index)
+        if key != self.last_combo:
+            if self.sampled:
+                self.last_interval = self.sampled.interval(self.dm, combo_index)
+            elif self.state_major:
+                values, half_widths = self.batch_intervals(
+                    numpy.asarray(combo_index)[numpy.newaxis])
+                self.last_interval = (values[0], 0.0)
+            else:
+                self.last_interval = (combo_availability(self.dm, self.avail,
+                                                         combo_index), 0.0)
+            self.last_combo = key
+        return self.last_interval
+
+    def availability(self, combo_index):
+        '''Return availability of a combo, as matrix indices.'''
+        return self.interval(combo_index)[0]
+
+    def batch_intervals(self, combos):
+        '''Return availabilities and CI half-widths for a block of combos.
+
+        @param combos: (B, k) NumPy int array of matrix indices
+        @return values: (B,) float array
+        @return half_widths: (B,) float array
+        '''
+        if self.sampled:
+            intervals = numpy.array([self.sampled.interval(self.dm, combo_index)
+                                     for combo_index in combos]).reshape(-1, 2)
+            return intervals[:, 0], intervals[:, 1]
+        if self.state_major:
+            return (self.state_major.availability(self.dm, combos),
+                    numpy.zeros(len(combos)))
+        return (batch_availability(self.dm, self.avail, combos),
+                numpy.zeros(len(combos)))
+
+
+# Single-entry cache of the last model, as for matrix_lib.get_dist_matrix.
+_cache = {'key': None, 'model': None}
+
+def get_availability_model(g, dm, apsp_paths, weighted, link_fail_prob,
+                           max_failures, mode = 'exact', samples = SAMPLES,
+                           seed = SEED):
+    '''Return the (cached) AvailabilityModel for a graph and failure model.'''
+    key = (g, dm, apsp_paths, weighted, link_fail_prob, max_failures, mode,
+           samples, seed)
+    cached = _cache['key']
+    if (cached is None or any(a is not b for a, b in zip(key[:3], cached[:3]))
+        or key[3:] != cached[3:]):
+        _cache['model'] = AvailabilityModel(g, dm, apsp_paths, weighted,
+            link_fail_prob, max_failures, mode, samples, seed)
+        _cache['key'] = key
+    return _cache['model']
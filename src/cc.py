@@ -9,11 +9,16 @@ and the algorithms for bootstrapping the switch-controller connection.
 '''
 import logging
 
-from lib.graph import flatten, loop_graph
+from availability_lib import FailureStates, conditional_fail_probs
+from availability_lib import draw_failure_sets, failure_polynomial
+from connectivity_lib import component_labels, edge_ends, single_failure_reach
+from itertools_recipes import choose
+from lib.graph import loop_graph
 from lib.list import compare_lists, permutations_len_total_diff
 from lib.list import permutations_total_diff
 
 import networkx as nx
+import numpy
 
 lg = logging.getLogger("cc")
 
@@ -21,48 +26,69 @@ lg = logging.getLogger("cc")
 # value for single-failure cases.
 VALIDATE_SINGLE = True
 
+# Max failure states to enumerate for any # failures; larger #s are sampled.
+MAX_ENUMERATED_STATES = 100000
+
+# Defaults for sampled failure states.
+SAMPLES = 10000
+SEED = 0
+
+# Failure states evaluated at once.
+STATE_BLOCK_SIZE = 1024
+
+
+def sssp_tree(g, controller_node):
+    '''Return the SSSP tree from a controller, with subtree sizes.
+
+    Paths from nx.single_source_shortest_path share prefixes, so together
+    they form a tree, and a link on the path of some switch is on exactly
+    the paths of the switches in the subtree below it.
+
+    @param g: input graph
+    @param controller_node: root of the tree
+    @return order: list of nodes, each after its parent
+    @return parent: dict of node to its parent in the tree; None for the root
+    @return sizes: dict of node to # nodes in its subtree, itself included
+    '''
+    paths = nx.single_source_shortest_path(g, controller_node)
+    order = sorted(paths, key = lambda node: len(paths[node]))
+    parent = {}
+    for node in order:
+        path = paths[node]
+        parent[node] = path[-2] if len(path) > 1 else None
+    # Children come after parents, so one reverse pass sums subtrees.
+    sizes = dict((node, 1) for node in order)
+    for node in reversed(order):
+        if parent[node] is not None:
+            sizes[parent[node]] += sizes[node]
+    return order, parent, sizes
+
 
 def sssp_conn_single(g, controller_node, link_fail_prob):
     # Store pairs of (probability, connectivity)
     uptime_dist = []
 
-    # Compute SSSP.
-    # Need a list of nodes from each switch to the controller to see how
-    # connectivity changes when links go down.
-    paths = nx.single_source_shortest_path(g, controller_node)
-    # Store the flattened set of shortest paths to the controller as a
-    # graph.  Useful later to only consider those nodes or edges that might
-    # have an effect on reliability.
-    used = flatten(paths)
+    # Compute the SSSP tree once.  A failed link only disconnects switches
+    # if it is a tree link, and then exactly the subtree below it.
+    order, parent, sizes = sssp_tree(g, controller_node)
+    nodes = g.number_of_nodes()
 
     for failed_edge in g.edges():
         lg.debug("------------------------")
         lg.debug("considering failed edge: %s" % str(failed_edge))
 
-        # If failed edge is not a part of the path set, then no effect on
-        # reliability.
-        if used.has_edge(failed_edge[0], failed_edge[1]):
-            # Failed edge matters for connectivity for some switch.
-
-            # Check switch-to-controller connectivity.
-            connected = 0
-            disconnected = 0
-            for sw in g.nodes():
-                path_graph = nx.Graph()
-                path_graph.add_path(paths[sw])
-                #lg.debug("path graph edges: %s" % path_graph.edges())
-                if path_graph.has_edge(failed_edge[0], failed_edge[1]):
-                    lg.debug("disconnected sw: %s" % sw)
-                    disconnected += 1
-                else:
-                    lg.debug("connected sw: %s" % sw)
-                    connected += 1
-            connectivity = float(connected) / g.number_of_nodes()
-            uptime_dist.append((link_fail_prob, connectivity))
+        src, dst = failed_edge
+        if parent.get(dst) == src:
+            disconnected = sizes[dst]
+        elif parent.get(src) == dst:
+            disconnected = sizes[src]
         else:
             # No effect on connectivity.
             lg.debug("edge not in sssp graph; ignoring")
-            uptime_dist.append((link_fail_prob, 1.0))
+            disconnected = 0
+        # Switches outside the tree never reach the controller.
+        connectivity = float(len(order) - disconnected) / nodes
+        uptime_dist.append((link_fail_prob, connectivity))
 
     return uptime_dist
 
@@ -71,18 +97,16 @@ def any_conn(g, controller_node, link_fail_prob):
     # Store pairs of (probability, connectivity)
     uptime_dist = []
 
-    for failed_edge in g.edges():
+    # Only bridges change connectivity when they fail alone, and each one
+    # cuts off a DFS subtree, so no residual graph is ever built.
+    nodes = g.nodes()
+    reach = single_failure_reach(nodes, g.edges(), controller_node)
+    for failed_edge, reachable in zip(g.edges(), reach):
         lg.debug("------------------------")
         lg.debug("considering failed edge: %s" % str(failed_edge))
 
         # Check switch-to-controller connectivity.
-        gcopy = g.copy()
-        gcopy.remove_edge(failed_edge[0], failed_edge[1])
-        reachable = nx.dfs_tree(gcopy, controller_node).nodes()
-        if controller_node not in reachable:
-            reachable += [controller_node]
-        nodes = g.number_of_nodes()
-        connectivity = float(len(reachable)) / nodes
+        connectivity = float(reachable) / len(nodes)
         uptime_dist.append((link_fail_prob, connectivity))
 
     return uptime_dist
@@ -136,27 +160,195 @@ def availability_single(g, link_fail_prob, node_fail_prob, alg_fcn):
     return avg_conn, connectivity_data
 
 
-def availability_multiple(g, link_fail_prob, node_fail_prob, max_failures, alg_fcn):
+def sssp_state_conn(g, nodes, edges, node_failures):
+    '''Return a function giving SSSP connectivity in blocks of failure states.
+
+    The SSSP tree of every controller is computed once: a switch stays
+    connected iff no link or node on its path to the controller failed,
+    itself and the controller included, so whether it is cut off follows
+    from its parent's in one pass down the tree.  Every state reuses the
+    trees.
+
+    @param g: input graph
+    @param nodes: list of nodes, in controller and switch order
+    @param edges: list of edges
+    @param node_failures: can nodes fail too?
+    @return conn: function of an (F, M) bool array of failed elements, the
+        edges and then, with node_failures, the nodes, returning the (F, n)
+        connectivity with a controller at each node
+    '''
+    n = len(nodes)
+    index = dict((node, i) for i, node in enumerate(nodes))
+    edge_index = {}
+    for i, (src, dst) in enumerate(edges):
+        edge_index[(src, dst)] = i
+        edge_index[(dst, src)] = i
+    # Per controller: (node, parent, parent link) ids, each after its parent.
+    trees = []
+    for controller_node in nodes:
+        order, parent, sizes = sssp_tree(g, controller_node)
+        trees.append([(index[node], index[parent[node]],
+                       edge_index[(parent[node], node)])
+                      for node in order[1:]])
+
+    def conn(failed):
+        failed = failed.T
+        conns = numpy.empty((failed.shape[1], n))
+        for c, tree in enumerate(trees):
+            # cut[i][j]: is node i cut off from the controller in state j?
+            # Switches outside the tree stay cut off.
+            cut = numpy.ones((n, failed.shape[1]), dtype = bool)
+            cut[c] = failed[len(edges) + c] if node_failures else False
+            for node, parent, edge in tree:
+                cut[node] = cut[parent] | failed[edge]
+                if node_failures:
+                    cut[node] |= failed[len(edges) + node]
+            conns[:, c] = 1.0 - cut.mean(axis = 0)
+        return conns
+    return conn
+
+
+def any_state_conn(g, nodes, edges, node_failures):
+    '''Return a function giving any-path connectivity in blocks of states.
+
+    A switch stays connected iff it is up and in the controller's component
+    of the surviving graph; components come from union-find, once per
+    state for all controllers.
+
+    @param g: input graph
+    @param nodes: list of nodes, in controller and switch order
+    @param edges: list of edges
+    @param node_failures: can nodes fail too?
+    @return conn: function of an (F, M) bool array of failed elements, as
+        for sssp_state_conn, returning the (F, n) connectivity
+    '''
+    n = len(nodes)
+    ends = edge_ends(nodes, edges)
+    # Edges to drop when each node fails.
+    incident = [numpy.nonzero((ends == i).any(axis = 1))[0] for i in range(n)]
+
+    def conn(failed):
+        conns = numpy.zeros((len(failed), n))
+        for state, failed_elements in enumerate(failed):
+            down = numpy.zeros(n, dtype = bool)
+            if node_failures:
+                down = failed_elements[len(edges):]
+            failed_edges = set(numpy.nonzero(failed_elements[:len(edges)])[0])
+            for i in numpy.nonzero(down)[0]:
+                failed_edges.update(incident[i])
+            labels, components = component_labels(n, ends, failed_edges)
+            labels = numpy.array(labels)
+            sizes = numpy.bincount(labels[~down], minlength = n)
+            conns[state] = numpy.where(down, 0.0, sizes[labels] / float(n))
+        return conns
+    return conn
+
+
+def failure_state_blocks(probs, max_failures, samples, seed):
+    '''Yield blocks of failure states with 1 to max_failures failed elements.
+
+    Each # failed elements is enumerated if it has at most
+    MAX_ENUMERATED_STATES states, and otherwise sampled, with the sets drawn
+    from their conditional probabilities and each weighted by an equal share
+    of the exact probability of that # failures.
+
+    @param probs: failure probability of each element
+    @param max_failures: max # simultaneous failures to consider
+    @param samples: # sets to draw, for each sampled # failures
+    @param seed: seed for the random number generator
+    @return iterator of (failed, weights): (F, M) bool array of failed
+        elements and (F,) array of state probabilities
+    '''
+    num_elements = len(probs)
+    max_failures = min(max_failures, num_elements)
+    states = FailureStates(range(num_elements), probs)
+    stratum_probs = failure_polynomial(probs, max_failures)
+    fail = conditional_fail_probs(probs, max_failures)
+    rng = numpy.random.RandomState(seed)
+    rows = numpy.arange(STATE_BLOCK_SIZE)
+    for failures in range(1, max_failures + 1):
+        if choose(num_elements, failures) <= MAX_ENUMERATED_STATES:
+            failed_ids, state_probs = states.level(failures)
+            for start in range(0, len(failed_ids), STATE_BLOCK_SIZE):
+                block = failed_ids[start:start + STATE_BLOCK_SIZE]
+                failed = numpy.zeros((len(block), num_elements), dtype = bool)
+                for column in block.T:
+                    failed[rows[:len(block)], column] = True
+                yield failed, state_probs[start:start + STATE_BLOCK_SIZE]
+        else:
+            for start in range(0, samples, STATE_BLOCK_SIZE):
+                count = min(STATE_BLOCK_SIZE, samples - start)
+                failed = draw_failure_sets(fail, failures, count, rng)
+                weights = numpy.empty(count)
+                weights.fill(stratum_probs[failures] / samples)
+                yield failed, weights
+
+
+# Multi-failure connectivity for each static controller connection algorithm.
+STATE_CONN_FCNS = {
+    sssp_conn_single: sssp_state_conn,
+    any_conn: any_state_conn
+}
+
+
+def availability_multiple(g, link_fail_prob, node_fail_prob, max_failures,
+                          alg_fcn, samples = SAMPLES, seed = SEED):
     '''Compute connectivity assuming independent failures for _multiple_ failures.
 
+    Links and nodes fail independently.  Each failure state with 1 to
+    max_failures failed elements costs its probability times the fraction
+    of switches it disconnects; as in availability_single, states with more
+    failures are not considered and count as fully connected.  Failure
+    states are shared by every controller location, and the alg_fcn's
+    per-controller path structures by every failure state.
+
     @param g: input graph as NetworkX Graph
     @param link_fail_prob: link failure probability
     @param node_fail_prob: node failure probability
-    @param alg_fcn: function for static controller connection algorithm, with form:
+    @param max_failures: max # simultaneous failures to consider
+    @param alg_fcn: function for static controller connection algorithm, in
+        STATE_CONN_FCNS, with form:
         @param g: input graph
         @param controller_node: input controller node
         @param link_fail_prob: link failure probability
         @return uptime_dist: list of pairs of form (link_fail_prob, connectivity)
+    @param samples: # states to draw for each # failures too large to
+        enumerate
+    @param seed: random seed for sampled states
 
     @return avg_conn: distribution of switch-to-controller connectivity
     @return connectivity_data: dict of uptimes for each controller location
     '''
-    return availability_single(g, link_fail_prob, node_fail_prob, alg_fcn)
+    if alg_fcn not in STATE_CONN_FCNS:
+        raise Exception("no multiple-failure support for %s" % alg_fcn.__name__)
+
+    nodes = g.nodes()
+    edges = g.edges()
+    node_failures = node_fail_prob != 0
+    probs = [link_fail_prob] * len(edges)
+    if node_failures:
+        probs += [node_fail_prob] * len(nodes)
+    conn = STATE_CONN_FCNS[alg_fcn](g, nodes, edges, node_failures)
+
+    # Probability-weighted fraction of switches disconnected, per controller.
+    downtime = numpy.zeros(len(nodes))
+    for failed, weights in failure_state_blocks(numpy.array(probs, dtype = float),
+                                                max_failures, samples, seed):
+        downtime += numpy.dot(weights, 1.0 - conn(failed))
+
+    connectivity_data = dict(zip(nodes, 1.0 - downtime))
+    avg_conn = sum(connectivity_data.values()) / len(connectivity_data.keys())
+    lg.debug("average connectivity: %f" % avg_conn)
+    return avg_conn, connectivity_data
 
 
 def availability(g, link_fail_prob, node_fail_prob, max_failures, alg_fcn):
     '''Compute connectivity assuming independent failures.
 
+    Single link failures with rare failures use availability_single, which
+    weights each failure by link_fail_prob itself; anything else uses the
+    exact failure model of availability_multiple.
+
     @param g: input graph as NetworkX Graph
     @param link_fail_prob: link failure probability
     @param node_fail_prob: node failure probability
@@ -170,23 +362,20 @@ def availability(g, link_fail_prob, node_fail_prob, max_failures, alg_fcn):
     @return avg_conn: distribution of switch-to-controller connectivity
     @return connectivity_data: dict of uptimes for each controller location
     '''
-    if node_fail_prob != 0:
-        raise Exception("only link failures supported")
-
-    if link_fail_prob * g.number_of_nodes() > 1.0:
-        raise Exception("unable to handle case where > 1 failure is typical")
-
     if type(alg_fcn) is str:
         raise Exception("alg_fcn cannot be a string")
 
-    # Consider one failure only, for now.  Eventually extend to handle
-    # multiple failures by pushing all combinations as lists onto a stack
-    # and considering the effect of each one.
-    if max_failures == 1:
+    if (max_failures == 1 and node_fail_prob == 0 and
+        link_fail_prob * g.number_of_nodes() <= 1.0):
+        single_results = availability_single(g, link_fail_prob, node_fail_prob, alg_fcn)
         if VALIDATE_SINGLE:
-            single_results = availability_single(g, link_fail_prob, node_fail_prob, alg_fcn)
             multiple_results = availability_multiple(g, link_fail_prob, node_fail_prob, max_failures, alg_fcn)
-            assert abs(single_results[0] - multiple_results[0]) < 0.0000001
+            # Exact single-failure probabilities are link_fail_prob times the
+            # chance that every other link is up, so the two only agree
+            # within the total difference in weights.
+            edges = g.number_of_edges()
+            bound = edges * link_fail_prob * (1.0 - (1.0 - link_fail_prob) ** (edges - 1))
+            assert abs(single_results[0] - multiple_results[0]) <= bound + 0.0000001
         return single_results
     else:
         return availability_multiple(g, link_fail_prob, node_fail_prob, max_failures, alg_fcn)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+'''Checkpoints for resuming long combination sweeps.
+
+A checkpoint directory holds:
+    options.json: the options the checkpointed data was computed with
+    k<group>.json: data for a completed group, in the same schema as the
+        group's entry in the metrics output
+    k<group>_<lo>.pickle: partial aggregates for combos of a group with
+        ranks in [lo, next), saved periodically by whoever evaluates them
+
+Aggregates include quantile sketches, so ranges are pickled rather than
+written as JSON.  A range record can seed any later task starting at the
+same rank, however the work is split up on resume.
+'''
+
+import cPickle
+import glob
+import json
+import os
+import shutil
+
+
+CHECKPOINT_INTERVAL = 300  # Seconds between range checkpoints
+
+
+def _replace(filename, write):
+    '''Write a file via a temporary one, so a kill never leaves it partial.'''
+    tmp_filename = filename + '.tmp'
+    write(tmp_filename)
+    os.rename(tmp_filename, filename)
+
+
+def init_checkpoint(dirname, options, resume = False):
+    '''Prepare a checkpoint directory and return completed groups.
+
+    @param dirname: checkpoint directory
+    @param options: dict of options that must match to resume
+    @param resume: keep an earlier checkpoint, rather than starting over?
+    @return groups: dict of group data by unicode group
+    '''
+    filename = os.path.join(dirname, 'options.json')
+    if resume and os.path.exists(filename):
+        saved_options = json.load(open(filename, 'r'))
+        if saved_options != options:
+            raise Exception("checkpoint in %s was written with different "
+                            "options: %s" % (dirname, saved_options))
+        groups = {}
+        for group_filename in glob.glob(os.path.join(dirname, 'k*.json')):
+            group = os.path.basename(group_filename)[1:-len('.json')]
+            groups[group] = json.load(open(group_filename, 'r'))
+        return groups
+    shutil.rmtree(dirname, ignore_errors = True)
+    os.makedirs(dirname)
+    _replace(filename, lambda tmp_filename: _write_json(tmp_filename, options))
+    return {}
+
+
+def _write_json(filename, data):
+    json.dump(data, open(filename, 'w'))
+
+
+def save_group(dirname, group, group_data):
+    '''Save data for a completed group.'''
+    _replace(os.path.join(dirname, 'k%s.json' % group),
+             lambda filename: _write_json(filename, group_data))
+
+
+def _range_filename(dirname, group, lo):
+    return os.path.join(dirname, 'k%s_%012d.pickle' % (group, lo))
+
+
+def save_range(dirname, group, lo, next_rank, metric_data, distribution):
+    '''Save aggregates for the combos with ranks in [lo, next_rank).'''
+    record = {
+        'next': next_rank,
+        'metric_data': metric_data,
+        'distribution': distribution
+    }
+    def write(filename):
+        cPickle.dump(record, open(filename, 'wb'), cPickle.HIGHEST_PROTOCOL)
+    _replace(_range_filename(dirname, group, lo), write)
+
+
+def load_range(dirname, group, lo, hi):
+    '''Return saved aggregates for a task over ranks [lo, hi).
+
+    @return record: dict with next, metric_data and distribution keys, for
+        ranks [lo, next); None if no saved range fits in [lo, hi).
+    '''
+    filename = _range_filename(dirname, group, lo)
+    if not os.path.exists(filename):
+        return None
+    record = cPickle.load(open(filename, 'rb'))
+    if record['next'] > hi:
+        return None
+    return record
+
+
+def clear_ranges(dirname, group):
+    '''Drop the range records for a completed group.'''
+    for filename in glob.glob(os.path.join(dirname, 'k%s_*.pickle' % group)):
+        os.remove(filename)
+
+
+def remove_checkpoint(dirname):
+    shutil.rmtree(dirname, ignore_errors = True)
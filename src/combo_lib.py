@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+'''Helpers for enumerating controller combinations as NumPy index arrays.'''
+
+import numpy
+
+from itertools_recipes import choose
+
+BLOCK_SIZE = 1024  # Combos per block
+
+
+def combo_rank(combo, n):
+    '''Return the lexicographic rank of a combination of range(n).
+
+    Uses the combinatorial number system: mapping each element c to
+    n - 1 - c turns lexicographic order into reverse colexicographic order,
+    where the rank of a decreasing sequence d_1 > ... > d_k is
+    sum(C(d_i, k - i + 1)).
+
+    @param combo: sorted sequence of node indices
+    @param n: number of nodes
+    @return rank: int in [0, C(n, k))
+    '''
+    k = len(combo)
+    colex = sum(choose(n - 1 - c, k - i) for i, c in enumerate(combo))
+    return choose(n, k) - 1 - colex
+
+
+def combo_unrank(rank, n, combo_size):
+    '''Return the combination of range(n) with a lexicographic rank.
+
+    Inverse of combo_rank.
+
+    @return combo: sorted tuple of node indices
+    '''
+    colex = choose(n, combo_size) - 1 - rank
+    combo = []
+    d = n - 1
+    for j in range(combo_size, 0, -1):
+        # Largest d with C(d, j) <= colex.
+        while choose(d, j) > colex:
+            d -= 1
+        colex -= choose(d, j)
+        combo.append(n - 1 - d)
+        d -= 1
+    return tuple(combo)
+
+
+# Cache of binomial tables for combo_unrank_array, keyed by (n, k).
+_binomials = {}
+
+def combo_unrank_array(ranks, n, combo_size):
+    '''Vectorized combo_unrank for an array of ranks.
+
+    @param ranks: (B,) int array of lexicographic ranks
+    @return combos: (B, combo_size) NumPy int array
+    '''
+    if choose(n, combo_size) > numpy.iinfo(numpy.int64).max:
+        raise Exception("too many combinations to rank in 64 bits")
+    key = (n, combo_size)
+    if key not in _binomials:
+        # Row j holds C(d, j) for d in range(n): nondecreasing in d.
+        _binomials[key] = numpy.array([[choose(d, j) for d in range(n)]
+                                       for j in range(combo_size + 1)],
+                                      dtype = numpy.int64)
+    table = _binomials[key]
+    colex = choose(n, combo_size) - 1 - numpy.asarray(ranks, dtype = numpy.int64)
+    combos = numpy.empty((len(colex), combo_size), dtype = numpy.intp)
+    for i, j in enumerate(range(combo_size, 0, -1)):
+        d = table[j].searchsorted(colex, 'right') - 1
+        colex -= table[j][d]
+        combos[:, i] = n - 1 - d
+    return combos
+
+
+def random_combos(n, combo_size, samples, random):
+    '''Return random combinations of range(n), drawn all at once.
+
+    Each row is uniform over the combinations: the indices of the
+    combo_size smallest of n uniform keys.  Rows are independent, so they
+    may repeat.
+
+    @param n: number of nodes
+    @param combo_size: number of nodes in each combination
+    @param samples: number of combinations
+    @param random: numpy.random.RandomState to draw from
+    @return combos: (samples, combo_size) NumPy int array, rows sorted
+    '''
+    keys = random.random_sample((samples, n))
+    combos = keys.argpartition(combo_size - 1, axis = 1)[:, :combo_size]
+    combos.sort(axis = 1)
+    return combos
+
+
+def combo_blocks(n, combo_size, block_size = BLOCK_SIZE, lo = 0, hi = None):
+    '''Yield blocks of combinations of node indices, in lexicographic order.
+
+    Each block is unranked directly, so enumeration can start at any rank:
+    workers can split the combos into contiguous ranges without walking the
+    others.
+
+    @param n: number of nodes
+    @param combo_size: number of nodes in each combination
+    @param block_size: max combinations per block
+    @param lo: first lexicographic rank to include
+    @param hi: one past the last rank to include; all if None
+    @return blocks: iterator of (B, combo_size) NumPy int arrays
+    '''
+    if hi is None:
+        hi = choose(n, combo_size)
+    for start in xrange(lo, hi, block_size):
+        yield combo_unrank_array(numpy.arange(start, min(start + block_size, hi)),
+                                 n, combo_size)
+
+
+def revolving_door(n, combo_size):
+    '''Yield all combinations of range(n) in revolving-door order.
+
+    Consecutive combinations differ by exactly one element swapped out and one
+    swapped in, so per-combo state can be updated rather than recomputed.
+    See Kreher & Stinson, Combinatorial Algorithms, Algorithm 2.14.
+
+    @param n: number of nodes
+    @param combo_size: number of nodes in each combination
+    @return combos: iterator of (combo, removed, added), where combo is a
+        sorted tuple of node indices and removed/added are the indices
+        swapped relative to the previous combo (None for the first one).
+    '''
+    k = combo_size
+    # 1-indexed: t[0] is unused and t[k + 1] is a sentinel.
+    t = [0] + range(1, k + 1) + [n + 1]
+    yield tuple(i - 1 for i in t[1:k + 1]), None, None
+    for rank in xrange(1, choose(n, k)):
+        j = 1
+        while j <= k and t[j] == j:
+            j += 1
+        positions = [p for p in range(j - 2, j + 2) if 1 <= p <= k]
+        before = set(t[p] for p in positions)
+        if (k - j) % 2 != 0:
+            if j == 1:
+                t[1] -= 1
+            else:
+                t[j - 1] = j
+                if j > 2:
+                    t[j - 2] = j - 1
+        else:
+            if t[j + 1] != t[j] + 1:
+                t[j - 1] = t[j]
+                t[j] += 1
+            else:
+                t[j + 1] = t[j]
+                t[j] = j
+        after = set(t[p] for p in positions)
+        removed = (before - after).pop()
+        added = (after - before).pop()
+        yield tuple(i - 1 for i in t[1:k + 1]), removed - 1, added - 1
+
+
+# Cache of revolving-door sequences as arrays, keyed by (n, k, reverse).
+_tails = {}
+
+def revolving_door_array(n, combo_size, reverse = False):
+    '''Return the revolving_door sequence as a (C(n, k), k) NumPy array.'''
+    key = (n, combo_size, reverse)
+    if key not in _tails:
+        tail = numpy.array([combo for combo, removed, added in
+                            revolving_door(n, combo_size)], dtype = numpy.intp)
+        if reverse:
+            tail = tail[::-1]
+        _tails[key] = tail.reshape(-1, combo_size)
+    return _tails[key]
+
+
+def _revolving_door_runs(n, k, depth, reverse, fixed, lo, hi):
+    '''Yield runs of R(n, k), or of its reverse, with ranks in [lo, hi).
+
+    Uses the recursive definition R(n, k) = R(n - 1, k), then R(n - 1, k - 1)
+    reversed with n - 1 added to each combo, down to R(n, depth).  Every
+    element of fixed is larger than any element of R(n, k).
+    '''
+    if k == depth:
+        yield fixed, revolving_door_array(n, depth, reverse)[lo:hi]
+        return
+    if k == n:
+        yield fixed + tuple(range(depth, n)), revolving_door_array(depth, depth)[lo:hi]
+        return
+    if not reverse:
+        parts = [(k, False, fixed), (k - 1, True, fixed + (n - 1,))]
+    else:
+        parts = [(k - 1, False, fixed + (n - 1,)), (k, True, fixed)]
+    offset = 0
+    for part_k, part_reverse, part_fixed in parts:
+        size = choose(n - 1, part_k)
+        if lo < offset + size and hi > offset:
+            for run in _revolving_door_runs(n - 1, part_k, depth, part_reverse,
+                                            part_fixed, max(lo - offset, 0),
+                                            min(hi - offset, size)):
+                yield run
+        offset += size
+
+
+def revolving_door_runs(n, combo_size, lo = 0, hi = None, depth = 2):
+    '''Yield the revolving_door sequence as runs of combos sharing k - depth nodes.
+
+    Within a run only the last depth elements vary, and consecutive runs
+    differ by swapping elements of the shared set, so a run can be evaluated
+    in one vectorized step from the running state of its shared set.
+
+    @param n: number of nodes
+    @param combo_size: number of nodes in each combination
+    @param lo: first revolving-door rank to include
+    @param hi: one past the last rank to include; all if None
+    @param depth: max number of varying elements per run
+    @return runs: iterator of (fixed, tail), where fixed is a tuple of shared
+        node indices and tail is an (m, combo_size - len(fixed)) NumPy array;
+        the run's combos are fixed plus each row of tail, in order.
+    '''
+    if hi is None:
+        hi = choose(n, combo_size)
+    if lo >= hi:
+        return
+    depth = min(depth, combo_size)
+    for run in _revolving_door_runs(n, combo_size, depth, False, (), lo, hi):
+        yield run
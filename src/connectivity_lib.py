@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+'''Switch-to-controller connectivity over any surviving path.
+
+With any-path connectivity, a switch reaches a controller in a failure state
+iff some path to it survives, so only the connected components of the
+residual graph matter, never the graph itself.  Nothing here copies the
+graph:
+    single failures: an edge's failure splits its component iff it is a
+        bridge, and then cuts off exactly the subtree below it in a DFS
+        tree, so one DFS (Tarjan's low-link) covers every single failure.
+        All other edges lie inside 2-edge-connected components and change
+        nothing.
+    multiple failures: components come from union-find over the surviving
+        edges of each failure state.
+Component labels of each state depend only on the graph, so they are found
+once and every combo is then checked against them.  States that leave the
+components of the intact graph unchanged collapse into one probability mass.
+'''
+
+import numpy
+
+from availability_lib import get_failure_states
+
+
+def edge_ends(nodes, edges):
+    '''Return edges as (E, 2) int array of indices into nodes.'''
+    index = dict((node, i) for i, node in enumerate(nodes))
+    ends = numpy.zeros((len(edges), 2), dtype = numpy.intp)
+    for e, (src, dst) in enumerate(edges):
+        ends[e] = index[src], index[dst]
+    return ends
+
+
+def component_labels(n, ends, failed = ()):
+    '''Return connected component labels, by union-find over surviving edges.
+
+    @param n: # nodes
+    @param ends: (E, 2) int array of edge endpoints
+    @param failed: ids of failed edges
+    @return labels: list; labels[i] is the root node of i's component
+    @return components: # components
+    '''
+    parent = range(n)
+    components = n
+    failed = set(failed)
+    for e, (src, dst) in enumerate(ends.tolist()):
+        if e in failed:
+            continue
+        # Find roots, halving paths along the way.
+        while parent[src] != src:
+            parent[src] = parent[parent[src]]
+            src = parent[src]
+        while parent[dst] != dst:
+            parent[dst] = parent[parent[dst]]
+            dst = parent[dst]
+        if src != dst:
+            parent[src] = dst
+            components -= 1
+    labels = []
+    for i in range(n):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        labels.append(root)
+    return labels, components
+
+
+def bridges(n, ends):
+    '''Return the bridges of a graph, with the nodes each one cuts off.
+
+    Iterative DFS with Tarjan's low-link values: tree edge (u, v) is a
+    bridge iff nothing in v's subtree has a back edge above v, and then its
+    failure cuts off exactly that subtree.
+
+    @param n: # nodes
+    @param ends: (E, 2) int array of edge endpoints
+    @return cut_off: dict of bridge edge id to int array of the node indices
+        on the far side of it from its DFS root
+    '''
+    adj = [[] for i in range(n)]
+    for e, (src, dst) in enumerate(ends.tolist()):
+        adj[src].append((dst, e))
+        adj[dst].append((src, e))
+    order = [-1] * n  # DFS preorder number
+    low = [0] * n
+    size = [1] * n  # Subtree sizes
+    parent_edge = [-1] * n
+    preorder = []
+    bridge_roots = {}  # Bridge edge id to the node below it
+    for root in range(n):
+        if order[root] >= 0:
+            continue
+        order[root] = low[root] = len(preorder)
+        preorder.append(root)
+        stack = [(root, iter(adj[root]))]
+        while stack:
+            u, neighbors = stack[-1]
+            for v, e in neighbors:
+                if e == parent_edge[u]:
+                    continue
+                if order[v] < 0:
+                    order[v] = low[v] = len(preorder)
+                    preorder.append(v)
+                    parent_edge[v] = e
+                    stack.append((v, iter(adj[v])))
+                    break
+                low[u] = min(low[u], order[v])
+            else:
+                stack.pop()
+                if stack:
+                    p = stack[-1][0]
+                    low[p] = min(low[p], low[u])
+                    size[p] += size[u]
+                    if low[u] > order[p]:
+                        bridge_roots[parent_edge[u]] = u
+    # A subtree is a contiguous run of the preorder.
+    preorder = numpy.array(preorder, dtype = numpy.intp)
+    return dict((e, preorder[order[u]:order[u] + size[u]])
+                for e, u in bridge_roots.iteritems())
+
+
+def single_failure_reach(nodes, edges, controller):
+    '''Return the # nodes that reach a controller as each edge fails alone.
+
+    @param nodes: list of nodes
+    @param edges: list of (src, dst) node pairs
+    @param controller: controller node
+    @return reach: list of # nodes, one per edge, counting the controller
+    '''
+    n = len(nodes)
+    ends = edge_ends(nodes, edges)
+    labels, components = component_labels(n, ends)
+    labels = numpy.array(labels)
+    c = list(nodes).index(controller)
+    component = labels == labels[c]
+    reach = [component.sum()] * len(edges)
+    for e, cut_off in bridges(n, ends).iteritems():
+        if labels[cut_off[0]] != labels[c]:
+            continue
+        if c in cut_off:
+            reach[e] = len(cut_off)
+        else:
+            reach[e] -= len(cut_off)
+    return reach
+
+
+class AnyPathAvailability(object):
+    '''Any-path availability of combos, for a graph and failure model.
+
+    Keeps the component labels of each failure state that splits a component
+    of the intact graph, as rows of labels, plus the total probability of
+    the states that do not.
+    '''
+
+    def __init__(self, g, nodes, weighted, link_fail_prob, max_failures):
+        '''
+        @param g: NetworkX graph
+        @param nodes: node order for combo indices, such as DistMatrix.nodes
+        @param weighted: is graph weighted?
+        @param link_fail_prob: see availability_lib.link_fail_probs
+        @param max_failures: max # simultaneous failures to consider
+        '''
+        states = get_failure_states(g, weighted, link_fail_prob)
+        n = len(nodes)
+        ends = edge_ends(nodes, states.edges)
+        base, base_components = component_labels(n, ends)
+        self.base = numpy.array(base, dtype = numpy.intp)
+        self.unsplit_prob = 0.0
+        labels = []
+        split_probs = []
+        for failures in range(min(max_failures, len(states.edges)) + 1):
+            failed, state_probs = states.level(failures)
+            if failures == 0:
+                self.unsplit_prob += state_probs.sum()
+            elif failures == 1:
+                cut_off = bridges(n, ends)
+                for (e,), state_prob in zip(failed, state_probs):
+                    if e not in cut_off:
+                        self.unsplit_prob += state_prob
+                        continue
+                    # Node labels are < n, so n is new.
+                    split = self.base.copy()
+                    split[cut_off[e]] = n
+                    labels.append(split)
+                    split_probs.append(state_prob)
+            else:
+                for failed_ids, state_prob in zip(failed.tolist(), state_probs):
+                    split, components = component_labels(n, ends, failed_ids)
+                    # Failures only refine components, so equal counts
+                    # means equal components.
+                    if components == base_components:
+                        self.unsplit_prob += state_prob
+                    else:
+                        labels.append(split)
+                        split_probs.append(state_prob)
+        self.n = n
+        self.labels = numpy.array(labels, dtype = numpy.intp).reshape(-1, n)
+        self.split_probs = numpy.array(split_probs)
+
+    def availability(self, combo_index):
+        '''Return any-path availability of a combo, as matrix indices.'''
+        combo_index = numpy.asarray(combo_index)
+        reached = numpy.in1d(self.base, self.base[combo_index]).mean()
+        availability = self.unsplit_prob * reached
+        if len(self.labels):
+            # (states, nodes, controllers) label matches.
+            controller_labels = self.labels[:, combo_index]
+            reached = (self.labels[:, :, numpy.newaxis] ==
+                       controller_labels[:, numpy.newaxis, :]).any(axis = 2)
+            availability += numpy.dot(self.split_probs, reached.mean(axis = 1))
+        return availability
+
+
+# Single-entry cache of the last model, as for get_availability_model.
+_cache = {'key': None, 'model': None}
+
+def get_any_path_availability(g, nodes, weighted, link_fail_prob, max_failures):
+    '''Return the (cached) AnyPathAvailability for a graph and failure model.'''
+    key = (g, nodes, weighted, link_fail_prob, max_failures)
+    cached = _cache['key']
+    if (cached is None or cached[0] is not g or cached[1] is not nodes or
+        cached[2:] != key[2:]):
+        _cache['model'] = AnyPathAvailability(g, nodes, weighted,
+                                              link_fail_prob, max_failures)
+        _cache['key'] = key
+    return _cache['model']
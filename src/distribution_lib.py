@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+'''Columnar storage for the per-combo distribution.
+
+The JSON distribution holds one dict per combo, so for large topologies it
+fills memory before it is ever written.  Here each value is instead a row in
+a set of NPY column files, one per metric, plus the point ids and the combos
+as arrays of node indices.  Workers append rows as they go, in chunks named
+by their first point id, and the chunks are merged into one file per column
+after each group; readers then memory-map the columns.
+
+Layout of a distribution directory:
+    nodes.json: node names, in the order used by the combo column
+    k<group>_id.npy: (N,) int64 point ids
+    k<group>_combo.npy: (N, group) int32 node indices, with write_combos
+    k<group>_<metric>.npy: (N,) float64 values
+'''
+
+import glob
+import json
+import os
+import shutil
+
+import numpy
+from numpy.lib.format import open_memmap
+
+DIST_FORMATS = ['json', 'npy']
+
+# Rows to buffer before writing out a chunk.
+CHUNK_ROWS = 1 << 16
+
+PARTS_DIR = 'parts'
+
+
+def column_filename(dirname, group, column):
+    return os.path.join(dirname, 'k%s_%s.npy' % (group, column))
+
+
+def mkdir_p(dirname):
+    if not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            # Another worker may have just created it.
+            if not os.path.isdir(dirname):
+                raise
+
+
+class DistWriter(object):
+    '''Appends distribution rows to chunked NPY column files.
+
+    Several writers, in different processes, may add rows for the same group,
+    as long as their point ids never overlap.
+    '''
+
+    def __init__(self, dirname, group, metrics, write_combos = False):
+        '''
+        @param dirname: distribution directory
+        @param group: number of controllers
+        @param metrics: metrics to store, one column each
+        @param write_combos: store the combo column?
+        '''
+        self.dirname = dirname
+        self.group = group
+        self.metrics = metrics
+        self.write_combos = write_combos
+        self.rows = 0  # Rows written out so far.
+        self._clear()
+
+    def _clear(self):
+        self.point_ids = []
+        self.combos = []
+        self.values = dict((metric, []) for metric in self.metrics)
+        self.buffered = 0
+
+    def append(self, point_ids, combos, values):
+        '''Add a block of rows.
+
+        @param point_ids: (B,) array of distribution ids
+        @param combos: (B, k) NumPy array of node indices
+        @param values: dict of metric to (B,) array of values
+        '''
+        self.point_ids.append(numpy.asarray(point_ids, dtype = numpy.int64))
+        if self.write_combos:
+            self.combos.append(numpy.asarray(combos, dtype = numpy.int32))
+        for metric in self.metrics:
+            self.values[metric].append(numpy.asarray(values[metric], dtype = float))
+        self.buffered += len(point_ids)
+        if self.buffered >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        '''Write buffered rows out as a chunk.'''
+        if not self.buffered:
+            return
+        parts_dir = os.path.join(self.dirname, PARTS_DIR)
+        mkdir_p(parts_dir)
+        point_ids = numpy.concatenate(self.point_ids)
+        columns = [('id', point_ids)]
+        if self.write_combos:
+            columns.append(('combo', numpy.concatenate(self.combos)))
+        for metric in self.metrics:
+            columns.append((metric, numpy.concatenate(self.values[metric])))
+        # Chunks are named by first id, which no other writer can share.
+        prefix = '%012d' % point_ids[0]
+        for column, array in columns:
+            numpy.save(column_filename(parts_dir, self.group, prefix + '_' + column),
+                       array)
+        self.rows += self.buffered
+        self._clear()
+
+    def merge(self, other):
+        '''Account for the rows another (flushed) writer has written.'''
+        assert not other.buffered
+        self.rows += other.rows
+
+
+def init_dir(dirname, nodes, resume = False):
+    '''Prepare a distribution directory and record the node order.
+
+    Drops columns from any earlier run, and chunks left behind by an
+    interrupted one, unless resuming that run.
+    '''
+    mkdir_p(dirname)
+    if resume:
+        return
+    for filename in glob.glob(column_filename(dirname, '*', '*')):
+        os.remove(filename)
+    shutil.rmtree(os.path.join(dirname, PARTS_DIR), ignore_errors = True)
+    json.dump(list(nodes), open(os.path.join(dirname, 'nodes.json'), 'w'))
+
+
+def read_nodes(dirname):
+    return json.load(open(os.path.join(dirname, 'nodes.json'), 'r'))
+
+
+def drop_chunks(dirname, group, lo, hi):
+    '''Remove chunks whose first point id is in [lo, hi).
+
+    When resuming, rows written after a range was last checkpointed will be
+    written again.
+    '''
+    parts_dir = os.path.join(dirname, PARTS_DIR)
+    for filename in glob.glob(column_filename(parts_dir, group, '*')):
+        first_id = int(os.path.basename(filename).split('_', 2)[1])
+        if lo <= first_id < hi:
+            os.remove(filename)
+
+
+def consolidate(dirname, group):
+    '''Merge the chunks for a group into one file per column.
+
+    Rows keep chunk order, which need not be point id order.
+
+    @return rows: number of rows in the group
+    '''
+    parts_dir = os.path.join(dirname, PARTS_DIR)
+    parts = {}  # column: sorted list of chunk filenames
+    for filename in sorted(glob.glob(column_filename(parts_dir, group, '*'))):
+        column = os.path.basename(filename)[:-len('.npy')].split('_', 2)[2]
+        parts.setdefault(column, []).append(filename)
+    rows = 0
+    for column, filenames in parts.iteritems():
+        chunks = [numpy.load(filename, mmap_mode = 'r') for filename in filenames]
+        rows = sum(len(chunk) for chunk in chunks)
+        out = open_memmap(column_filename(dirname, group, column), mode = 'w+',
+                          dtype = chunks[0].dtype,
+                          shape = (rows,) + chunks[0].shape[1:])
+        start = 0
+        for chunk in chunks:
+            out[start:start + len(chunk)] = chunk
+            start += len(chunk)
+        out.flush()
+        del out, chunks
+        for filename in filenames:
+            os.remove(filename)
+    if os.path.isdir(parts_dir) and not os.listdir(parts_dir):
+        os.rmdir(parts_dir)
+    return rows
+
+
+def read_columns(dirname, group):
+    '''Return dict of column name to read-only memory-mapped array.'''
+    columns = {}
+    prefix = 'k%s_' % group
+    for filename in glob.glob(column_filename(dirname, group, '*')):
+        column = os.path.basename(filename)[len(prefix):-len('.npy')]
+        columns[column] = numpy.load(filename, mmap_mode = 'r')
+    return columns
+
+
+def get_distribution(stats, group):
+    '''Return the distribution for a group as a dict of columns.
+
+    Works for both formats: metric columns are NumPy arrays, memory-mapped
+    for NPY output.  Combos are lists of names for JSON output, but arrays of
+    node indices (see read_nodes) for NPY output.
+
+    @param stats: JSON data from metrics, with a distribution written
+    @param group: number of controllers, as a string key
+    '''
+    distribution = stats['data'][group].get('distribution')
+    if isinstance(distribution, dict):
+        return read_columns(distribution['path'], group)
+    if not distribution:
+        raise Exception("missing distribution field in stats - check data")
+    columns = {}
+    for key in distribution[0].keys():
+        values = [d[key] for d in distribution]
+        if key == 'combo':
+            columns[key] = values
+        else:
+            columns[key] = numpy.array(values)
+    return columns
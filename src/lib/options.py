@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 from optparse import OptionParser
 
+from distribution_lib import DIST_FORMATS
 import metrics_lib as metrics
 
 # Highest number of controllers to plot.  If none, plot all.
@@ -93,7 +94,7 @@ def parse_args():
     opts.add_option("--processes", type = 'int', default = 8,
                     help = "worker pool size; must set multiprocess=True")
     opts.add_option("--chunksize", type = 'int', default = 50,
-                    help = "batch size for parallel processing")
+                    help = "initial batch size for parallel processing")
 
     # Metrics-specific arguments
     opts.add_option("--write_combos",  action = "store_true",
@@ -102,6 +103,10 @@ def parse_args():
     opts.add_option("--write_dist",  action = "store_true",
                     default = False,
                     help = "write_distribution?")
+    opts.add_option("--dist_format", type = 'choice',
+                    choices = DIST_FORMATS, default = 'json',
+                    help = "distribution format: json (in the output file) "
+                    "or npy (memory-mappable columns in a _dist directory)")
     opts.add_option("--write_csv",  action = "store_true",
                     default = False,
                     help = "write csv file?")
@@ -112,6 +117,12 @@ def parse_args():
     opts.add_option("--use_prior",  action = "store_true",
                     default = False,
                     help =  "Pull in previously computed data, rather than recompute?")
+    opts.add_option("--checkpoint",  action = "store_true",
+                    default = False,
+                    help = "save progress, so an interrupted run can be resumed?")
+    opts.add_option("--resume",  action = "store_true",
+                    default = False,
+                    help = "resume an interrupted run from its checkpoint?")
     opts.add_option("--no-compute_start",  action = "store_false",
                     default = True, dest = 'compute_start',
                     help = "don't compute metrics from start?")
@@ -121,6 +132,24 @@ def parse_args():
     opts.add_option("--median",  action = "store_true",
                     default = False,
                     help = "compute median?")
+    opts.add_option("--incremental",  action = "store_true",
+                    default = False,
+                    help = "enumerate combos in revolving-door order and "
+                    "update latency metrics incrementally?")
+    opts.add_option("--bnb",  action = "store_true",
+                    default = False,
+                    help = "compute optimal latency/wc_latency by branch and "
+                    "bound rather than enumerating all combos?")
+    opts.add_option("--pareto", type = 'string', action = 'append',
+                    default = [], dest = 'pareto_list',
+                    help = "comma-separated two or three metrics to keep "
+                    "the Pareto front of; repeat for more fronts")
+    opts.add_option("--capacity", type = 'int', default = None,
+                    help = "also compute capacitated placements, with at "
+                    "most this many switches per controller")
+    opts.add_option("--link_budget", type = 'float', default = None,
+                    help = "max control traffic on any link for capacitated "
+                    "placements, as a fraction of switches")
     opts.add_option("-f", "--force", action = "store_true",
                     default = False,
                     help = "force operations to occur even if metrics are there")
@@ -176,6 +205,14 @@ def parse_args():
         options.metrics = [DEF_METRIC]
 
 
+    options.pareto = []
+    for pareto in options.pareto_list:
+        front = pareto.split(',')
+        if len(front) not in [2, 3] or not set(front) <= set(METRICS):
+            raise Exception("Invalid Pareto metrics: %s; choose two or three "
+                            "from %s" % (pareto, METRICS))
+        options.pareto.append(front)
+
     if options.operation_list:
         options.operations = options.operation_list.split(',')
     else:
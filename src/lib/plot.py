@@ -3,7 +3,8 @@
 import errno
 import os
 import json
-from operator import itemgetter
+
+import numpy
 
 # See http://matplotlib.sourceforge.net/users/customizing.html
 
@@ -76,6 +77,8 @@ import matplotlib.pyplot as plt
 import networkx as nx
 import pylab
 
+from pareto_lib import get_pareto
+
 
 def load_stats(options):
     input_file = open(options.input, 'r')
@@ -319,8 +322,10 @@ def ranges_multiple(stats, metric, aspects, aspect_colors, aspect_fcns,
 
 
 def pareto_data_raw(data, x_metric, y_metric, normalize,):
-    '''Generate pareto curve data from a distribution.
+    '''Generate pareto curve data from a distribution or a stored front.
 
+    @param data: dict of controller k's to distribution columns, or to the
+        columns of a stored front, as from pareto_lib.get_pareto
     @return pareto_data: list of pareto data lists, where each data list
         contains (x, y) tuples.
     @return datanames: list of controller k's, corresponding to pareto_data.
@@ -328,17 +333,17 @@ def pareto_data_raw(data, x_metric, y_metric, normalize,):
     pareto_data = []
     datanames = []
     for i, k in enumerate(sorted(data.keys())):
-        # Sort metrics by X
-        points_list = []
-        for d in data[k]:
-            points_list.append((d[x_metric], d[y_metric]))
-        lowest_y = None
-        pareto = []  # List of points on a pareto-optimal curve
-        sorted_by_x = sorted(points_list, key = itemgetter(0))
-        for x, y in sorted_by_x:
-            if not lowest_y or y < lowest_y:
-                pareto.append((x, y))
-                lowest_y = y
+        # Sort metrics by X, then keep each point with a new lowest Y.
+        x_values = numpy.asarray(data[k][x_metric])
+        y_values = numpy.asarray(data[k][y_metric])
+        order = numpy.lexsort((y_values, x_values))
+        x_values = x_values[order]
+        y_values = y_values[order]
+        lowest_y = numpy.minimum.accumulate(y_values)
+        keep = numpy.ones(len(y_values), dtype = bool)
+        keep[1:] = y_values[1:] < lowest_y[:-1]
+        # List of points on a pareto-optimal curve
+        pareto = zip(x_values[keep].tolist(), y_values[keep].tolist())
 
         x = [d[0] for d in pareto]
         y = [d[1] for d in pareto]
@@ -374,9 +379,7 @@ def pareto_norm(stats, aspect_fcns, aspects, metric):
     '''
     data = {}
     for i, g in enumerate(stats['group']):
-        data[g] = [d for d in stats['data'][g]["distribution"]]
-        if not data[g]:
-            raise Exception("missing distribution field in stats - check data")
+        data[g] = get_pareto(stats, g, [PARETO_X, PARETO_Y])
 
     pd, datanames = pareto_data_raw(data, PARETO_X, PARETO_Y, True)
     json_data = {
@@ -482,8 +485,8 @@ def cloud(data, colors, axes, xscale, yscale,
     pylab.grid(True)
 
     for i, k in enumerate(sorted(data.keys(), reverse = True)):
-        x = [d[x_metric] for d in data[k]]
-        y = [d[y_metric] for d in data[k]]
+        x = data[k][x_metric]
+        y = data[k][y_metric]
         # Plot in reverse order, so choose colors in reverse order
         color = colors[len(data) - 1 - i]
         line = pylab.plot(x, y, 'o',
@@ -530,8 +533,8 @@ def plot(ptype, data, colors, axes, label, xscale, yscale,
         index = 0
         for key in sorted(data.keys()):
             val = data[key]
-            x = sorted(val)
-            y = [(float(i + 1) / len(x)) for i in range(len(x))]
+            x = numpy.sort(val)
+            y = numpy.arange(1, len(x) + 1) / float(len(x))
             lines.append(pylab.plot(x, y, colors[index]))
             datanames.append(key)
             index += 1
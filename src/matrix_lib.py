@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+'''Dense distance-matrix engine for fast per-combo metric evaluation.
+
+Every latency-style metric for a controller combo only needs the columns of
+the all-pairs distance matrix that correspond to the controllers in the combo.
+Converting the nested apsp dicts once into a dense NumPy matrix turns each
+metric into a column slice plus a min/argmin/partition reduction.
+'''
+
+import numpy
+
+
+class DistMatrix(object):
+    '''All-pairs distances as a dense float matrix with an integer node index.
+
+    Row and column i both correspond to nodes[i]; dist[i][j] is the distance
+    from nodes[i] to nodes[j].  Missing (unreachable) pairs are inf.
+    '''
+
+    def __init__(self, nodes, dist):
+        '''
+        @param nodes: list of node names, in row order
+        @param dist: n x n float NumPy array
+        '''
+        self.nodes = nodes
+        self.index = dict((n, i) for i, n in enumerate(nodes))
+        self.dist = dist
+
+    def combo_index(self, combo):
+        '''Return NumPy int array of matrix indices for a combo of nodes.'''
+        return numpy.array([self.index[c] for c in combo], dtype = numpy.intp)
+
+    def combo_nodes(self, combo_index):
+        '''Return list of node names for an array of matrix indices.'''
+        return [self.nodes[i] for i in combo_index]
+
+
+def dist_matrix(g, apsp):
+    '''Convert nested apsp dicts to a DistMatrix, in g.nodes() order.
+
+    @param g: NetworkX graph
+    @param apsp: all-pairs shortest paths data
+    @return dm: DistMatrix
+    '''
+    nodes = g.nodes()
+    index = dict((n, i) for i, n in enumerate(nodes))
+    dist = numpy.empty((len(nodes), len(nodes)))
+    dist.fill(numpy.inf)
+    for i, src in enumerate(nodes):
+        row = dist[i]
+        for dst, path_len in apsp[src].iteritems():
+            row[index[dst]] = path_len
+    return DistMatrix(nodes, dist)
+
+
+# Single-entry cache of the last converted apsp.  A sweep evaluates every combo
+# against the same (g, apsp) pair, so conversion happens once per sweep.
+_cache = {'g': None, 'apsp': None, 'dm': None}
+
+def get_dist_matrix(g, apsp):
+    '''Return the (cached) DistMatrix for a graph and its apsp data.'''
+    if _cache['g'] is not g or _cache['apsp'] is not apsp:
+        _cache['dm'] = dist_matrix(g, apsp)
+        _cache['g'] = g
+        _cache['apsp'] = apsp
+    return _cache['dm']
+
+
+def cache_dist_matrix(g, apsp, dm):
+    '''Make get_dist_matrix(g, apsp) return an existing DistMatrix.'''
+    _cache['g'] = g
+    _cache['apsp'] = apsp
+    _cache['dm'] = dm
+
+
+def closest_dists(dm, combo_index):
+    '''Return array of each node's distance to its closest controller.'''
+    return dm.dist[:, combo_index].min(axis = 1)
+
+
+def closest_index(dm, combo_index):
+    '''Return array of each node's closest controller, as a matrix index.
+
+    Ties go to the controller listed first in the combo.
+    '''
+    return combo_index[dm.dist[:, combo_index].argmin(axis = 1)]
+
+
+def closest_dists_2(dm, combo_index):
+    '''Return array of each node's distance to its second-closest controller.
+
+    With a single controller, falls back to the closest one.
+    '''
+    sub = dm.dist[:, combo_index]
+    if len(combo_index) == 1:
+        return sub[:, 0]
+    return numpy.partition(sub, 1, axis = 1)[:, 1]
+
+
+def latency(dm, combo_index):
+    '''Return average latency from each node to its closest controller.'''
+    return float(closest_dists(dm, combo_index).sum()) / len(dm.nodes)
+
+
+def latency_2(dm, combo_index):
+    '''Return average latency from each node to its second-closest controller.'''
+    return float(closest_dists_2(dm, combo_index).sum()) / len(dm.nodes)
+
+
+def wc_latency(dm, combo_index):
+    '''Return worst-case latency for the node farthest from its controller.'''
+    return float(closest_dists(dm, combo_index).max())
+
+
+def wc_latency_2(dm, combo_index):
+    '''Return worst-case latency to the second-closest controller.'''
+    return float(closest_dists_2(dm, combo_index).max())
+
+
+def fraction_within_latency(dm, combo_index, lat_bound):
+    '''Return the fraction of nodes within lat_bound of their controller.'''
+    within = closest_dists(dm, combo_index) <= lat_bound
+    return within.sum() / float(len(dm.nodes))
+
+
+def allocations(dm, combo_index):
+    '''Return switches allocated to each controller in the combo.
+
+    Switches equally distant from several controllers split their share
+    equally between them.
+
+    @return allocations: float array, one entry per controller in the combo
+    '''
+    sub = dm.dist[:, combo_index]
+    ties = (sub == sub.min(axis = 1)[:, numpy.newaxis])
+    shares = ties / ties.sum(axis = 1)[:, numpy.newaxis].astype(float)
+    return shares.sum(axis = 0)
+
+
+def fairness(dm, combo_index):
+    '''Return Jain's fairness index for switch/controller allocation.
+
+    Controllers with no allocated switches are excluded, as in
+    metrics_lib.controller_split_fairness.
+    '''
+    values = allocations(dm, combo_index)
+    values = values[values > 0]
+    return float(values.sum() ** 2 / (len(values) * (values ** 2).sum()))
+
+
+# Map of metric names to matrix-based functions, with parameters:
+# (dm, combo_index)
+METRIC_FCNS = {
+    'latency': latency,
+    'latency_2': latency_2,
+    'wc_latency': wc_latency,
+    'wc_latency_2': wc_latency_2,
+    'fairness': fairness
+}
+
+
+def batch_metrics(dm, combos, metrics):
+    '''Compute metrics for a whole block of combos in one vectorized pass.
+
+    Gathers the (B, k, n) distances from every combo's controllers to every
+    node, then reduces over the controller (k) axis.
+
+    @param dm: DistMatrix
+    @param combos: (B, k) NumPy int array of matrix indices
+    @param metrics: list of metric names, all in BATCH_METRICS
+    @return values: dict of metric name to (B,) float array
+    '''
+    n = len(dm.nodes)
+    # dist.T[c] is the column of distances from every node to controller c.
+    sub = dm.dist.T[combos]
+    values = {}
+    closest = None
+    closest_2 = None
+    for metric in metrics:
+        if metric in ['latency', 'wc_latency', 'fairness'] and closest is None:
+            closest = sub.min(axis = 1)
+        if metric in ['latency_2', 'wc_latency_2'] and closest_2 is None:
+            if combos.shape[1] == 1:
+                closest_2 = sub[:, 0, :]
+            else:
+                closest_2 = numpy.partition(sub, 1, axis = 1)[:, 1, :]
+
+        if metric == 'latency':
+            values[metric] = closest.sum(axis = 1) / float(n)
+        elif metric == 'latency_2':
+            values[metric] = closest_2.sum(axis = 1) / float(n)
+        elif metric == 'wc_latency':
+            values[metric] = closest.max(axis = 1)
+        elif metric == 'wc_latency_2':
+            values[metric] = closest_2.max(axis = 1)
+        elif metric == 'fairness':
+            ties = (sub == closest[:, numpy.newaxis, :])
+            shares = ties / ties.sum(axis = 1)[:, numpy.newaxis, :].astype(float)
+            alloc = shares.sum(axis = 2)
+            nonzero = (alloc > 0).sum(axis = 1)
+            values[metric] = alloc.sum(axis = 1) ** 2 / (nonzero * (alloc ** 2).sum(axis = 1))
+        else:
+            raise Exception("metric %s cannot be batched" % metric)
+    return values
+
+
+BATCH_METRICS = METRIC_FCNS.keys()
+
+
+class NearestState(object):
+    '''Closest and second-closest controller distances for each node.
+
+    Updated incrementally as single controllers are swapped in and out, which
+    costs O(n) per swap rather than O(n * k) for a fresh evaluation.
+    '''
+
+    def __init__(self, dm, combo_index):
+        '''
+        @param dm: DistMatrix
+        @param combo_index: matrix indices of the initial controllers
+        '''
+        self.dist = dm.dist
+        self.n = len(dm.nodes)
+        self.combo = list(combo_index)
+        rows = numpy.arange(self.n)
+        (self.best, self.best_arg,
+         self.best_2, self.best_2_arg) = self._top_2(rows)
+
+    def _top_2(self, rows):
+        '''Compute closest/second-closest distance and controller for rows.'''
+        combo = numpy.array(self.combo, dtype = numpy.intp)
+        if len(combo) < 2:
+            best = numpy.empty(len(rows))
+            best.fill(numpy.inf)
+            best_arg = numpy.repeat(-1, len(rows))
+            if len(combo) == 0:
+                return best, best_arg, best.copy(), best_arg.copy()
+            return (self.dist[rows, combo[0]], numpy.repeat(combo[0], len(rows)),
+                    best, best_arg)
+        sub = self.dist[rows][:, combo]
+        cols = numpy.argpartition(sub, 1, axis = 1)[:, :2]
+        vals = sub[numpy.arange(len(rows))[:, numpy.newaxis], cols]
+        # argpartition leaves the two smallest unordered.
+        flip = vals[:, 1] < vals[:, 0]
+        vals[flip] = vals[flip][:, ::-1]
+        cols[flip] = cols[flip][:, ::-1]
+        return vals[:, 0], combo[cols[:, 0]], vals[:, 1], combo[cols[:, 1]]
+
+    def swap(self, removed, added):
+        '''Replace controller removed with controller added.'''
+        self.combo.remove(removed)
+        self.combo.append(added)
+        affected = numpy.flatnonzero((self.best_arg == removed) |
+                                     (self.best_2_arg == removed))
+        d = self.dist[:, added]
+        closer = d < self.best
+        closer_2 = ~closer & (d < self.best_2)
+        self.best_2 = numpy.where(closer, self.best,
+                                  numpy.where(closer_2, d, self.best_2))
+        self.best_2_arg = numpy.where(closer, self.best_arg,
+                                      numpy.where(closer_2, added, self.best_2_arg))
+        self.best = numpy.where(closer, d, self.best)
+        self.best_arg = numpy.where(closer, added, self.best_arg)
+        # Nodes that lost their closest or second-closest controller need a
+        # fresh look at the remaining ones.
+        if len(affected):
+            (self.best[affected], self.best_arg[affected],
+             self.best_2[affected], self.best_2_arg[affected]) = self._top_2(affected)
+
+    def run_metrics(self, tail, metrics):
+        '''Compute metrics for the current combo plus each row of tail.
+
+        @param tail: (m, t) NumPy array of matrix indices, none in the combo
+        @param metrics: metric names, all in INCREMENTAL_METRICS
+        @return values: dict of metric name to (m,) float array
+        '''
+        closest = self.best[:, numpy.newaxis]
+        closest_2 = self.best_2[:, numpy.newaxis]
+        for col in tail.T:
+            d = self.dist[:, col]
+            closest_2 = numpy.minimum(numpy.maximum(closest, d), closest_2)
+            closest = numpy.minimum(closest, d)
+        if not self.combo and tail.shape[1] == 1:
+            # A single controller is also its own second-closest one.
+            closest_2 = closest
+        values = {}
+        for metric in metrics:
+            if metric == 'latency':
+                values[metric] = closest.sum(axis = 0) / float(self.n)
+            elif metric == 'latency_2':
+                values[metric] = closest_2.sum(axis = 0) / float(self.n)
+            elif metric == 'wc_latency':
+                values[metric] = closest.max(axis = 0)
+            elif metric == 'wc_latency_2':
+                values[metric] = closest_2.max(axis = 0)
+            else:
+                raise Exception("metric %s cannot be computed incrementally" % metric)
+        return values
+
+
+INCREMENTAL_METRICS = ['latency', 'latency_2', 'wc_latency', 'wc_latency_2']
@@ -17,6 +17,8 @@ import networkx as nx
 from file_libs import write_csv_file, write_json_file, read_json_file
 from file_libs import write_dist_csv_file
 import metrics_lib as metrics
+from path_matrix_lib import path_matrix
+from placement_lib import run_bnb, run_capacitated
 from topo_lib import get_topo_graph
 from lib.options import parse_args
 
@@ -74,7 +76,7 @@ def do_metrics(options, topo, g):
 
     data = {}  # See top for data schema details.
     apsp = nx.all_pairs_dijkstra_path_length(g)
-    apsp_paths = nx.all_pairs_dijkstra_path(g)
+    apsp_paths = path_matrix(g)
 
     extra_params = get_extra_params(g)
     if options.use_prior:
@@ -82,10 +84,19 @@ def do_metrics(options, topo, g):
     else:
         start = time.time()
         weighted = True
-        metrics.run_all_combos(options.metrics, g, controllers, data, apsp,
-                               apsp_paths, weighted, options.write_dist,
-                               options.write_combos, extra_params, options.processes,
-                               options.multiprocess, options.chunksize, options.median)
+        if options.bnb:
+            run_bnb(options.metrics, g, controllers, data, apsp, weighted)
+        else:
+            checkpoint_path = None
+            if options.checkpoint or options.resume:
+                checkpoint_path = filename + '_checkpoint'
+            metrics.run_all_combos(options.metrics, g, controllers, data, apsp,
+                                   apsp_paths, weighted, options.write_dist,
+                                   options.write_combos, extra_params, options.processes,
+                                   options.multiprocess, options.chunksize, options.median,
+                                   options.incremental, options.dist_format,
+                                   filename + '_dist', checkpoint_path,
+                                   options.resume, options.pareto)
         total_duration = time.time() - start
         print "%0.6f" % total_duration
 
@@ -93,14 +104,22 @@ def do_metrics(options, topo, g):
         metrics.run_greedy_informed(data, g, apsp, options.weighted)
         metrics.run_greedy_alg_dict(data, g, 'greedy-cc', 'latency', nx.closeness_centrality(g, weighted_edges = options.weighted), apsp, options.weighted)
         metrics.run_greedy_alg_dict(data, g, 'greedy-dc', 'latency', nx.degree_centrality(g), apsp, options.weighted)
+        baseline_metrics = ['latency'] + [m for m in options.metrics if m != 'latency']
         for i in [10, 100, 1000]:
-            metrics.run_best_n(data, g, apsp, i, options.weighted)
-            metrics.run_worst_n(data, g, apsp, i, options.weighted)
+            for metric in baseline_metrics:
+                metrics.run_best_n(data, g, apsp, i, options.weighted, metric,
+                                   apsp_paths, extra_params)
+                metrics.run_worst_n(data, g, apsp, i, options.weighted, metric,
+                                    apsp_paths, extra_params)
+
+    if options.capacity:
+        run_capacitated(g, controllers, data, apsp, apsp_paths, options.capacity,
+                        options.link_budget, options.weighted)
 
     print "*******************************************************************"
 
     # Ignore the actual combinations in CSV outputs as well as single points.
-    exclude = ["distribution", "metric", "group", "id"]
+    exclude = ["distribution", "pareto", "metric", "group", "id"]
     if not options.write_combos:
         exclude += ['highest_combo', 'lowest_combo']
 
@@ -111,7 +130,7 @@ def do_metrics(options, topo, g):
         write_json_file(filename + '.json', data)
         if options.write_csv:
             write_csv_file(filename, data["data"], exclude = exclude)
-            if options.write_dist:
+            if options.write_dist and options.dist_format == 'json':
                 write_dist_csv_file(filename + '_dist', data["data"], exclude)
 
     return data, filename
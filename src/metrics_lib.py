@@ -2,20 +2,49 @@
 '''Library of algorithms and helpers for computing metrics.'''
 
 from itertools import combinations
+import gc
 import logging
 import multiprocessing
+import Queue
 import time
 
 import numpy
 import networkx as nx
 
-from itertools_recipes import random_combination, choose
+import availability_lib
+from availability_lib import FailureStates, get_availability_model
+from availability_lib import get_failure_states
+from combo_lib import combo_blocks, random_combos, revolving_door_runs, BLOCK_SIZE
+import checkpoint_lib
+from checkpoint_lib import CHECKPOINT_INTERVAL
+from connectivity_lib import get_any_path_availability
+import distribution_lib
+from distribution_lib import DistWriter
+from itertools_recipes import choose
+from matrix_lib import get_dist_matrix, cache_dist_matrix, NearestState
+import matrix_lib
+from pareto_lib import MAXIMIZE, ParetoFront, front_key
+from path_matrix_lib import PathMatrix
+import path_matrix_lib
+from placement_lib import lazy_greedy
+from shared_lib import publish_graph, attach_graph
+from stats_lib import QuantileSketch
 from util import sort_by_val
 
 BIG = 10000000
 RESULTS_TIMEOUT = 1
+TASK_SECONDS = 0.5  # Target duration of each dynamically scheduled task
+TASKS_PER_PROCESS = 2  # Dynamically scheduled tasks queued per process
+MAX_TASK_COMBOS = 1 << 20  # Max combos per dynamically scheduled task
+PROGRESS_INTERVAL = 10  # Seconds between progress reports
 COARSE = True  # Divide up tasks in the beginning, rather than fine-grained.
 PRINT_VERBOSE = True  # If true, print out metric details/sol'ns
+USE_MATRIX = True  # Evaluate latency metrics on a dense distance matrix.
+MAX_RUN_ELEMENTS = 1 << 22  # Max (combos x nodes) per incremental run
+MAX_SAMPLE_ELEMENTS = 1 << 24  # Max (combos x k x nodes) per sampled block
+SEED = 0  # Default seed for random combos, so runs are reproducible
+# Quantiles reported when computing the median, by key.
+QUANTILES = [('p5', 0.05), ('median', 0.5), ('p95', 0.95)]
 
 lg = logging.getLogger("metrics_lib")
 
@@ -195,8 +224,8 @@ def controller_split_fairness(g, combo, apsp, weighted):
     return fairness(allocations.values())
 
 
-def control_traffic_congestion(g, combo, apsp, apsp_paths, weighted, extra_params = None):
-    '''Find the worst-case control traffic overlap.
+def most_congested_link(g, combo, apsp, apsp_paths, weighted):
+    '''Find the worst-case control traffic overlap, and where it is.
 
     That is, the single link for which the most control traffic is assigned
     along a shortest path.
@@ -207,6 +236,7 @@ def control_traffic_congestion(g, combo, apsp, apsp_paths, weighted, extra_param
     @param apsp_paths: all-pairs shortest paths path data
     @param weighted: is graph weighted?
     @return congestion: fraction of switches' traffic along worst-case link.
+    @return link: (src, dst) node pair of the worst-case link
     '''
     # Counters for each used edge
     traffic = nx.Graph()
@@ -241,13 +271,23 @@ def control_traffic_congestion(g, combo, apsp, apsp_paths, weighted, extra_param
         w = traffic[src][dst]["weight"]
         if w > most_congested_total:
             most_congested_total = w
-            most_congested_edge = [src, dst]
+            most_congested_edge = (src, dst)
 
-    #print "most congested edge: %s" % most_congested_edge
-    #print "most congested total: %s" % most_congested_total
-    
     # Return the largest such edge as a fraction of the number of switches.
-    return most_congested_total / float(g.number_of_nodes())
+    return most_congested_total / float(g.number_of_nodes()), most_congested_edge
+
+
+def control_traffic_congestion(g, combo, apsp, apsp_paths, weighted, extra_params = None):
+    '''Return the worst-case control traffic overlap; see most_congested_link.
+
+    With the matrix engine, link loads come from the pair-to-edge incidence
+    of a PathMatrix instead of per-combo graphs of counters.
+    '''
+    if USE_MATRIX or isinstance(apsp_paths, PathMatrix):
+        dm = get_dist_matrix(g, apsp)
+        pm = path_matrix_lib.get_path_matrix(g, dm.nodes, apsp_paths)
+        return path_matrix_lib.congestion(dm, pm, dm.combo_index(combo))[0]
+    return most_congested_link(g, combo, apsp, apsp_paths, weighted)[0]
 
 
 def path_is_clear(path, failed_links):
@@ -283,6 +323,11 @@ def connectivity_sssp(g, combo, apsp, apsp_paths, weighted, failed_links):
     @param failed_edges: list of edge failures
     @return connectivity: fraction of connected switches, on average
     '''
+    if isinstance(apsp_paths, PathMatrix):
+        dm = get_dist_matrix(g, apsp)
+        return path_matrix_lib.connectivity(dm, apsp_paths, dm.combo_index(combo),
+                                            apsp_paths.edge_ids(failed_links))
+
     connected = 0  # Number of connected switches
     for n in g.nodes():
         # Find best controller set
@@ -320,10 +365,49 @@ def link_failure_combinations(g, failures):
         combos.append(c)
     return combos
 
+def combo_path_links(g, combo, apsp, apsp_paths):
+    '''Return the links on any path from a switch to a closest controller.
+
+    Failures of any other link leave connectivity_sssp unchanged.
+
+    @param g: NetworkX graph
+    @param combo: list of controller locations
+    @param apsp: all-pairs shortest paths data
+    @param apsp_paths: all-pairs shortest paths path data
+    @return links: set of (src, dst) node pairs, in both directions
+    '''
+    links = set([])
+    if isinstance(apsp_paths, PathMatrix):
+        dm = get_dist_matrix(g, apsp)
+        for e in path_matrix_lib.combo_path_edges(dm, apsp_paths,
+                                                  dm.combo_index(combo)):
+            src, dst = apsp_paths.edges[e]
+            links.add((src, dst))
+            links.add((dst, src))
+        return links
+
+    for n in g.nodes():
+        dists = [apsp[n][c] for c in combo]
+        closest_dist = min(dists)
+        for c, dist in zip(combo, dists):
+            if dist == closest_dist:
+                path = apsp_paths[n][c]
+                for src, dst in zip(path[:-1], path[1:]):
+                    links.add((src, dst))
+                    links.add((dst, src))
+    return links
+
+
 def availability_one_combo(g, combo, apsp, apsp_paths, weighted,
                            link_fail_prob, max_failures):
     '''Compute connectivity for a single combination of controllers.
 
+    Only failure sets within the links on the combo's paths are enumerated:
+    a state's connectivity depends only on which of those links failed, and
+    the other links just scale each such set by the probability that few
+    enough of them fail too.  Failures entirely off the paths leave every
+    switch connected, so all of those states collapse into one term.
+
     @param g: NetworkX graph
     @param controllers: list of controller locations
     @param apsp: all-pairs shortest paths data
@@ -338,34 +422,32 @@ def availability_one_combo(g, combo, apsp, apsp_paths, weighted,
     @return availability: average availability fraction
     @return coverage: fraction of cases considered.
     '''
-    availabilities = {}  # Probabilities * connectivity per # failures
-    coverages = {}  # Coverage per # failures
+    availabilities = {}  # Probabilities * connectivity per # path failures
+    coverages = {}  # Coverage per # path failures
     assert g
 
-    for failures in range(max_failures + 1):
+    # State probabilities depend only on the graph, so share them.
+    states = get_failure_states(g, weighted, link_fail_prob)
+    links = combo_path_links(g, combo, apsp, apsp_paths)
+    on_path = numpy.array([link in links for link in states.edges], dtype = bool)
+    path_states = FailureStates([link for link in states.edges if link in links],
+                                states.probs[on_path])
+    # Probability of at most r failures off the paths, for each r.
+    off_path = numpy.cumsum(availability_lib.failure_polynomial(
+        states.probs[~on_path], max_failures))
+    for failures in range(min(max_failures, len(path_states.edges)) + 1):
+        failed, state_probs = path_states.level(failures)
+        scale = off_path[max_failures - failures]
         availabilities[failures] = 0.0
-        coverages[failures] = 0.0
-        for failed_links in link_failure_combinations(g, failures):
-            links = g.number_of_edges()
-            if weighted:
-                state_prob = 1.0
-                for e in g.edges():
-                    src, dst = e
-                    weight = g[src][dst]['weight']
-                    this_link_fail_prob = link_fail_prob * weight
-                    if e in failed_links:
-                        state_prob *= this_link_fail_prob
-                    else:
-                        state_prob *= (1.0 - this_link_fail_prob)
+        coverages[failures] = scale * state_probs.sum()
+        for failed_ids, state_prob in zip(failed, state_probs):
+            if failures == 0:
+                conn = 1.0
             else:
-                bad_links = len(failed_links)
-                good_links = links - bad_links
-                link_success_prob = (1.0 - link_fail_prob)
-                state_prob = ((link_success_prob ** good_links) *
-                              (link_fail_prob ** bad_links))
-            coverages[failures] += state_prob
-            conn = connectivity_sssp(g, combo, apsp, apsp_paths, weighted, failed_links)
-            availabilities[failures] += state_prob * conn
+                failed_links = [path_states.edges[i] for i in failed_ids]
+                conn = connectivity_sssp(g, combo, apsp, apsp_paths, weighted,
+                                         failed_links)
+            availabilities[failures] += scale * state_prob * conn
 
     availability = sum(availabilities.values())
     coverage = sum(coverages.values())
@@ -375,27 +457,83 @@ def availability_one_combo(g, combo, apsp, apsp_paths, weighted,
 def get_null(g, combo, apsp, apsp_paths, weighted, extra_params):
     return 0.0
 
+def get_matrix_metric(metric, g, combo, apsp):
+    dm = get_dist_matrix(g, apsp)
+    return matrix_lib.METRIC_FCNS[metric](dm, dm.combo_index(combo))
+
 def get_latency(g, combo, apsp, apsp_paths, weighted, extra_params):
+    if USE_MATRIX:
+        return get_matrix_metric('latency', g, combo, apsp)
     return get_total_path_len(g, combo, apsp, weighted) / float(g.number_of_nodes())
 
 def get_latency_2(g, combo, apsp, apsp_paths, weighted, extra_params):
+    if USE_MATRIX:
+        return get_matrix_metric('latency_2', g, combo, apsp)
     return get_total_path_len_2(g, combo, apsp, weighted) / float(g.number_of_nodes())
 
 def get_wc_latency(g, combo, apsp, apsp_paths, weighted, extra_params):
+    if USE_MATRIX:
+        return get_matrix_metric('wc_latency', g, combo, apsp)
     return worst_case_latency(g, combo, apsp, weighted)
 
 def get_wc_latency_2(g, combo, apsp, apsp_paths, weighted, extra_params):
+    if USE_MATRIX:
+        return get_matrix_metric('wc_latency_2', g, combo, apsp)
     return worst_case_latency_2(g, combo, apsp, weighted)
 
 def get_fairness(g, combo, apsp, apsp_paths, weighted, extra_params):
+    if USE_MATRIX:
+        return get_matrix_metric('fairness', g, combo, apsp)
     return controller_split_fairness(g, combo, apsp, weighted)
 
+def availability_model(g, apsp, apsp_paths, weighted, extra_params):
+    '''Return the (cached) DistMatrix and AvailabilityModel for a graph.
+
+    extra_params['availability_mode'] picks the engine, from
+    availability_lib.AVAILABILITY_MODES; the sample engine also takes
+    optional 'availability_samples' and 'availability_seed' params.
+    '''
+    assert 'link_fail_prob' in extra_params
+    assert 'max_failures' in extra_params
+    dm = get_dist_matrix(g, apsp)
+    model = get_availability_model(g, dm, apsp_paths, weighted,
+        extra_params['link_fail_prob'], extra_params['max_failures'],
+        extra_params.get('availability_mode', 'exact'),
+        extra_params.get('availability_samples', availability_lib.SAMPLES),
+        extra_params.get('availability_seed', availability_lib.SEED))
+    return dm, model
+
+def availability_interval(g, combo, apsp, apsp_paths, weighted, extra_params):
+    '''Return availability of a combo and a 95% CI half-width.'''
+    mode = extra_params.get('availability_mode', 'exact')
+    if not USE_MATRIX and mode != 'sample':
+        availability, coverage = availability_one_combo(g, combo, apsp,
+            apsp_paths, weighted, extra_params['link_fail_prob'],
+            extra_params['max_failures'])
+        return availability, 0.0
+    dm, model = availability_model(g, apsp, apsp_paths, weighted, extra_params)
+    return model.interval(dm.combo_index(combo))
+
 def get_availability(g, combo, apsp, apsp_paths, weighted, extra_params):
+    return availability_interval(g, combo, apsp, apsp_paths, weighted,
+                                 extra_params)[0]
+
+def get_availability_ci(g, combo, apsp, apsp_paths, weighted, extra_params):
+    return availability_interval(g, combo, apsp, apsp_paths, weighted,
+                                 extra_params)[1]
+
+def get_availability_any(g, combo, apsp, apsp_paths, weighted, extra_params):
+    '''Return availability of a combo when switches may use any surviving path.
+
+    That is, the fraction of switches in the same connected component as
+    some controller, averaged over failure states; see connectivity_lib.
+    '''
     assert 'link_fail_prob' in extra_params
     assert 'max_failures' in extra_params
-    availability, coverage = availability_one_combo(g, combo, apsp, apsp_paths,
-        weighted, extra_params['link_fail_prob'], extra_params['max_failures'])
-    return availability
+    dm = get_dist_matrix(g, apsp)
+    model = get_any_path_availability(g, dm.nodes, weighted,
+        extra_params['link_fail_prob'], extra_params['max_failures'])
+    return model.availability(dm.combo_index(combo))
 
 # Map of metric names to functions to execute them.
 # Functions must have these parameters:
@@ -408,11 +546,16 @@ METRIC_FCNS = {
     'fairness': get_fairness,
     'congestion': control_traffic_congestion,
     'availability': get_availability,
+    'availability_ci': get_availability_ci,
+    'availability_any': get_availability_any,
     'wc_latency_2': get_wc_latency_2
 }
 
 METRICS = METRIC_FCNS.keys()
 
+# Metrics handle_block evaluates as a batch from an AvailabilityModel.
+AVAILABILITY_METRICS = ['availability', 'availability_ci']
+
 # Return long name, suitable for printing
 def metric_fullname(metric):
     if metric == 'latency':
@@ -428,23 +571,6 @@ def get_output_filepath(write_filepath):
     return write_filepath
 
 
-def handle_combo(combo):
-    '''Handle processing for a combination.
-    
-    Returns list with two elements:
-        combo: list
-        values: dict of metric, (value, duration) tuples.
-    '''
-    values = {}
-    for metric in g_metrics:
-        start_time = time.time()
-        metric_value = METRIC_FCNS[metric](g_g, combo, g_apsp, g_apsp_paths,
-                                           g_weighted, g_extra_params)
-        duration = time.time() - start_time
-        values[metric] = (metric_value, duration)
-    return [combo, values]
-
-
 def process_result(metrics, median, write_combos, write_dist, combo, values, point_id, distribution, metric_data):
     json_entry = {}  # For writing to distribution
     json_entry['id'] = point_id
@@ -460,7 +586,7 @@ def process_result(metrics, median, write_combos, write_dist, combo, values, poi
             this_metric['highest'] = metric_value
             this_metric['highest_combo'] = combo
         if median:
-            this_metric['values'].append(metric_value)
+            this_metric['sketch'].update(metric_value)
         this_metric['sum'] += metric_value
         this_metric['num'] += 1
 
@@ -473,49 +599,383 @@ def process_result(metrics, median, write_combos, write_dist, combo, values, poi
         distribution.append(json_entry)
 
 
-def handle_combos(combos, metrics, median, write_combos, write_dist, point_id):
-    '''Handle processing for multiple combinations.
+def handle_block(combos, metrics = None):
+    '''Evaluate metrics for a block of combinations, for run_all_combos.
 
-    Returns list with two elements:
-        combo: list
-        values: dict of metric, (value, duration) tuples.
+    @param combos: (B, k) NumPy array of indices into g_nodes
+    @param metrics: metrics to evaluate; all of g_metrics if None
+    @return values: dict of metric to (B,) array of values
+    @return durations: dict of metric to total duration for the block
     '''
-    metric_data = init_metric_data(metrics, median)
-    distribution = init_distribution()
-    for combo in combos:
-        values = {}
-        for metric in g_metrics:
+    if metrics is None:
+        metrics = g_metrics
+    return evaluate_block(g_g, g_nodes, combos, metrics, g_apsp, g_apsp_paths,
+                          g_weighted, g_extra_params)
+
+
+def evaluate_block(g, nodes, combos, metrics, apsp, apsp_paths, weighted,
+                   extra_params):
+    '''Evaluate metrics for a block of combinations.
+
+    Metrics the matrix engine can batch are computed in one vectorized pass,
+    as are availability metrics, from the cached AvailabilityModel, and
+    congestion, from the cached PathMatrix; the rest fall back to one
+    METRIC_FCNS call per combo.
+
+    @param g: NetworkX graph
+    @param nodes: g.nodes(), as indexed by combos
+    @param combos: (B, k) NumPy array of indices into nodes
+    @param metrics: metrics to evaluate
+    @param apsp: all-pairs shortest paths data
+    @param apsp_paths: all-pairs shortest paths path data
+    @param weighted: is graph weighted?
+    @param extra_params: extra params for metrics; see run_all_combos
+    @return values: dict of metric to (B,) array of values
+    @return durations: dict of metric to total duration for the block
+    '''
+    values = {}
+    durations = {}
+    batched = []
+    if USE_MATRIX:
+        batched = [m for m in metrics if m in matrix_lib.BATCH_METRICS]
+    if batched:
+        start_time = time.time()
+        dm = get_dist_matrix(g, apsp)
+        values.update(matrix_lib.batch_metrics(dm, combos, batched))
+        duration = time.time() - start_time
+        for metric in batched:
+            durations[metric] = duration / len(batched)
+    if USE_MATRIX:
+        # All availability metrics come from the same pair terms.
+        availability = [m for m in metrics if m in AVAILABILITY_METRICS]
+        if availability:
             start_time = time.time()
-            metric_value = METRIC_FCNS[metric](g_g, combo, g_apsp, g_apsp_paths,
-                                               g_weighted, g_extra_params)
+            dm, model = availability_model(g, apsp, apsp_paths,
+                                           weighted, extra_params)
+            intervals = dict(zip(AVAILABILITY_METRICS,
+                                 model.batch_intervals(combos)))
+            for metric in availability:
+                values[metric] = intervals[metric]
             duration = time.time() - start_time
-            values[metric] = (metric_value, duration)
-        process_result(metrics, median, write_combos, write_dist, combo, values, point_id, distribution, metric_data)
-        point_id += 1
+            for metric in availability:
+                durations[metric] = duration / len(availability)
+            batched += availability
+        if 'congestion' in metrics:
+            start_time = time.time()
+            dm = get_dist_matrix(g, apsp)
+            pm = path_matrix_lib.get_path_matrix(g, dm.nodes, apsp_paths)
+            values['congestion'], edge_ids = path_matrix_lib.batch_congestion(
+                dm, pm, combos)
+            durations['congestion'] = time.time() - start_time
+            batched.append('congestion')
+    for metric in [m for m in metrics if m not in batched]:
+        start_time = time.time()
+        metric_values = numpy.empty(len(combos))
+        for i, combo_index in enumerate(combos):
+            combo = tuple(nodes[j] for j in combo_index)
+            metric_values[i] = METRIC_FCNS[metric](g, combo, apsp,
+                apsp_paths, weighted, extra_params)
+        values[metric] = metric_values
+        durations[metric] = time.time() - start_time
+    return values, durations
+
+
+def incremental_blocks(combo_size, lo, hi, block_size = BLOCK_SIZE):
+    '''Evaluate combinations with revolving-door ranks in [lo, hi).
+
+    The latency-style metrics come from a NearestState for the controllers
+    shared by each run of the sequence, updated by swapping controllers in
+    and out between runs.  Any other metrics are evaluated per block with
+    handle_block.
+
+    @param combo_size: number of controllers per combo
+    @param lo: first rank to evaluate
+    @param hi: one past the last rank to evaluate
+    @param block_size: min combos per yielded block, except the last
+    @return blocks: iterator of (combos, values, durations, ranks), with
+        combos, values and durations as for handle_block.
+    '''
+    dm = get_dist_matrix(g_g, g_apsp)
+    incremental = [m for m in g_metrics if m in matrix_lib.INCREMENTAL_METRICS]
+    others = [m for m in g_metrics if m not in incremental]
+
+    def evaluate(combos, incremental_values, duration, rank):
+        combos = numpy.concatenate(combos)
+        values, durations = handle_block(combos, others)
+        for metric in incremental:
+            values[metric] = numpy.concatenate(incremental_values[metric])
+            durations[metric] = duration / len(incremental)
+        ranks = numpy.arange(rank - len(combos), rank)
+        return combos, values, durations, ranks
+
+    # Vary the last three controllers of each run where that fits in memory.
+    depth = 2
+    if choose(len(g_nodes), 3) * len(g_nodes) <= MAX_RUN_ELEMENTS:
+        depth = 3
+
+    state = None
+    combos = []
+    incremental_values = dict((m, []) for m in incremental)
+    pending = 0
+    duration = 0.0
+    rank = lo
+    for fixed, tail in revolving_door_runs(len(g_nodes), combo_size, lo, hi, depth):
+        start_time = time.time()
+        if state is None:
+            state = NearestState(dm, fixed)
+        else:
+            removed = set(state.combo) - set(fixed)
+            added = set(fixed) - set(state.combo)
+            for r, a in zip(removed, added):
+                state.swap(r, a)
+        run_values = state.run_metrics(tail, incremental)
+        duration += time.time() - start_time
+
+        run_combos = numpy.empty((len(tail), combo_size), dtype = numpy.intp)
+        run_combos[:, :len(fixed)] = fixed
+        run_combos[:, len(fixed):] = tail
+        run_combos.sort(axis = 1)
+        combos.append(run_combos)
+        for metric in incremental:
+            incremental_values[metric].append(run_values[metric])
+        pending += len(tail)
+        rank += len(tail)
+        if pending >= block_size:
+            yield evaluate(combos, incremental_values, duration, rank)
+            combos = []
+            incremental_values = dict((m, []) for m in incremental)
+            pending = 0
+            duration = 0.0
+    if combos:
+        yield evaluate(combos, incremental_values, duration, rank)
+
+
+def process_block(metrics, median, write_combos, write_dist, combos, values,
+                  durations, point_ids, distribution, metric_data):
+    '''Aggregate the results for a block of combinations.
+
+    Equivalent to calling process_result on each combo in turn.
+
+    @param combos: (B, k) NumPy array of indices into g_nodes
+    @param values: dict of metric to (B,) array of values
+    @param durations: dict of metric to total duration for the block
+    @param point_ids: (B,) array of distribution ids
+    '''
+    for metric in metrics:
+        this_metric = metric_data[metric]
+        metric_values = values[metric]
+        this_metric['duration'] += durations[metric]
+        i = metric_values.argmin()
+        if metric_values[i] < this_metric['lowest']:
+            this_metric['lowest'] = float(metric_values[i])
+            this_metric['lowest_combo'] = tuple(g_nodes[j] for j in combos[i])
+        i = metric_values.argmax()
+        if metric_values[i] > this_metric['highest']:
+            this_metric['highest'] = float(metric_values[i])
+            this_metric['highest_combo'] = tuple(g_nodes[j] for j in combos[i])
+        if median:
+            this_metric['sketch'].update(metric_values)
+        this_metric['sum'] += float(metric_values.sum())
+        this_metric['num'] += len(metric_values)
+    for front in metric_data.get('pareto', []):
+        front.update_block(values, combos)
+
+    if write_dist and isinstance(distribution, DistWriter):
+        distribution.append(point_ids, combos, values)
+    elif write_dist:
+        for i, combo_index in enumerate(combos):
+            json_entry = {'id': int(point_ids[i])}
+            for metric in metrics:
+                json_entry[metric] = float(values[metric][i])
+            if write_combos:
+                json_entry['combo'] = tuple(g_nodes[j] for j in combo_index)
+            distribution.append(json_entry)
+
+
+def handle_combo_range(lo, hi, combo_size, metrics, median, write_combos, write_dist, point_id, incremental = False, checkpoint = True):
+    '''Handle processing for the combinations with ranks in [lo, hi).
+
+    Ranks are lexicographic, or revolving-door ranks with incremental set;
+    either way, only the combinations in range are enumerated.
+
+    With checkpoints enabled (and checkpoint set), progress is saved every
+    CHECKPOINT_INTERVAL seconds, and a saved range starting at lo is picked
+    up where it stopped.
+
+    Returns list with two (merged) elements:
+        metric_data: dict of aggregated data, keyed by metric
+        distribution: list of per-combo JSON entries, or a flushed DistWriter
+    '''
+    metric_data = init_metric_data(metrics, median)
+    distribution = init_distribution(combo_size, metrics, write_combos)
+    checkpoint = checkpoint and g_checkpoint_path
+    start = lo
+    if checkpoint:
+        record = load_checkpoint_range(combo_size, lo, hi, point_id)
+        if record:
+            start = record['next']
+            metric_data = record['metric_data']
+            distribution = record['distribution']
+    last_checkpoint = time.time()
+    for combos, values, durations, ranks in range_blocks(combo_size, start, hi, incremental):
+        process_block(metrics, median, write_combos, write_dist, combos,
+                      values, durations, point_id + ranks, distribution,
+                      metric_data)
+        if checkpoint and time.time() - last_checkpoint >= CHECKPOINT_INTERVAL:
+            flush_distribution(distribution)
+            checkpoint_lib.save_range(g_checkpoint_path, combo_size, lo,
+                                      ranks[-1] + 1, metric_data, distribution)
+            last_checkpoint = time.time()
+    flush_distribution(distribution)
     return [metric_data, distribution]
 
 
-def handle_combos_all(process_index, processes, combo_size, metrics, median, write_combos, write_dist, point_id):
+def range_blocks(combo_size, lo, hi, incremental):
+    '''Yield blocks of evaluated combos with ranks in [lo, hi).
+
+    @return blocks: iterator of (combos, values, durations, ranks), with
+        combos, values and durations as for handle_block.
+    '''
+    if incremental:
+        for block in incremental_blocks(combo_size, lo, hi):
+            yield block
+        return
+    for combos in combo_blocks(len(g_nodes), combo_size, lo = lo, hi = hi):
+        values, durations = handle_block(combos)
+        yield combos, values, durations, numpy.arange(lo, lo + len(combos))
+        lo += len(combos)
+
+
+def load_checkpoint_range(combo_size, lo, hi, point_id):
+    '''Return the saved range record for ranks [lo, hi), if any.
+
+    Distribution chunks written after the record was saved are dropped, as
+    those rows will be evaluated again.
+    '''
+    record = checkpoint_lib.load_range(g_checkpoint_path, combo_size, lo, hi)
+    if g_dist_path:
+        start = record['next'] if record else lo
+        distribution_lib.drop_chunks(g_dist_path, combo_size,
+                                     point_id + start, point_id + hi)
+    return record
+
+
+def handle_combos_all(process_index, processes, combo_size, metrics, median, write_combos, write_dist, point_id, incremental = False):
     '''Handle processing for an even fraction of all combinations.
 
+    Each process takes a contiguous range of combo ranks.
+
     Returns list with two (merged) elements:
-        combo: list
-        values: dict of metric, (value, duration) tuples.
+        metric_data: dict of aggregated data, keyed by metric
+        distribution: list of per-combo JSON entries, or a flushed DistWriter
     '''
-    metric_data = init_metric_data(metrics, median)
-    distribution = init_distribution()
-    for combo in combinations(g_g.nodes(), combo_size):
-        if (point_id % processes) == process_index:
-            values = {}
-            for metric in g_metrics:
-                start_time = time.time()
-                metric_value = METRIC_FCNS[metric](g_g, combo, g_apsp, g_apsp_paths,
-                                                   g_weighted, g_extra_params)
-                duration = time.time() - start_time
-                values[metric] = (metric_value, duration)
-            process_result(metrics, median, write_combos, write_dist, combo, values, point_id, distribution, metric_data)
-        point_id += 1
-    return [metric_data, distribution]
+    total = choose(len(g_nodes), combo_size)
+    lo = total * process_index / processes
+    hi = total * (process_index + 1) / processes
+    return handle_combo_range(lo, hi, combo_size, metrics, median, write_combos,
+                              write_dist, point_id, incremental)
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+
+def print_progress(combo_size, done, total, elapsed, resumed = 0):
+    '''Print throughput and ETA for one combo size.
+
+    @param resumed: combos done before this run, from a checkpoint
+    '''
+    rate = (done - resumed) / elapsed if elapsed > 0 else 0.0
+    line = "k=%s: %d/%d combos (%0.1f%%), %0.0f combos/s" % (
+        combo_size, done, total, 100.0 * done / total, rate)
+    if done < total and rate > 0:
+        line += ", ETA %s" % format_seconds((total - done) / rate)
+    elif done == total:
+        line += ", took %s" % format_seconds(elapsed)
+    print line
+
+
+def run_combo_ranges(pool, processes, combo_size, metrics, median, write_combos,
+                     write_dist, point_id, block_size, incremental,
+                     metric_data, distribution):
+    '''Evaluate all combinations of one size with a dynamic schedule.
+
+    Rank ranges go out to the pool a few per process, so an idle worker
+    always has a task to pull, and results stream back as they finish.
+    Range sizes adapt to the observed per-combo duration so each task takes
+    about TASK_SECONDS, shrinking towards the end so the workers finish
+    together.  Results merge in rank order, so they match a serial run, and
+    the merged prefix of ranks is what gets checkpointed.
+
+    @param block_size: combos in each range until a duration is observed
+    @param metric_data: aggregated data to merge into
+    @param distribution: distribution to merge into
+    '''
+    total = choose(len(g_nodes), combo_size)
+    results = Queue.Queue()
+    tasks = []  # AsyncResults, checked for errors when waiting
+    finished = {}  # lo: result, for results not yet merged
+    next_lo = 0  # First rank not yet dispatched
+    if g_checkpoint_path:
+        record = load_checkpoint_range(combo_size, 0, total, point_id)
+        if record:
+            merge_metric_data(metric_data, record['metric_data'], metrics, median)
+            merge_distribution(distribution, record['distribution'])
+            next_lo = record['next']
+    merged_lo = next_lo  # First rank not yet merged
+    resumed = next_lo
+    in_flight = 0
+    done = 0
+    duration = 0.0  # Total metric duration of the combos done
+    start_time = time.time()
+    last_report = start_time
+    last_checkpoint = start_time
+    while merged_lo < total:
+        while next_lo < total and in_flight < processes * TASKS_PER_PROCESS:
+            if done:
+                block_size = int(TASK_SECONDS * done / max(duration, 1e-9))
+            remaining = total - next_lo
+            size = min(max(block_size, 1), MAX_TASK_COMBOS,
+                       max(remaining / (processes * TASKS_PER_PROCESS), 1))
+            hi = min(next_lo + size, total)
+            # Callbacks run in a pool thread in this process.
+            callback = lambda result, lo = next_lo, hi = hi: results.put((lo, hi, result))
+            tasks.append(pool.apply_async(handle_combo_range,
+                (next_lo, hi, combo_size, metrics, median, write_combos,
+                 write_dist, point_id, incremental, False), callback = callback))
+            next_lo = hi
+            in_flight += 1
+
+        try:
+            lo, hi, (metric_data_in, distribution_in) = results.get(timeout = RESULTS_TIMEOUT)
+        except Queue.Empty:
+            # A failed task never calls back; re-raise its exception here.
+            for task in tasks:
+                if task.ready() and not task.successful():
+                    task.get()
+            tasks = [task for task in tasks if not task.ready()]
+            continue
+        in_flight -= 1
+        done += hi - lo
+        duration += sum(metric_data_in[metric]['duration'] for metric in metrics)
+        finished[lo] = (hi, metric_data_in, distribution_in)
+        while merged_lo in finished:
+            hi, metric_data_in, distribution_in = finished.pop(merged_lo)
+            merge_metric_data(metric_data, metric_data_in, metrics, median)
+            merge_distribution(distribution, distribution_in)
+            merged_lo = hi
+
+        now = time.time()
+        if now - last_report >= PROGRESS_INTERVAL and merged_lo < total:
+            print_progress(combo_size, resumed + done, total, now - start_time,
+                           resumed)
+            last_report = now
+        if g_checkpoint_path and now - last_checkpoint >= CHECKPOINT_INTERVAL:
+            checkpoint_lib.save_range(g_checkpoint_path, combo_size, 0,
+                                      merged_lo, metric_data, distribution)
+            last_checkpoint = now
 
 
 def init_metric_data(metrics, median):
@@ -531,14 +991,25 @@ def init_metric_data(metrics, median):
         this_metric['sum'] = 0.0
         this_metric['num'] = 0
         if median:
-            this_metric['values'] = []
+            this_metric['sketch'] = QuantileSketch()
+    if g_pareto:
+        metric_data['pareto'] = [ParetoFront(front) for front in g_pareto]
     return metric_data
 
 
-def init_distribution():
+def init_distribution(combo_size, metrics, write_combos):
+    if g_dist_path:
+        # Columns on disk, appended to as we go.
+        return DistWriter(g_dist_path, combo_size, metrics, write_combos)
     return [] # list of {combo, key:value}'s in JSON, per combo
 
 
+def flush_distribution(distribution):
+    '''Write out buffered rows, before returning a distribution to merge.'''
+    if isinstance(distribution, DistWriter):
+        distribution.flush()
+
+
 def merge_metric_data(metric_data, metric_data_in, metrics, median):
     for metric in metrics:
         this_metric = metric_data[metric]
@@ -553,17 +1024,59 @@ def merge_metric_data(metric_data, metric_data_in, metrics, median):
         this_metric['sum'] += this_metric_in['sum']
         this_metric['num'] += this_metric_in['num']
         if median:
-            this_metric['values'] += this_metric_in['values']
+            this_metric['sketch'].merge(this_metric_in['sketch'])
+    for front, front_in in zip(metric_data.get('pareto', []),
+                               metric_data_in.get('pareto', [])):
+        front.merge(front_in)
 
 
 def merge_distribution(distribution, distribution_in):
-    distribution += distribution_in
+    if isinstance(distribution, DistWriter):
+        # Rows are already on disk.
+        distribution.merge(distribution_in)
+    else:
+        distribution += distribution_in
+
+
+def init_worker(dirname, nodes, metrics, weighted, extra_params, dist_path,
+                checkpoint_path, pareto):
+    '''Pool initializer: attach to the graph data published by run_all_combos.
+
+    Replaces the inherited globals with read-only views of the shared arrays,
+    so the worker never touches (and copies) the parent's apsp dicts.
+    '''
+    global g_metrics
+    global g_g
+    global g_nodes
+    global g_apsp
+    global g_apsp_paths
+    global g_weighted
+    global g_extra_params
+    global g_dist_path
+    global g_checkpoint_path
+    global g_pareto
+
+    # Full collections walk every object inherited from the parent, which
+    # dirties (and so copies) the pages holding them; only collect young ones.
+    threshold0, threshold1, threshold2 = gc.get_threshold()
+    gc.set_threshold(threshold0, threshold1, 1 << 30)
+    g_g, dm, g_apsp, g_apsp_paths = attach_graph(dirname, nodes)
+    cache_dist_matrix(g_g, g_apsp, dm)
+    g_nodes = nodes
+    g_metrics = metrics
+    g_weighted = weighted
+    g_extra_params = extra_params
+    g_dist_path = dist_path
+    g_checkpoint_path = checkpoint_path
+    g_pareto = pareto
 
 
 def run_all_combos(metrics, g, controllers, data, apsp, apsp_paths,
                    weighted = False, write_dist = False, write_combos = False,
                    extra_params = None, processes = None, multiprocess = False,
-                   chunksize = 1, median = False):
+                   chunksize = 1, median = False, incremental = False,
+                   dist_format = 'json', dist_path = None,
+                   checkpoint_path = None, resume = False, pareto = None):
     '''Compute best, worst, and mean/median latencies, plus fairness.
 
     @param metrics: metrics to compute: in ['latency', 'fairness']
@@ -579,153 +1092,200 @@ def run_all_combos(metrics, g, controllers, data, apsp, apsp_paths,
         availability is parameterized by failure probabilities.
     @param processes: number of workers in pool
     @param multiprocess: use multiple processes?
-    @param chunksize: chunksize for multiprocess map
+    @param chunksize: combos per task for fine-grained multiprocessing, until
+        task durations are observed
+    @param median: compute median?
+    @param incremental: enumerate combos in revolving-door order and update
+        latency-style metrics incrementally?
+    @param dist_format: distribution format, in DIST_FORMATS: 'json' stores
+        the distribution in data; 'npy' writes columns to dist_path and
+        stores a reference to them.
+    @param dist_path: directory for 'npy' distribution columns
+    @param checkpoint_path: directory to save progress in, so an interrupted
+        run can be resumed; removed once the run completes.
+    @param resume: pick up from the checkpoint in checkpoint_path?
+    @param pareto: list of metric lists, each of two or three of metrics, to
+        keep the Pareto front of for each combo size; see pareto_lib.
     '''
     
-    # Ugly hack to effectively write our reused objects to shared memory
+    # Globals for serial runs; pool workers attach to shared copies instead.
     global g_metrics
     global g_g
+    global g_nodes
     global g_apsp
     global g_apsp_paths
     global g_weighted
     global g_extra_params
+    global g_dist_path
+    global g_checkpoint_path
+    global g_pareto
     
     g_metrics = metrics
     g_g = g
+    g_nodes = g.nodes()
     g_apsp = apsp
     g_apsp_paths = apsp_paths
     g_weighted = weighted
     g_extra_params = extra_params
+    g_dist_path = None
+    if write_dist and dist_format == 'npy':
+        if not dist_path:
+            raise Exception("npy distribution requires a dist_path")
+        distribution_lib.init_dir(dist_path, g_nodes, resume)
+        g_dist_path = dist_path
+    g_pareto = [list(front) for front in pareto or []]
+    for front in g_pareto:
+        if not set(front) <= set(metrics):
+            raise Exception("Pareto metrics %s not in metrics %s" %
+                            (front, metrics))
+
+    completed = {}
+    g_checkpoint_path = checkpoint_path
+    if checkpoint_path:
+        checkpoint_options = {
+            'metrics': metrics,
+            'nodes': g.number_of_nodes(),
+            'weighted': weighted,
+            'write_dist': write_dist,
+            'write_combos': write_combos,
+            'extra_params': extra_params,
+            'median': median,
+            'incremental': incremental,
+            'dist_format': dist_format,
+            'pareto': g_pareto
+        }
+        completed = checkpoint_lib.init_checkpoint(checkpoint_path,
+            checkpoint_options, resume)
+
+    pool = None
+    shared = None
+    try:
+        if multiprocess:
+            # Publish the graph data once; workers map it read-only.
+            shared = publish_graph(g, g_nodes, get_dist_matrix(g, apsp), apsp_paths)
+            pool = multiprocessing.Pool(processes, init_worker,
+                (shared.dirname, g_nodes, metrics, weighted, extra_params,
+                 g_dist_path, g_checkpoint_path, g_pareto))
+
+        point_id = 0  # Unique index for every distribution point written out.
+        data['data'] = {}  # Where all data point & aggregates are stored.
+        for combo_size in sorted(controllers):
+            # compute best location(s) for i controllers.
+
+            print "** combo size: %s" % combo_size
+            start_time = time.time()
+            total = choose(g.number_of_nodes(), combo_size)
 
-    if multiprocess:
-        pool = multiprocessing.Pool(processes)
+            if unicode(combo_size) in completed:
+                print "using checkpointed data"
+                data['data'][unicode(combo_size)] = completed[unicode(combo_size)]
+                point_id += total
+                continue
 
-    point_id = 0  # Unique index for every distribution point written out.
-    data['data'] = {}  # Where all data point & aggregates are stored.
-    for combo_size in sorted(controllers):
-        # compute best location(s) for i controllers.
+            # Initialize metric tracking data
+            metric_data = init_metric_data(metrics, median)
+            distribution = init_distribution(combo_size, metrics, write_combos)
 
-        print "** combo size: %s" % combo_size
+            if multiprocess and COARSE:
 
-        # Initialize metric tracking data
-        metric_data = init_metric_data(metrics, median)
-        distribution = [] # list of {combo, key:value}'s in JSON, per combo
-
-        if multiprocess and COARSE:
-
-            #all_combos = combinations(g.nodes(), combo_size)
-            print "dispatch each thread"
-            results_async = []
-            for p in range(processes):
-                result_async = pool.apply_async(handle_combos_all, (p, processes, combo_size, metrics, median, write_combos, write_dist, point_id))
-                results_async.append(result_async)
-                # handle_combos returns a [metric_data, distribution] result.
-
-            # Wait for results from each thread
-            print "collecting and merging results"
-            results = []
-            for r in results_async:
-                metric_data_in, distribution_in = r.get()
-                assert r.successful()
-                merge_metric_data(metric_data, metric_data_in, metrics, median)
-                merge_distribution(distribution, distribution_in)
-                results.append([metric_data_in, distribution_in])
-
-        elif multiprocess and not COARSE:
-            #results = pool.map(handle_combo, combinations(g.nodes(), combo_size),
-            #                   chunksize)
-            all_combos = combinations(g.nodes(), combo_size)
-            done = False
-            while not done:
-                #print "starting a dispatch round"
-                # Dispatch to each thread up to chunksize
+                #all_combos = combinations(g.nodes(), combo_size)
+                print "dispatch each thread"
                 results_async = []
-                p = 0
-                while p < processes and not done:
-                    for chunk in range(chunksize):
-                        #print "chunk %s id %s" % (chunk, point_id)
-                        combos = []
-                        try:
-                            combos.append(all_combos.next())
-                            point_id += 1
-                        except StopIteration:
-                            done = True
-                        finally:
-                            if combos:
-                                result_async = pool.apply_async(handle_combos, (combos, metrics, median, write_combos, write_dist, point_id))
-                                results_async.append(result_async)
-                            # handle_combos returns a [metric_data, distribution] result.
-                        if done:
-                            break
-                    p += 1
+                for p in range(processes):
+                    result_async = pool.apply_async(handle_combos_all, (p, processes, combo_size, metrics, median, write_combos, write_dist, point_id, incremental))
+                    results_async.append(result_async)
+                    # handle_combos returns a [metric_data, distribution] result.
+
                 # Wait for results from each thread
-                #print "waiting for results"
+                print "collecting and merging results"
                 results = []
                 for r in results_async:
-                    got = r.get()
+                    metric_data_in, distribution_in = r.get()
                     assert r.successful()
-                    results.append(got)
-
-                # Merge results from each thread
-                #print "merging results"
-                for metric_data_in, distribution_in in results:
                     merge_metric_data(metric_data, metric_data_in, metrics, median)
                     merge_distribution(distribution, distribution_in)
+                    results.append([metric_data_in, distribution_in])
+                point_id += total
 
-            #for combo, values in results:
-            #    process_result(combo, values, point_id, distribution, metric_data)
-            #    point_id += 1
-        else:
-            #results = map(handle_combo, combinations(g.nodes(), combo_size))
-            for combo in combinations(g.nodes(), combo_size):
-                combo, values = handle_combo(combo)
-                process_result(metrics, median, write_combos, write_dist, combo, values, point_id, distribution, metric_data)
-                point_id += 1
-
-
-        # Compute summary stats
-        for metric in metrics:
-            this_metric = metric_data[metric]
-            # Previously, we stored all values - but with so many,
-            # the storage of these values must go to disk swap and the CPU
-            # usage drops to 1% waiting on disk.
-            #this_metric['mean'] = sum(this_metric['values']) / len(this_metric['values'])
-            this_metric['mean'] = this_metric['sum'] / float(this_metric['num'])
-            if median:
-                this_metric['median'] = numpy.median(this_metric['values'])
-                del this_metric['values']
-            # Work around Python annoyance where str(set) doesn't work
-            this_metric['lowest_combo'] = list(this_metric['lowest_combo'])
-            this_metric['highest_combo'] = list(this_metric['highest_combo'])
-
-            if PRINT_VERBOSE:
-                print "\t" + "%s" % metric
-                for key in sorted(this_metric.keys()):
-                    if key != 'values':
-                        print "\t\t%s: %s" % (key, this_metric[key])
-
-        data['data'][unicode(combo_size)] = {}
-        group_data = data['data'][unicode(combo_size)]
-        for metric in metrics:
-            group_data[metric] = metric_data[metric]
-        group_data['distribution'] = distribution
+            elif multiprocess and not COARSE:
+                run_combo_ranges(pool, processes, combo_size, metrics, median,
+                                 write_combos, write_dist, point_id, chunksize,
+                                 incremental, metric_data, distribution)
+                point_id += total
+
+            else:
+                metric_data, distribution = handle_combo_range(0, total, combo_size,
+                    metrics, median, write_combos, write_dist, point_id, incremental)
+                point_id += total
+
+            print_progress(combo_size, total, total, time.time() - start_time)
+
+            # Compute summary stats
+            for metric in metrics:
+                this_metric = metric_data[metric]
+                # Previously, we stored all values - but with so many,
+                # the storage of these values must go to disk swap and the CPU
+                # usage drops to 1% waiting on disk.
+                #this_metric['mean'] = sum(this_metric['values']) / len(this_metric['values'])
+                this_metric['mean'] = this_metric['sum'] / float(this_metric['num'])
+                if median:
+                    sketch = this_metric.pop('sketch')
+                    for key, q in QUANTILES:
+                        this_metric[key] = sketch.quantile(q)
+                # Work around Python annoyance where str(set) doesn't work
+                this_metric['lowest_combo'] = list(this_metric['lowest_combo'])
+                this_metric['highest_combo'] = list(this_metric['highest_combo'])
+
+                if PRINT_VERBOSE:
+                    print "\t" + "%s" % metric
+                    for key in sorted(this_metric.keys()):
+                        if key != 'sketch':
+                            print "\t\t%s: %s" % (key, this_metric[key])
+
+            data['data'][unicode(combo_size)] = {}
+            group_data = data['data'][unicode(combo_size)]
+            for metric in metrics:
+                group_data[metric] = metric_data[metric]
+            if isinstance(distribution, DistWriter):
+                distribution.flush()
+                rows = distribution_lib.consolidate(g_dist_path, combo_size)
+                assert rows == distribution.rows
+                group_data['distribution'] = {'format': 'npy', 'path': g_dist_path,
+                                              'rows': rows}
+            else:
+                group_data['distribution'] = distribution
+            if g_pareto:
+                group_data['pareto'] = {}
+                for front in metric_data['pareto']:
+                    group_data['pareto'][front_key(front.metrics)] = front.points(g_nodes)
+
+            if checkpoint_path:
+                checkpoint_lib.save_group(checkpoint_path, combo_size, group_data)
+                checkpoint_lib.clear_ranges(checkpoint_path, combo_size)
+    finally:
+        # Pool cleanup.  According to the Multiprocessing module docs,
+        # this shouldn't be necessary due to automatic GC, but without this
+        # code, worker processes seem to accumulate until you're out of memory.
+        # Even if it's just a slow GC performance bug and not a correctness one,
+        # it helps run the code on smaller VMs and should help performance a bit.
+        # Runs on errors too, so no workers or published arrays are left behind.
+        if pool:
+            print "terminating pool"
+            pool.terminate()
+            print "joining pool"
+            pool.join()
+        if shared:
+            shared.close()
 
     data['metric'] = metrics
     data['group'] = [str(c) for c in controllers]
 
-    # Pool cleanup.  According to the Multiprocessing module docs,
-    # this shouldn't be necessary due to automatic GC, but without this
-    # code, worker processes seem to accumulate until you're out of memory.
-    # Even if it's just a slow GC performance bug and not a correctness one,
-    # it helps run the code on smaller VMs and should help performance a bit.
-    if multiprocess:
-        print "terminating pool"
-        pool.terminate()
-        print "joining pool"
-        pool.join()
+    if checkpoint_path:
+        checkpoint_lib.remove_checkpoint(checkpoint_path)
 
 
-def run_best_n(data, g, apsp, n, weighted):
+def run_best_n(data, g, apsp, n, weighted, metric = 'latency',
+               apsp_paths = None, extra_params = None, seed = SEED):
     '''Use best of n runs
 
     @param data: JSON data on which to append
@@ -733,75 +1293,79 @@ def run_best_n(data, g, apsp, n, weighted):
     @param apsp: all-pairs shortest data
     @param n: number of combinations to try
     @param weighted: is graph weighted?
+    @param metric: metric to score combinations by, in METRIC_FCNS
+    @param apsp_paths: all-pairs shortest paths path data, for path metrics
+    @param extra_params: extra params for metrics; see run_all_combos
+    @param seed: random seed
 
     Randomly computes n possibilities and chooses the best one.
     '''
-    def iter_fcn(combo_size, soln):
-        '''Construct custom iter fcn.
+    run_random_n(data, g, apsp, n, weighted, "best-n-" + str(n), False,
+                 metric, apsp_paths, extra_params, seed)
 
-        @param combo_size
-        @param soln: partial, greedily-built sol'n.
-        @return choice: node selection.
-        '''
-        best_next_combo_path_len_total = BIG
-        best_next_combo = None
-        for i in range(n):
-
-            combo = random_combination(g.nodes(), combo_size)
-            # oddly, tuples don't automatically print.
-            # convert to array to get past this issue.
-            combo = [c for c in combo]
-            if n < 5:
-                print "random combo: %s" % combo
-
-            path_len_total = get_total_path_len(g, combo, apsp, weighted)
-
-            if path_len_total < best_next_combo_path_len_total:
-                best_next_combo_path_len_total = path_len_total
-                best_next_combo = combo
-    
-        return best_next_combo
 
-    run_alg(data, g, "best-n-" + str(n), "latency", iter_fcn, apsp, weighted)
-    
-
-def run_worst_n(data, g, apsp, n, weighted):
+def run_worst_n(data, g, apsp, n, weighted, metric = 'latency',
+                apsp_paths = None, extra_params = None, seed = SEED):
     '''Use worst of n runs
 
     @param data: JSON data on which to append
     @param g: NetworkX graph
     @param apsp: all-pairs shortest data
     @param n: number of combinations to try
+    @param metric: metric to score combinations by, in METRIC_FCNS
+    @param apsp_paths: all-pairs shortest paths path data, for path metrics
+    @param extra_params: extra params for metrics; see run_all_combos
+    @param seed: random seed
 
     Randomly computes n possibilities and chooses the worst one.
     '''
+    run_random_n(data, g, apsp, n, weighted, "worst-n-" + str(n), True,
+                 metric, apsp_paths, extra_params, seed)
+
+
+def run_random_n(data, g, apsp, n, weighted, alg, worst, metric, apsp_paths,
+                 extra_params, seed):
+    '''Pick the best or worst of n random combinations, for each size.
+
+    The n combinations for a size are drawn as one array and scored with
+    evaluate_block, in blocks of at most MAX_SAMPLE_ELEMENTS distances.
+    Metrics other than latency are recorded under their own name, with the
+    metric appended to alg.
+
+    @param alg: algorithm name
+    @param worst: pick the worst combination, rather than the best?
+    Other params as for run_best_n.
+    '''
+    nodes = g.nodes()
+    random = numpy.random.RandomState(seed)
+    # Higher values are better for some metrics.
+    highest = (metric in MAXIMIZE) != worst
+
     def iter_fcn(combo_size, soln):
         '''Construct custom iter fcn.
 
         @param combo_size
-        @param soln: partial, greedily-built sol'n.
-        @return choice: node selection.
+        @param soln: last sol'n, unused.
+        @return choice: best or worst combo of n.
         '''
-        worst_next_combo_path_len_total = -BIG
-        worst_next_combo = None
-        for i in range(n):
-
-            combo = random_combination(g.nodes(), combo_size)
-            # oddly, tuples don't automatically print.
-            # convert to array to get past this issue.
-            combo = [c for c in combo]
-            if n < 5:
-                print "random combo: %s" % combo
-
-            path_len_total = get_total_path_len(g, combo, apsp, weighted)
-
-            if path_len_total > worst_next_combo_path_len_total:
-                worst_next_combo_path_len_total = path_len_total
-                worst_next_combo = combo
-    
-        return worst_next_combo
+        combos = random_combos(len(nodes), combo_size, n, random)
+        rows = max(MAX_SAMPLE_ELEMENTS / (combo_size * len(nodes)), 1)
+        values = numpy.concatenate([evaluate_block(g, nodes, combos[i:i + rows],
+            [metric], apsp, apsp_paths, weighted, extra_params)[0][metric]
+            for i in range(0, n, rows)])
+        if highest:
+            choice = values.argmax()
+        else:
+            choice = values.argmin()
+        return [nodes[j] for j in combos[choice]]
 
-    run_alg(data, g, "worst-n-" + str(n), "latency", iter_fcn, apsp, weighted)
+    if metric == 'latency':
+        run_alg(data, g, alg, metric, iter_fcn, apsp, weighted)
+    else:
+        value_fcn = lambda soln: METRIC_FCNS[metric](g, soln, apsp,
+            apsp_paths, weighted, extra_params)
+        run_alg(data, g, alg + "-" + metric, metric, iter_fcn, apsp, weighted,
+                value_fcn = value_fcn)
 
 
 def run_greedy_informed(data, g, apsp, weighted):
@@ -812,8 +1376,11 @@ def run_greedy_informed(data, g, apsp, weighted):
     @param apsp: all-pairs shortest data
     @param weighted: is graph weighted?
 
-    Re-calculates best value at each step, given the previous sol'n of size n-1.
+    Picks the best value at each step, given the previous sol'n of size n-1,
+    with lazy gain updates; see placement_lib.lazy_greedy.
     '''
+    dm = get_dist_matrix(g, apsp)
+    order = lazy_greedy(dm.dist)
     def greedy_choice(combo_size, soln):
         '''Construct custom greedy choice fcn.
 
@@ -821,18 +1388,7 @@ def run_greedy_informed(data, g, apsp, weighted):
         @param soln: partial, greedily-built sol'n.
         @return choice: node selection.
         '''
-        best_next_choice_path_len_total = BIG
-        best_next_choice = None
-        for n in [n for n in g.nodes() if n not in soln]:
-
-            path_len_total = get_total_path_len(g, soln + [n], apsp, weighted)
-            #print n, path_len_total, greedy_informed + [n]
-    
-            if path_len_total < best_next_choice_path_len_total:
-                best_next_choice_path_len_total = path_len_total
-                best_next_choice = n
-    
-        return best_next_choice
+        return dm.nodes[next(order)]
 
     run_greedy_alg(data, g, "greedy-informed", "latency", greedy_choice, apsp, weighted)
 
@@ -894,7 +1450,7 @@ def run_greedy_alg(data, g, alg, param_name, greedy_choice, apsp, weighted,
 
 
 def run_alg(data, g, alg, param_name, iter_fcn, apsp, weighted,
-                   max_iters = None):
+                   max_iters = None, value_fcn = None):
     '''Run an iterative algorithm for optimizing latency.
 
     @param data: JSON data to append to, keyed by id (0...n)
@@ -909,6 +1465,8 @@ def run_alg(data, g, alg, param_name, iter_fcn, apsp, weighted,
     @param apsp: all-pairs shortest data
     @param weighted: is graph weighted?
     @param max_iters: maximum iterations; do all if falsy
+    @param value_fcn: fcn(soln) returning the value to record under
+        param_name; average latency if None
     '''
     soln = []
     for combo_size in range(1, g.number_of_nodes() + 1):
@@ -919,14 +1477,17 @@ def run_alg(data, g, alg, param_name, iter_fcn, apsp, weighted,
         soln = iter_fcn(combo_size, soln)
         duration = time.time() - start
 
-        path_len_total = get_total_path_len(g, soln, apsp, weighted)
-
-        path_len = path_len_total / float(g.number_of_nodes())
-        if str(combo_size) in data and "opt" in data[str(combo_size)]:
-            if data[str(combo_size)]["opt"]["latency"] == 0:
+        if value_fcn:
+            path_len = value_fcn(soln)
+        else:
+            path_len_total = get_total_path_len(g, soln, apsp, weighted)
+            path_len = path_len_total / float(g.number_of_nodes())
+        if (str(combo_size) in data and "opt" in data[str(combo_size)] and
+            param_name in data[str(combo_size)]["opt"]):
+            if data[str(combo_size)]["opt"][param_name] == 0:
                 ratio = 1
             else:
-                ratio = path_len / data[str(combo_size)]["opt"]["latency"]
+                ratio = path_len / data[str(combo_size)]["opt"][param_name]
         else:
             ratio = 0    
 
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+'''Pareto fronts of combos over two or three metrics, kept online.
+
+Rather than sorting the full distribution after the fact, each worker keeps
+the non-dominated combos of every block it evaluates, and fronts from
+workers merge into one.  Stored fronts are all the Pareto plots need, so
+they no longer require the distribution to be written out.
+
+Stored form, in the data for each group:
+    pareto: dict of front key (see front_key) to a list of points, each a
+        dict of metric to value, plus the combo, as for distribution entries.
+'''
+
+import numpy
+
+from distribution_lib import get_distribution
+
+# Metrics where higher is better; all others are minimized.
+MAXIMIZE = ['fairness', 'availability', 'availability_ci', 'availability_any']
+
+# Rows to compare at once, to bound (rows, points) comparison arrays.
+CHUNK_ROWS = 256
+
+
+def front_key(metrics):
+    '''Return the key of the front for a list of metrics.'''
+    return ','.join(metrics)
+
+
+def weakly_dominates(a, b):
+    '''Return (len(a), len(b)) bool array: is a[i] <= b[j] in every column?
+
+    Compares one column at a time, which is much faster than reducing over a
+    short trailing axis.
+    '''
+    result = a[:, 0, numpy.newaxis] <= b[numpy.newaxis, :, 0]
+    for i in range(1, a.shape[1]):
+        result &= a[:, i, numpy.newaxis] <= b[numpy.newaxis, :, i]
+    return result
+
+
+def non_dominated(points):
+    '''Return indices of the non-dominated rows of points, minimizing.
+
+    In lexicographic order, a row can only be dominated by a row before it,
+    so each row is checked against earlier ones alone.  Of equal rows, only
+    the first is kept.  The lexicographic minimum under each rotation of the
+    columns is never dominated; pruning with those first leaves few rows for
+    the pairwise check, which is exact against the survivors only, since
+    dominance is transitive.
+
+    @param points: (m, d) array
+    @return indices: sorted int array of row indices
+    '''
+    points = numpy.asarray(points, dtype = float)
+    m, d = points.shape
+    if m == 0:
+        return numpy.zeros(0, dtype = numpy.intp)
+    order = numpy.lexsort(points.T[::-1])
+    ranked = points[order]
+    position = numpy.empty(m, dtype = numpy.intp)
+    position[order] = numpy.arange(m)
+    seeds = numpy.unique([position[numpy.lexsort(numpy.roll(points, -i, axis = 1).T[::-1])[0]]
+                          for i in range(d)])
+    dominated = weakly_dominates(ranked[seeds], ranked)
+    dominated &= seeds[:, numpy.newaxis] < numpy.arange(m)
+    survivors = numpy.flatnonzero(~dominated.any(axis = 0))
+    keep = numpy.ones(len(survivors), dtype = bool)
+    for lo in range(0, len(survivors), CHUNK_ROWS):
+        rows = ranked[survivors[lo:lo + CHUNK_ROWS]]
+        earlier = ranked[survivors[:lo + CHUNK_ROWS]]
+        # dominates[i, j]: survivor j weakly dominates row i.
+        dominates = weakly_dominates(earlier, rows).T
+        dominates &= numpy.tri(len(rows), len(earlier), lo - 1, dtype = bool)
+        keep[lo:lo + CHUNK_ROWS] = ~dominates.any(axis = 1)
+    return numpy.sort(order[survivors[keep]])
+
+
+class ParetoFront(object):
+    '''Non-dominated combos for two or three metrics.
+
+    Combos are kept as arrays of node indices, so fronts stay small to pass
+    between workers; points keep the order they were added in, so fronts
+    merged in rank order match a serial run.
+    '''
+
+    def __init__(self, metrics):
+        '''
+        @param metrics: list of two or three metrics
+        '''
+        if len(metrics) not in [2, 3]:
+            raise Exception("Pareto front needs two or three metrics: %s" %
+                            metrics)
+        self.metrics = list(metrics)
+        self.signs = numpy.array([-1.0 if metric in MAXIMIZE else 1.0
+                                  for metric in metrics])
+        self.values = numpy.zeros((0, len(metrics)))
+        self.combos = None
+
+    def update(self, values, combos):
+        '''Add a block of combos, keeping only the non-dominated ones.
+
+        @param values: (B, d) array of values, one column per metric
+        @param combos: (B, k) array of node indices
+        '''
+        values = numpy.asarray(values, dtype = float)
+        combos = numpy.asarray(combos)
+        if self.combos is not None:
+            # Most new combos are dominated by (or tie with) a point already
+            # on the front, which comes first; drop those before sorting.
+            signed = values * self.signs
+            front = self.values * self.signs
+            dominated = numpy.zeros(len(values), dtype = bool)
+            for lo in range(0, len(front), CHUNK_ROWS):
+                dominated |= weakly_dominates(front[lo:lo + CHUNK_ROWS],
+                                              signed).any(axis = 0)
+            values = numpy.vstack([self.values, values[~dominated]])
+            combos = numpy.vstack([self.combos, combos[~dominated]])
+        keep = non_dominated(values * self.signs)
+        self.values = values[keep]
+        self.combos = combos[keep]
+
+    def update_block(self, values, combos):
+        '''Add a block as evaluated by handle_block.
+
+        @param values: dict of metric to (B,) array of values
+        @param combos: (B, k) array of node indices
+        '''
+        self.update(numpy.column_stack([values[metric] for metric in self.metrics]),
+                    combos)
+
+    def merge(self, other):
+        '''Merge in a front over later combos.'''
+        if other.combos is not None:
+            self.update(other.values, other.combos)
+
+    def points(self, nodes):
+        '''Return the front as a list of JSON points.
+
+        @param nodes: node names, indexed by combos
+        '''
+        points = []
+        if self.combos is None:
+            return points
+        for row, combo in zip(self.values.tolist(), self.combos.tolist()):
+            point = dict(zip(self.metrics, row))
+            point['combo'] = [nodes[i] for i in combo]
+            points.append(point)
+        return points
+
+
+def get_pareto(stats, group, metrics):
+    '''Return columns holding the Pareto front of a group, for plotting.
+
+    Uses a stored front over the metrics, or over a superset of them: every
+    point on the front of a subset of metrics is on the front of the
+    superset too (up to ties), so filtering again yields the subset front.
+    Without a stored front, falls back to the full distribution.
+
+    @param stats: JSON data from metrics
+    @param group: number of controllers, as a string key
+    @param metrics: metrics to return columns for
+    @return columns: dict of metric (and 'combo') to values, as for
+        distribution_lib.get_distribution
+    '''
+    fronts = stats['data'][group].get('pareto', {})
+    for key in sorted(fronts, key = len):
+        if set(metrics) <= set(key.split(',')):
+            columns = {'combo': [point['combo'] for point in fronts[key]]}
+            for metric in key.split(','):
+                columns[metric] = numpy.array([point[metric]
+                                               for point in fronts[key]])
+            return columns
+    return get_distribution(stats, group)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+'''Compact all-pairs shortest paths as a predecessor matrix.
+
+nx.all_pairs_dijkstra_path stores an explicit node list for each of the n^2
+pairs.  Shortest paths from one source form a tree, so a row of node indices
+per source (each node's predecessor on its path from that source) holds the
+same information.  The edges along every path are precomputed once, in
+CSR form, so path-based metrics become gathers and bincounts over edge ids.
+'''
+
+import networkx as nx
+import numpy
+
+
+class PathMatrix(object):
+    '''All-pairs shortest paths with a pair-to-edge incidence.
+
+    pred[s][t] is the matrix index of the node before nodes[t] on the path
+    from nodes[s], or -1 when t == s or t is unreachable.  The ids of the
+    edges along the path from s to t, in order, are
+    pair_edges[pair_offsets[s * n + t]:pair_offsets[s * n + t + 1]], where
+    edge ids index into edges.
+
+    Also works as a read-only apsp_paths: pm[src][dst] is a list of nodes.
+    '''
+
+    def __init__(self, nodes, edges, pred, pair_offsets, pair_edges):
+        '''
+        @param nodes: list of node names, in matrix order
+        @param edges: list of (src, dst) node name pairs
+        @param pred: n x n int NumPy predecessor matrix
+        @param pair_offsets: (n * n + 1,) int NumPy array
+        @param pair_edges: int NumPy array of edge ids
+        '''
+        self.nodes = nodes
+        self.index = dict((v, i) for i, v in enumerate(nodes))
+        self.edges = edges
+        self.edge_index = {}
+        for i, (src, dst) in enumerate(edges):
+            self.edge_index[(src, dst)] = i
+            self.edge_index[(dst, src)] = i
+        self.pred = pred
+        self.pair_offsets = pair_offsets
+        self.pair_edges = pair_edges
+
+    def iter_path(self, src, dst):
+        '''Yield matrix indices of the nodes on a path, from dst back to src.'''
+        pred = self.pred[src]
+        yield dst
+        while dst != src:
+            dst = pred[dst]
+            if dst < 0:
+                raise KeyError(self.nodes[src])
+            yield dst
+
+    def path(self, src, dst):
+        '''Return list of matrix indices on the path from src to dst.'''
+        path = list(self.iter_path(src, dst))
+        path.reverse()
+        return path
+
+    def path_edges(self, src, dst):
+        '''Return array of edge ids on the path from src to dst.'''
+        k = src * len(self.nodes) + dst
+        return self.pair_edges[self.pair_offsets[k]:self.pair_offsets[k + 1]]
+
+    def gather_edges(self, srcs, dsts):
+        '''Return the edge ids along many paths at once.
+
+        @param srcs: int array of source matrix indices
+        @param dsts: int array of destination matrix indices
+        @return edge_ids: concatenated edge ids for every path
+        @return owner: for each entry in edge_ids, its position in srcs
+        '''
+        pairs = numpy.asarray(srcs) * len(self.nodes) + numpy.asarray(dsts)
+        starts = self.pair_offsets[pairs]
+        lengths = self.pair_offsets[pairs + 1] - starts
+        owner = numpy.repeat(numpy.arange(len(pairs)), lengths)
+        # Position of each entry within its own path.
+        within = numpy.arange(len(owner)) - numpy.repeat(lengths.cumsum() - lengths, lengths)
+        return self.pair_edges[starts[owner] + within], owner
+
+    def edge_ids(self, links):
+        '''Return int array of edge ids for (src, dst) node name pairs.'''
+        return numpy.array([self.edge_index[link] for link in links],
+                           dtype = numpy.intp)
+
+    def __getitem__(self, src):
+        return _PathRow(self, self.index[src])
+
+    def __contains__(self, src):
+        return src in self.index
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+
+class _PathRow(object):
+
+    def __init__(self, parent, src):
+        self.parent = parent
+        self.src = src
+
+    def __getitem__(self, dst):
+        nodes = self.parent.nodes
+        return [nodes[i] for i in self.parent.path(self.src, self.parent.index[dst])]
+
+    def get(self, dst, default = None):
+        try:
+            return self[dst]
+        except KeyError:
+            return default
+
+
+def build_path_matrix(nodes, edges, pred):
+    '''Build a PathMatrix, with its edge incidence, from a predecessor matrix.
+
+    @param nodes: list of node names, in matrix order
+    @param edges: list of (src, dst) node name pairs
+    @param pred: n x n int NumPy predecessor matrix
+    @return pm: PathMatrix
+    '''
+    n = len(nodes)
+    index = dict((v, i) for i, v in enumerate(nodes))
+    edge_id = numpy.empty((n, n), dtype = numpy.int32)
+    edge_id.fill(-1)
+    for i, (src, dst) in enumerate(edges):
+        edge_id[index[src], index[dst]] = i
+        edge_id[index[dst], index[src]] = i
+
+    rows = numpy.arange(n)[:, numpy.newaxis]
+    reached = pred >= 0
+    # Edge from each node's predecessor to it, per source.
+    parent_edge = numpy.where(reached, edge_id[numpy.maximum(pred, 0), rows.T], -1)
+
+    # Hops along each path, by walking all paths back a hop at a time.
+    hops = numpy.zeros((n, n), dtype = numpy.intp)
+    cur = numpy.repeat(rows.T, n, axis = 0)
+    walking = reached.copy()
+    while walking.any():
+        hops += walking
+        cur = numpy.where(walking, pred[rows, cur], cur)
+        walking = pred[rows, cur] >= 0
+
+    pair_offsets = numpy.zeros(n * n + 1, dtype = numpy.intp)
+    numpy.cumsum(hops.ravel(), out = pair_offsets[1:])
+    pair_edges = numpy.empty(pair_offsets[-1], dtype = numpy.int32)
+    # Fill each path from its last edge back to its first.
+    ends = pair_offsets[1:].reshape(n, n)
+    cur = numpy.repeat(rows.T, n, axis = 0)
+    for step in range(hops.max() if n else 0):
+        walking = hops > step
+        pair_edges[ends[walking] - 1 - step] = parent_edge[rows, cur][walking]
+        cur = numpy.where(walking, pred[rows, cur], cur)
+
+    return PathMatrix(nodes, edges, pred, pair_offsets, pair_edges)
+
+
+def _pred_dtype(n):
+    return numpy.int16 if n < (1 << 15) else numpy.int32
+
+
+def path_matrix(g, nodes = None, weight = 'weight'):
+    '''Compute a PathMatrix with Dijkstra from each source.
+
+    Paths match nx.all_pairs_dijkstra_path, but only one source's paths are
+    ever held as lists at a time.
+
+    @param g: NetworkX graph
+    @param nodes: list of node names in matrix order; g.nodes() if None
+    @param weight: edge attribute holding the weight
+    @return pm: PathMatrix
+    '''
+    if nodes is None:
+        nodes = g.nodes()
+    index = dict((v, i) for i, v in enumerate(nodes))
+    pred = numpy.empty((len(nodes), len(nodes)), dtype = _pred_dtype(len(nodes)))
+    pred.fill(-1)
+    for i, src in enumerate(nodes):
+        row = pred[i]
+        paths = nx.single_source_dijkstra_path(g, src, weight = weight)
+        for dst, path in paths.iteritems():
+            if len(path) > 1:
+                row[index[dst]] = index[path[-2]]
+    return build_path_matrix(nodes, g.edges(), pred)
+
+
+def path_matrix_from_paths(g, nodes, apsp_paths):
+    '''Convert all-pairs path dicts from NetworkX to a PathMatrix.
+
+    NetworkX extends each path from its predecessor's path, so the paths from
+    each source form a tree and fit in a predecessor matrix.
+
+    @param g: NetworkX graph
+    @param nodes: list of node names, in matrix order
+    @param apsp_paths: all-pairs shortest paths path data
+    @return pm: PathMatrix
+    '''
+    index = dict((v, i) for i, v in enumerate(nodes))
+    pred = numpy.empty((len(nodes), len(nodes)), dtype = _pred_dtype(len(nodes)))
+    pred.fill(-1)
+    for i, src in enumerate(nodes):
+        row = pred[i]
+        for dst, path in apsp_paths[src].iteritems():
+            if len(path) > 1:
+                row[index[dst]] = index[path[-2]]
+    return build_path_matrix(nodes, g.edges(), pred)
+
+
+# Single-entry cache of the last converted apsp_paths, as for
+# matrix_lib.get_dist_matrix.
+_cache = {'g': None, 'apsp_paths': None, 'pm': None}
+
+def get_path_matrix(g, nodes, apsp_paths):
+    '''Return apsp_paths as a (cached) PathMatrix in some node order.
+
+    @param g: NetworkX graph
+    @param nodes: list of node names, in matrix order
+    @param apsp_paths: PathMatrix in that order, or NetworkX path dicts
+    '''
+    if isinstance(apsp_paths, PathMatrix):
+        return apsp_paths
+    if _cache['g'] is not g or _cache['apsp_paths'] is not apsp_paths:
+        _cache['pm'] = path_matrix_from_paths(g, nodes, apsp_paths)
+        _cache['g'] = g
+        _cache['apsp_paths'] = apsp_paths
+    return _cache['pm']
+
+
+def _closest_pairs(dm, combo_index):
+    '''Return each (node, closest controller) pair with its share.
+
+    Nodes equally distant from several controllers split their share
+    equally between them.
+
+    @return srcs: int array of node matrix indices
+    @return dsts: int array of controller matrix indices
+    @return shares: float array
+    '''
+    sub = dm.dist[:, combo_index]
+    ties = (sub == sub.min(axis = 1)[:, numpy.newaxis])
+    srcs, cols = numpy.nonzero(ties)
+    shares = 1.0 / ties.sum(axis = 1)[srcs]
+    return srcs, combo_index[cols], shares
+
+
+def congestion(dm, pm, combo_index):
+    '''Return traffic on the most-loaded link, as a fraction of switches.
+
+    Array version of metrics_lib.most_congested_link.
+
+    @param dm: DistMatrix
+    @param pm: PathMatrix, in the same node order as dm
+    @param combo_index: int array of controller matrix indices
+    @return congestion: fraction of switches' traffic on the link
+    @return link: (src, dst) node pair of the most-loaded link
+    '''
+    srcs, dsts, shares = _closest_pairs(dm, combo_index)
+    edge_ids, owner = pm.gather_edges(srcs, dsts)
+    traffic = numpy.bincount(edge_ids, weights = shares[owner],
+                             minlength = len(pm.edges))
+    e = traffic.argmax()
+    return traffic[e] / float(len(dm.nodes)), pm.edges[e]
+
+
+def batch_congestion(dm, pm, combos):
+    '''Return congestion of a block of combos, with the most-loaded links.
+
+    Each (switch, closest controller, combo) triple adds its share to the
+    links on its path, so one bincount over (combo, edge id) gives every
+    combo's link loads.
+
+    @param dm: DistMatrix
+    @param pm: PathMatrix, in the same node order as dm
+    @param combos: (B, k) NumPy int array of matrix indices
+    @return values: (B,) float array
+    @return edge_ids: (B,) int array of the most-loaded edge ids
+    '''
+    num_edges = len(pm.edges)
+    sub = dm.dist.T[combos]
+    ties = (sub == sub.min(axis = 1)[:, numpy.newaxis, :])
+    rows, slots, srcs = numpy.nonzero(ties)
+    shares = 1.0 / ties.sum(axis = 1)[rows, srcs]
+    edge_ids, owner = pm.gather_edges(srcs, combos[rows, slots])
+    traffic = numpy.bincount(rows[owner] * num_edges + edge_ids,
+                             weights = shares[owner],
+                             minlength = len(combos) * num_edges)
+    traffic = traffic.reshape(len(combos), num_edges)
+    edge_ids = traffic.argmax(axis = 1)
+    values = traffic[numpy.arange(len(combos)), edge_ids] / float(len(dm.nodes))
+    return values, edge_ids
+
+
+def combo_path_edges(dm, pm, combo_index):
+    '''Return ids of the edges on any path from a switch to its controller.
+
+    @param dm: DistMatrix
+    @param pm: PathMatrix, in the same node order as dm
+    @param combo_index: int array of controller matrix indices
+    @return edge_ids: sorted int array of edge ids
+    '''
+    srcs, dsts, shares = _closest_pairs(dm, combo_index)
+    edge_ids, owner = pm.gather_edges(srcs, dsts)
+    return numpy.unique(edge_ids)
+
+
+def connectivity(dm, pm, combo_index, failed_ids):
+    '''Return the fraction of switches whose path to a controller is intact.
+
+    Array version of metrics_lib.connectivity_sssp.
+
+    @param dm: DistMatrix
+    @param pm: PathMatrix, in the same node order as dm
+    @param combo_index: int array of controller matrix indices
+    @param failed_ids: int array of failed edge ids
+    '''
+    srcs, dsts, shares = _closest_pairs(dm, combo_index)
+    edge_ids, owner = pm.gather_edges(srcs, dsts)
+    failed = numpy.zeros(len(pm.edges), dtype = bool)
+    failed[failed_ids] = True
+    blocked = numpy.bincount(owner, weights = failed[edge_ids],
+                             minlength = len(srcs)) > 0
+    return shares[~blocked].sum() / float(len(dm.nodes))
@@ -0,0 +1,581 @@
+#!/usr/bin/env python
+'''Solvers for optimal controller placement.
+
+run_all_combos finds the best placement for a metric by enumerating all
+C(n, k) combos.  The solvers here find the optimum for a single metric
+directly, pruning placements that provably cannot beat the best one found.
+'''
+import heapq
+import logging
+import time
+
+import networkx as nx
+import numpy
+
+from matrix_lib import get_dist_matrix
+from path_matrix_lib import get_path_matrix
+
+lg = logging.getLogger("placement_lib")
+
+# Metrics with an exact branch-and-bound solver.
+BNB_METRICS = ['latency', 'wc_latency']
+
+# Distances become integer min-cost-flow costs up to this, for exactness.
+COST_SCALE = 1 << 24
+
+
+def objective(metric, closest):
+    '''Return metric total for closest-controller distances.
+
+    @param metric: 'latency' (total, not average) or 'wc_latency'
+    @param closest: (n,) or (n, m) array of closest-controller distances;
+        each column is one placement
+    @return total: float, or (m,) array
+    '''
+    if metric == 'latency':
+        return closest.sum(axis = 0)
+    elif metric == 'wc_latency':
+        return closest.max(axis = 0)
+    raise Exception("no objective for metric %s" % metric)
+
+
+def greedy(dist, metric, k):
+    '''Add the controller that most improves the metric, k times.
+
+    @param dist: n x n distance matrix; dist[v][c] is node v to controller c
+    @param metric: metric in BNB_METRICS
+    @param k: number of controllers
+    @return combo: list of matrix indices
+    '''
+    n = dist.shape[0]
+    best = numpy.empty(n)
+    best.fill(numpy.inf)
+    combo = []
+    for i in range(k):
+        values = objective(metric, numpy.minimum(best[:, numpy.newaxis], dist))
+        values[combo] = numpy.inf
+        c = values.argmin()
+        combo.append(c)
+        best = numpy.minimum(best, dist[:, c])
+    return combo
+
+
+def lazy_greedy(dist):
+    '''Yield controllers in greedy order for total latency, lazily.
+
+    Total latency is a facility-location objective: the gain from adding a
+    controller only shrinks as others are added.  A gain computed at an
+    earlier step is therefore an upper bound, and a controller whose fresh
+    gain still tops the heap is the greedy choice, so most gains are never
+    recomputed.  Ties go to the lowest index, as for greedy.
+
+    @param dist: n x n distance matrix; dist[v][c] is node v to controller c
+    @return order: iterator of all n matrix indices
+    '''
+    n = dist.shape[0]
+    # With no controllers yet, there is nothing to gain against.
+    c = dist.sum(axis = 0).argmin()
+    yield c
+    best = dist[:, c].copy()  # Distance from each node to its closest
+    gains = numpy.maximum(best[:, numpy.newaxis] - dist, 0).sum(axis = 0)
+    # Entries are (-gain, controller, # placed when the gain was computed).
+    heap = [(-gains[i], i, 1) for i in range(n) if i != c]
+    heapq.heapify(heap)
+    for placed in range(1, n):
+        while True:
+            gain, c, computed = heapq.heappop(heap)
+            if computed == placed:
+                break
+            gain = numpy.maximum(best - dist[:, c], 0).sum()
+            heapq.heappush(heap, (-gain, c, placed))
+        yield c
+        best = numpy.minimum(best, dist[:, c])
+
+
+def swap_search(dist, metric, combo):
+    '''Improve a placement by swapping single controllers until no swap helps.
+
+    @param dist: n x n distance matrix
+    @param metric: metric in BNB_METRICS
+    @param combo: list of matrix indices for the initial placement
+    @return value: objective value of the final placement
+    @return combo: list of matrix indices for the final placement
+    '''
+    n = dist.shape[0]
+    combo = list(combo)
+    value = objective(metric, dist[:, combo].min(axis = 1))
+    improved = True
+    while improved:
+        improved = False
+        for out in list(combo):
+            rest = [c for c in combo if c != out]
+            if rest:
+                best = dist[:, rest].min(axis = 1)
+            else:
+                best = numpy.empty(n)
+                best.fill(numpy.inf)
+            values = objective(metric, numpy.minimum(best[:, numpy.newaxis], dist))
+            values[combo] = numpy.inf
+            c = values.argmin()
+            if values[c] < value:
+                combo[combo.index(out)] = c
+                value = values[c]
+                improved = True
+    return value, combo
+
+
+# Subgradient iterations for the Lagrangian bound at the root and at each
+# branch-and-bound node, which starts from its parent's multipliers.
+ROOT_ITERATIONS = 200
+NODE_ITERATIONS = 20
+
+
+def _lagrangian_bound(dist, best, r, lam, ub, iterations):
+    '''Lower-bound the total latency when adding r controllers.
+
+    Relaxes the constraint that each node is assigned exactly once, with one
+    multiplier per node.  For fixed multipliers, the relaxed problem opens
+    the r candidates with the most negative reduced costs, and its optimum
+    bounds the real one from below.  Subgradient steps tighten the bound.
+
+    @param dist: (n, m) distances to the remaining candidates
+    @param best: (n,) distances to the already-placed controllers
+    @param r: number of controllers to add
+    @param lam: (n,) initial multipliers
+    @param ub: best total found so far
+    @param iterations: max subgradient steps
+    @return lb: lower bound
+    @return lam: multipliers for the best bound
+    @return rho: (m,) reduced cost of each candidate at those multipliers
+    '''
+    lb_best = -numpy.inf
+    lam_best = rho_best = None
+    step = 2.0
+    stalled = 0
+    for i in range(iterations):
+        below = dist < lam[:, numpy.newaxis]
+        rho = numpy.where(below, dist - lam[:, numpy.newaxis], 0).sum(axis = 0)
+        sel = numpy.argpartition(rho, r - 1)[:r]
+        lb = lam.sum() + numpy.minimum(best - lam, 0).sum() + rho[sel].sum()
+        if lb > lb_best:
+            lb_best, lam_best, rho_best = lb, lam, rho
+            stalled = 0
+        else:
+            stalled += 1
+            if stalled >= 5:
+                step /= 2
+                stalled = 0
+        if lb_best >= ub:
+            break
+        # Each node should be assigned exactly once.
+        grad = 1.0 - (best < lam) - below[:, sel].sum(axis = 1)
+        norm = (grad ** 2).sum()
+        if norm == 0:
+            break
+        lam = lam + step * (ub - lb) / norm * grad
+    return lb_best, lam_best, rho_best
+
+
+def _bnb_latency(dist, k, ub, ub_combo):
+    '''Branch and bound for the k-median (total latency) objective.
+
+    Bounds each node with a Lagrangian relaxation, whose reduced costs also
+    rule candidates in or out without branching on them.  Branches on
+    including or excluding the candidate with the lowest reduced cost.
+    '''
+    n = dist.shape[0]
+    best = numpy.empty(n)
+    best.fill(numpy.inf)
+    # Start with each node's multiplier at its second-closest candidate.
+    lam = numpy.partition(dist, 1, axis = 1)[:, 1]
+    stack = [([], best, numpy.ones(n, dtype = bool), k, lam, ROOT_ITERATIONS)]
+    nodes = 0
+    while stack:
+        chosen, best, cand, r, lam, iterations = stack.pop()
+        nodes += 1
+        if r == 0:
+            value = best.sum()
+            if value < ub:
+                ub, ub_combo = value, chosen
+            continue
+        cand_idx = numpy.flatnonzero(cand)
+        if len(cand_idx) < r:
+            continue
+        sub = dist[:, cand_idx]
+        if len(cand_idx) == r:
+            value = numpy.minimum(best, sub.min(axis = 1)).sum()
+            if value < ub:
+                ub, ub_combo = value, chosen + list(cand_idx)
+            continue
+        lb, lam, rho = _lagrangian_bound(sub, best, r, lam, ub, iterations)
+        if lb >= ub:
+            continue
+        order = rho.argsort()
+        # Forcing a candidate in pushes out the worst selected one, and
+        # forcing one out pulls in the best unselected one.
+        rho_in = rho[order[r - 1]]
+        rho_out = rho[order[r]]
+        excluded = cand_idx[order[r:]][lb + rho[order[r:]] - rho_in >= ub]
+        included = cand_idx[order[:r]][lb - rho[order[:r]] + rho_out >= ub]
+        if len(excluded) or len(included):
+            cand = cand.copy()
+            cand[excluded] = False
+            cand[included] = False
+            if len(included):
+                best = numpy.minimum(best, dist[:, included].min(axis = 1))
+            stack.append((chosen + list(included), best, cand,
+                          r - len(included), lam, NODE_ITERATIONS))
+            continue
+        c = cand_idx[order[0]]
+        rest = cand.copy()
+        rest[c] = False
+        # Explore the include branch first.
+        stack.append((chosen, best, rest, r, lam, NODE_ITERATIONS))
+        stack.append((chosen + [c], numpy.minimum(best, dist[:, c]), rest, r - 1,
+                      lam, NODE_ITERATIONS))
+    lg.debug("latency branch and bound: %s nodes" % nodes)
+    return ub, ub_combo
+
+
+def _popcount(x):
+    return bin(x).count('1')
+
+
+class CoverSets(object):
+    '''Nodes within a latency bound of each candidate controller, as bitsets.
+
+    Bit v of masks[c] is set when node v is within lat_bound of controller c,
+    so a combo covers every node whose bit is set in the OR of its masks.
+    '''
+
+    def __init__(self, dm, lat_bound):
+        '''
+        @param dm: DistMatrix
+        @param lat_bound: max latency from a node to its controller
+        '''
+        self.n = len(dm.nodes)
+        self.lat_bound = lat_bound
+        self.full = (1 << self.n) - 1
+        within = (dm.dist <= lat_bound).astype(numpy.uint8) + ord('0')
+        # Reverse each column so node 0 ends up as the lowest bit.
+        self.masks = [int(col[::-1].tostring(), 2) for col in within.T]
+
+    def covered(self, combo_index):
+        '''Return bitset of nodes within lat_bound of the combo.'''
+        mask = 0
+        for c in combo_index:
+            mask |= self.masks[c]
+        return mask
+
+    def fraction_within_latency(self, combo_index):
+        '''Return the fraction of nodes within lat_bound of the combo.'''
+        return _popcount(self.covered(combo_index)) / float(self.n)
+
+    def find_cover(self, k):
+        '''Find at most k controllers that together cover every node.
+
+        Depth-first search that branches on the controllers covering the
+        uncovered node with the fewest options.
+
+        @param k: max number of controllers
+        @return combo: list of matrix indices, or None if no cover exists
+        '''
+        # A controller whose coverage is a subset of another's never helps.
+        keep = []
+        for c in sorted(range(self.n), key = lambda c: -_popcount(self.masks[c])):
+            mask = self.masks[c]
+            if not any(mask | other == other for other, j in keep):
+                keep.append((mask, c))
+        # Bitset of kept controllers covering each node.
+        reach = [0] * self.n
+        for j, (mask, c) in enumerate(keep):
+            for v in range(self.n):
+                if mask >> v & 1:
+                    reach[v] |= 1 << j
+        if not all(reach):
+            return None
+        # Any controller covering node u also covers node w if reach[u] is a
+        # subset of reach[w], so only u needs covering explicitly.
+        needed = 0
+        for u in sorted(range(self.n), key = lambda v: _popcount(reach[v])):
+            if not any(reach[w] & ~reach[u] == 0 for w in range(self.n)
+                       if needed >> w & 1):
+                needed |= 1 << u
+        options = [[keep[j] for j in range(len(keep)) if reach[v] >> j & 1]
+                   for v in range(self.n)]
+        # Nodes that share some controller with each node.
+        shared = [0] * self.n
+        for v in range(self.n):
+            for mask, c in options[v]:
+                shared[v] |= mask
+        order = sorted(range(self.n), key = lambda v: len(options[v]))
+        # Largest r for which each uncovered set is known to be infeasible.
+        failed = {}
+
+        def search(uncovered, r):
+            if not uncovered:
+                return []
+            if r == 0 or failed.get(uncovered, -1) >= r:
+                return None
+            # Nodes that pairwise share no controller each need their own.
+            pool = uncovered
+            apart = 0
+            for v in order:
+                if pool >> v & 1:
+                    pool &= ~shared[v]
+                    apart += 1
+                    if apart > r:
+                        failed[uncovered] = r
+                        return None
+            v = (v for v in order if uncovered >> v & 1).next()
+            for mask, c in sorted(options[v],
+                                  key = lambda o: -_popcount(o[0] & uncovered)):
+                combo = search(uncovered & ~mask, r - 1)
+                if combo is not None:
+                    return [c] + combo
+            failed[uncovered] = r
+            return None
+
+        return search(needed, k)
+
+
+def kcenter_optimal(dm, k):
+    '''Find the optimal worst-case latency placement of k controllers.
+
+    The optimum is always one of the distinct distances in the matrix, so
+    binary-search the sorted distances for the smallest one where k
+    controllers can cover every node.
+
+    @param dm: DistMatrix
+    @param k: number of controllers
+    @return value: optimal wc_latency
+    @return combo: sorted list of matrix indices for an optimal placement
+    '''
+    dist = dm.dist
+    n = dist.shape[0]
+    k = min(k, n)
+    value, combo = swap_search(dist, 'wc_latency', greedy(dist, 'wc_latency', k))
+    values = numpy.unique(dist[numpy.isfinite(dist)])
+    lo = 0
+    hi = values.searchsorted(value)
+    while lo < hi:
+        mid = (lo + hi) / 2
+        cover = CoverSets(dm, values[mid]).find_cover(k)
+        if cover is None:
+            lo = mid + 1
+        else:
+            hi = mid
+            combo = cover
+    # Fill up with any other controllers; more can't hurt.
+    extra = [c for c in range(n) if c not in combo]
+    combo = list(combo) + extra[:k - len(combo)]
+    return float(values[hi]), sorted(combo)
+
+
+def bnb_optimal(dm, k, metric):
+    '''Find the optimal placement of k controllers.
+
+    latency uses branch and bound; wc_latency uses kcenter_optimal.
+
+    @param dm: DistMatrix
+    @param k: number of controllers
+    @param metric: metric in BNB_METRICS
+    @return value: optimal metric value
+    @return combo: sorted list of matrix indices for an optimal placement
+    '''
+    if metric == 'wc_latency':
+        return kcenter_optimal(dm, k)
+    elif metric != 'latency':
+        raise Exception("no branch and bound for metric %s" % metric)
+    dist = dm.dist
+    k = min(k, dist.shape[0])
+    ub, ub_combo = swap_search(dist, metric, greedy(dist, metric, k))
+    value, combo = _bnb_latency(dist, k, ub, ub_combo)
+    return float(value) / dist.shape[0], sorted(combo)
+
+
+def run_bnb(metrics, g, controllers, data, apsp, weighted = False):
+    '''Compute optimal latency/wc_latency by branch and bound.
+
+    Writes the same data['data'][k][metric]['lowest'/'lowest_combo'] entries
+    as run_all_combos, without enumerating every combination.
+
+    @param metrics: metrics to compute, all in BNB_METRICS
+    @param g: NetworkX graph
+    @param controllers: list of numbers of controllers to analyze.
+    @param data: JSON data to be augmented.
+    @param apsp: all-pairs shortest paths data
+    @param weighted: is graph weighted?
+    '''
+    for metric in metrics:
+        if metric not in BNB_METRICS:
+            raise Exception("no branch and bound for metric %s; choose from %s" %
+                            (metric, BNB_METRICS))
+    dm = get_dist_matrix(g, apsp)
+    if 'data' not in data:
+        data['data'] = {}
+    for combo_size in sorted(controllers):
+        print "** combo size: %s" % combo_size
+        group_data = data['data'].setdefault(unicode(combo_size), {})
+        for metric in metrics:
+            start = time.time()
+            value, combo = bnb_optimal(dm, combo_size, metric)
+            duration = time.time() - start
+            this_metric = group_data.setdefault(metric, {})
+            this_metric['lowest'] = value
+            this_metric['lowest_combo'] = dm.combo_nodes(combo)
+            this_metric['duration'] = duration
+            print "\t%s" % metric
+            print "\t\tlowest: %s" % value
+            print "\t\tlowest_combo: %s" % this_metric['lowest_combo']
+            print "\t\tduration: %s" % duration
+
+    data['metric'] = metrics
+    data['group'] = [str(c) for c in controllers]
+
+
+def capacitated_assignment(dist, combo, capacity):
+    '''Assign switches to controllers, each with a limited # switches.
+
+    Min-cost flow: each switch supplies one unit, which flows to a
+    controller at the cost of their distance, and each controller passes on
+    at most capacity units.  Integer flows make the assignment exact.
+
+    @param dist: n x n distance matrix
+    @param combo: list of controller matrix indices
+    @param capacity: max # switches per controller
+    @return total: total switch-to-controller distance; inf if infeasible
+    @return assignment: (n,) int array of each switch's controller matrix
+        index, or None if infeasible
+    '''
+    n = dist.shape[0]
+    if capacity * len(combo) < n:
+        return numpy.inf, None
+    sub = dist[:, combo]
+    scale = COST_SCALE / max(sub.max(), 1.0)
+    costs = numpy.round(sub * scale).astype(int)
+    flow_graph = nx.DiGraph()
+    flow_graph.add_node('sink', demand = n)
+    for j in range(len(combo)):
+        flow_graph.add_edge(('c', j), 'sink', capacity = capacity, weight = 0)
+    for i in range(n):
+        flow_graph.add_node(i, demand = -1)
+        for j in range(len(combo)):
+            flow_graph.add_edge(i, ('c', j), capacity = 1,
+                                weight = int(costs[i][j]))
+    flow = nx.min_cost_flow(flow_graph)
+    assignment = numpy.empty(n, dtype = numpy.intp)
+    for i in range(n):
+        for j in range(len(combo)):
+            if flow[i][('c', j)]:
+                assignment[i] = combo[j]
+    return dist[numpy.arange(n), assignment].sum(), assignment
+
+
+def assignment_loads(pm, assignment):
+    '''Return # switches whose control traffic crosses each link.
+
+    @param pm: PathMatrix
+    @param assignment: (n,) int array of each switch's controller
+    @return loads: (E,) float array, in pm.edges order
+    '''
+    edge_ids, owner = pm.gather_edges(numpy.arange(len(assignment)), assignment)
+    return numpy.bincount(edge_ids, minlength = len(pm.edges)).astype(float)
+
+
+def capacitated_placement(dm, k, capacity, pm = None, link_budget = None):
+    '''Find a low-latency placement of k controllers with limited capacity.
+
+    Local search: starts from the uncapacitated greedy placement and swaps
+    single controllers while that lowers the total latency of the optimal
+    capacitated assignment.  With a link budget, placements whose
+    assignment puts more control traffic than that on any link are
+    rejected.
+
+    @param dm: DistMatrix
+    @param k: number of controllers
+    @param capacity: max # switches per controller
+    @param pm: PathMatrix in dm order; needed for link_budget
+    @param link_budget: max control traffic on any link, as a fraction of
+        switches, as for the congestion metric; None for no limit
+    @return value: average latency of the assignment, or None if no
+        placement found is feasible
+    @return combo: sorted list of matrix indices
+    @return assignment: (n,) int array of each switch's controller
+    '''
+    dist = dm.dist
+    n = dist.shape[0]
+    k = min(k, n)
+
+    def cost(combo):
+        total, assignment = capacitated_assignment(dist, combo, capacity)
+        if assignment is not None and link_budget is not None:
+            if assignment_loads(pm, assignment).max() / n > link_budget:
+                return numpy.inf, None
+        return total, assignment
+
+    combo = greedy(dist, 'latency', k)
+    value, assignment = cost(combo)
+    improved = True
+    while improved:
+        improved = False
+        for out in list(combo):
+            for c in range(n):
+                if c in combo:
+                    continue
+                trial = [c if x == out else x for x in combo]
+                trial_value, trial_assignment = cost(trial)
+                if trial_value < value:
+                    combo, value, assignment = trial, trial_value, trial_assignment
+                    improved = True
+                    break
+    if assignment is None:
+        return None, sorted(combo), None
+    return float(value) / n, sorted(combo), assignment
+
+
+def run_capacitated(g, controllers, data, apsp, apsp_paths, capacity,
+                    link_budget = None, weighted = False):
+    '''Compute capacitated placements, with their latency, fairness and congestion.
+
+    Writes data[k]['capacitated'] entries, alongside those of
+    metrics_lib.run_greedy_alg.  Sizes with no feasible placement found
+    are skipped.
+
+    @param g: NetworkX graph
+    @param controllers: list of numbers of controllers to analyze.
+    @param data: JSON data to be augmented.
+    @param apsp: all-pairs shortest paths data
+    @param apsp_paths: all-pairs shortest paths path data
+    @param capacity: max # switches per controller
+    @param link_budget: see capacitated_placement
+    @param weighted: is graph weighted?
+    '''
+    dm = get_dist_matrix(g, apsp)
+    pm = get_path_matrix(g, dm.nodes, apsp_paths)
+    n = len(dm.nodes)
+    for combo_size in sorted(controllers):
+        start = time.time()
+        value, combo, assignment = capacitated_placement(dm, combo_size,
+            capacity, pm, link_budget)
+        duration = time.time() - start
+        print "** combo size: %s" % combo_size
+        if assignment is None:
+            print "\tcapacitated: no feasible placement found"
+            continue
+        alloc = numpy.bincount(assignment, minlength = n)[combo].astype(float)
+        alloc = alloc[alloc > 0]
+        entry = {
+            'latency': value,
+            'fairness': float(alloc.sum() ** 2 / (len(alloc) * (alloc ** 2).sum())),
+            'congestion': assignment_loads(pm, assignment).max() / n,
+            'combo': dm.combo_nodes(combo),
+            'duration': duration,
+            'capacity': capacity
+        }
+        if link_budget is not None:
+            entry['link_budget'] = link_budget
+        print "\tcapacitated"
+        for key in ['latency', 'fairness', 'congestion', 'duration', 'combo']:
+            print "\t\t%s: %s" % (key, entry[key])
+        data.setdefault(unicode(combo_size), {})['capacitated'] = entry
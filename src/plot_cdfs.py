@@ -2,6 +2,7 @@
 '''Plot CDFs of latency, where each series is a # of controllers.'''
 import math
 
+from distribution_lib import get_distribution
 import lib.plot as plot
 from lib.colors import COLORS
 from lib.options import parse_args
@@ -19,10 +20,10 @@ def do_cdfs(options, stats, write_filepath):
         for i, g in enumerate(stats['group']):
             if options.max and i >= options.max:
                 break
-            data[g] = [d[metric] for d in stats['data'][g]["distribution"]]
+            data[g] = get_distribution(stats, g)[metric]
 
         print "plotting CDFs"
-        xmax = round(math.ceil(max(data[stats['group'][0]])))
+        xmax = round(math.ceil(data[stats['group'][0]].max()))
         axis_limits = [0, xmax, 0, 1]
         if options.minx:
             axis_limits[0] = options.minx
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 '''Plot CDFs of latency, where each series is a # of controllers.'''
+from distribution_lib import get_distribution
 import lib.plot as plot
 from lib.colors import COLORS
 from metrics_lib import metric_fullname, get_output_filepath
@@ -15,7 +16,7 @@ def do_cloud(options, stats, write_filepath, ext = None):
     for i, g in enumerate(stats['group']):
         if options.max and i >= options.max:
             break
-        data[g] = [d for d in stats['data'][g]["distribution"]]
+        data[g] = get_distribution(stats, g)
 
     print "plotting point cloud"
 
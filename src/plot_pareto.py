@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 '''Plot CDFs of latency, where each series is a # of controllers.'''
 import lib.plot as plot
+from pareto_lib import get_pareto
 from lib.colors import COLORS
 from metrics_lib import metric_fullname, get_output_filepath
 from lib.options import parse_args
@@ -15,7 +16,7 @@ def do_pareto(options, stats, write_filepath):
     for i, g in enumerate(stats['group']):
         if options.max and i >= options.max:
             break
-        data[g] = [d for d in stats['data'][g]["distribution"]]
+        data[g] = get_pareto(stats, g, options.metrics)
 
     print "plotting point pareto"
     if not write_filepath:
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+'''Share graph, distance and path data with worker processes.
+
+Fork copy-on-write doesn't keep the apsp dicts shared: every access from a
+worker updates refcounts, which dirties the pages holding them, so each
+worker ends up with a private copy.  Instead, the data is published once
+as NumPy arrays in files (on tmpfs, where available) that each worker
+maps read-only, so the pages stay shared however many workers there are.
+'''
+import os
+import shutil
+import tempfile
+
+import networkx as nx
+import numpy
+
+from matrix_lib import DistMatrix
+from path_matrix_lib import PathMatrix, path_matrix_from_paths
+
+# Directory for published arrays; tmpfs keeps them out of the disk cache.
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class SharedArrays(object):
+    '''Named NumPy arrays published to a directory of .npy files.'''
+
+    def __init__(self):
+        self.dirname = tempfile.mkdtemp(prefix = 'cpp_shared_', dir = SHARED_DIR)
+
+    def publish(self, name, array):
+        numpy.save(os.path.join(self.dirname, name + '.npy'), array)
+
+    def close(self):
+        '''Remove published arrays; workers with them mapped keep working.'''
+        shutil.rmtree(self.dirname, ignore_errors = True)
+
+
+def attach(dirname, name):
+    '''Map a published array read-only.'''
+    array = numpy.load(os.path.join(dirname, name + '.npy'), mmap_mode = 'r')
+    # A plain ndarray view skips memmap overhead on every index; it keeps
+    # the mapping alive through its base.
+    return array.view(numpy.ndarray)
+
+
+def publish_graph(g, nodes, dm, apsp_paths = None):
+    '''Publish the edge list, distance matrix and paths for a graph.
+
+    @param g: NetworkX graph
+    @param nodes: list of node names, in matrix order
+    @param dm: DistMatrix for g, in the same node order
+    @param apsp_paths: PathMatrix in the same node order, all-pairs shortest
+        paths path data, or None
+    @return shared: SharedArrays; pass shared.dirname to attach_graph
+    '''
+    index = dict((v, i) for i, v in enumerate(nodes))
+    edges = g.edges(data = True)
+    shared = SharedArrays()
+    shared.publish('edges', numpy.array([(index[src], index[dst])
+                                         for src, dst, attrs in edges],
+                                        dtype = numpy.intp).reshape(-1, 2))
+    shared.publish('weights', numpy.array([attrs.get('weight', 1)
+                                           for src, dst, attrs in edges],
+                                          dtype = float))
+    shared.publish('dist', dm.dist)
+    if apsp_paths is not None:
+        if not isinstance(apsp_paths, PathMatrix):
+            apsp_paths = path_matrix_from_paths(g, nodes, apsp_paths)
+        shared.publish('pred', apsp_paths.pred)
+        shared.publish('pair_offsets', apsp_paths.pair_offsets)
+        shared.publish('pair_edges', apsp_paths.pair_edges)
+    return shared
+
+
+class SharedDist(object):
+    '''Read-only apsp lookalike over a distance matrix: apsp[src][dst].'''
+
+    def __init__(self, nodes, dist):
+        self.nodes = nodes
+        self.index = dict((v, i) for i, v in enumerate(nodes))
+        self.dist = dist
+        self.rows = {}
+
+    def __getitem__(self, src):
+        row = self.rows.get(src)
+        if row is None:
+            row = self.rows[src] = _SharedDistRow(self, self.dist[self.index[src]])
+        return row
+
+    def __contains__(self, src):
+        return src in self.index
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+
+class _SharedDistRow(object):
+
+    def __init__(self, parent, row):
+        self.parent = parent
+        self.row = row
+
+    def __getitem__(self, dst):
+        path_len = self.row.item(self.parent.index[dst])
+        if path_len == numpy.inf:
+            raise KeyError(dst)
+        return path_len
+
+    def iteritems(self):
+        for i, dst in enumerate(self.parent.nodes):
+            if self.row[i] != numpy.inf:
+                yield dst, float(self.row[i])
+
+
+def attach_graph(dirname, nodes):
+    '''Attach to data published by publish_graph.
+
+    @param dirname: SharedArrays directory
+    @param nodes: list of node names, in matrix order
+    @return g: NetworkX graph with weighted edges.  Its edges() order need
+        not match the publishing graph's; anything that depends on edge
+        order should use apsp_paths.edges, which keeps the published order.
+    @return dm: DistMatrix over the shared matrix
+    @return apsp: SharedDist
+    @return apsp_paths: PathMatrix, or None if no paths were published
+    '''
+    g = nx.Graph()
+    g.add_nodes_from(nodes)
+    edges = [(nodes[src], nodes[dst]) for src, dst in attach(dirname, 'edges')]
+    weights = attach(dirname, 'weights')
+    for (src, dst), weight in zip(edges, weights):
+        g.add_edge(src, dst, weight = float(weight))
+    dist = attach(dirname, 'dist')
+    dm = DistMatrix(nodes, dist)
+    apsp = SharedDist(nodes, dist)
+    apsp_paths = None
+    if os.path.exists(os.path.join(dirname, 'pred.npy')):
+        apsp_paths = PathMatrix(nodes, edges, attach(dirname, 'pred'),
+                                attach(dirname, 'pair_offsets'),
+                                attach(dirname, 'pair_edges'))
+    return g, dm, apsp, apsp_paths
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+'''Streaming statistics in bounded memory.
+
+Storing every metric value to compute a median eventually spills to swap.
+A quantile sketch keeps a bounded sample of weighted values instead, and
+sketches from pool workers merge without losing accuracy.
+'''
+
+import numpy
+
+# Sketch size parameter: rank error is roughly 2 / SKETCH_K, and a sketch
+# holds about 3 * SKETCH_K values.
+SKETCH_K = 1024
+
+
+class QuantileSketch(object):
+    '''Mergeable streaming quantile sketch (KLL-style compactor hierarchy).
+
+    Values at level h stand for 2^h original values.  When a level fills up,
+    it is sorted and every other value moves up a level, so memory stays
+    bounded however many values are added.  Lower levels get smaller
+    capacities, since their values carry less weight.  Until the first
+    compaction, quantiles are exact.
+    '''
+
+    def __init__(self, k = SKETCH_K):
+        '''
+        @param k: capacity of the top level; larger is more accurate
+        '''
+        self.k = k
+        self.levels = [numpy.empty(0)]
+        # Which of each sorted pair to promote; alternates per level.
+        self.offsets = [0]
+        self.pending = []
+        self.pending_size = 0
+        self.num = 0
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(self.k * (2.0 / 3) ** depth), 2)
+
+    def update(self, values):
+        '''Add a value, or an array of values.'''
+        values = numpy.asarray(values, dtype = float).ravel()
+        self.pending.append(values)
+        self.pending_size += len(values)
+        self.num += len(values)
+        if self.pending_size >= self.k:
+            self._flush()
+
+    def merge(self, other):
+        '''Add all values summarized by another sketch.'''
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(numpy.empty(0))
+                self.offsets.append(0)
+            self.levels[level] = numpy.concatenate([self.levels[level], items])
+        self.pending += other.pending
+        self.pending_size += other.pending_size
+        self.num += other.num
+        self._flush()
+
+    def _flush(self):
+        if self.pending:
+            self.levels[0] = numpy.concatenate([self.levels[0]] + self.pending)
+            self.pending = []
+            self.pending_size = 0
+        while True:
+            for level, items in enumerate(self.levels):
+                if len(items) > self._capacity(level):
+                    break
+            else:
+                return
+            self._compact(level)
+
+    def _compact(self, level):
+        '''Promote every other value of a full level to the next one.'''
+        if level + 1 == len(self.levels):
+            self.levels.append(numpy.empty(0))
+            self.offsets.append(0)
+        items = numpy.sort(self.levels[level])
+        # With an odd count, one value stays behind.
+        odd = len(items) % 2
+        offset = self.offsets[level]
+        self.offsets[level] = 1 - offset
+        self.levels[level + 1] = numpy.concatenate([self.levels[level + 1],
+                                                    items[odd + offset::2]])
+        self.levels[level] = items[:odd]
+
+    def quantile(self, q):
+        '''Return the approximate q-quantile, or nan if empty.
+
+        @param q: quantile in [0, 1]
+        '''
+        self._flush()
+        if self.num == 0:
+            return float('nan')
+        if len(self.levels) == 1:
+            return float(numpy.percentile(self.levels[0], q * 100))
+        items = numpy.concatenate(self.levels)
+        weights = numpy.concatenate([numpy.repeat(2 ** level, len(items_h))
+                                     for level, items_h in enumerate(self.levels)])
+        order = items.argsort()
+        cum_weights = weights[order].cumsum()
+        i = cum_weights.searchsorted(q * cum_weights[-1])
+        return float(items[order[min(i, len(items) - 1)]])
+
+    def size(self):
+        '''Return number of values stored.'''
+        return sum(len(items) for items in self.levels) + self.pending_size
@@ -3,12 +3,16 @@
 
 For common topologies, verify uptime given a link failure probability.
 '''
+from itertools import combinations
 import logging
 import networkx as nx
 import unittest
 
 from lib.graph import flatten, loop_graph
-from cc import availability, sssp_conn, any_conn
+import cc
+from topo.os3e import OS3EGraph
+from cc import availability, any_conn
+from cc import sssp_conn_single as sssp_conn
 
 
 class GraphTest(unittest.TestCase):
@@ -240,6 +244,24 @@ class TestSSSP(GraphTest):
         for link_fail, uptime in hard_coded_uptimes.iteritems():
             self.run_loop_test(3, link_fail, 0, 1, uptime)
 
+    def test_sssp_tree(self):
+        '''Tree subtree sizes should match checking every switch's path.'''
+        g = OS3EGraph()
+        g.add_edge('x', 'y')
+        for controller in g.nodes():
+            paths = nx.single_source_shortest_path(g, controller)
+            for (src, dst), (p, conn) in zip(g.edges(),
+                                             sssp_conn(g, controller, 0.01)):
+                connected = 0
+                for sw, path in paths.iteritems():
+                    path_graph = nx.Graph()
+                    path_graph.add_path(path)
+                    if not path_graph.has_edge(src, dst):
+                        connected += 1
+                self.assertEqual(p, 0.01)
+                self.assertAlmostEqual(conn, float(connected) / g.number_of_nodes())
+
+
 class TestAny(GraphTest):
 
     def calc_complete_uptime(self, n, link_fail):
@@ -266,6 +288,84 @@ class TestAny(GraphTest):
             for link_fail in (0.01, 0.02):
                 self.run_loop_test(n, link_fail, 0, 1, any_conn, 1.0)
 
+class TestMultiple(unittest.TestCase):
+
+    def brute_force(self, g, link_fail, node_fail, max_fail, alg):
+        '''Return availability per controller, from residual graphs.'''
+        elements = g.edges() + (g.nodes() if node_fail else [])
+        probs = [link_fail] * g.number_of_edges() + ([node_fail] * g.number_of_nodes()
+                                                     if node_fail else [])
+        data = {}
+        for controller in g.nodes():
+            paths = nx.single_source_shortest_path(g, controller)
+            downtime = 0.0
+            for failures in range(1, max_fail + 1):
+                for failed in combinations(range(len(elements)), failures):
+                    prob = 1.0
+                    for i, p in enumerate(probs):
+                        prob *= p if i in failed else 1.0 - p
+                    failed = [elements[i] for i in failed]
+                    residual = g.copy()
+                    residual.remove_edges_from([e for e in failed if e in g.edges()])
+                    residual.remove_nodes_from([e for e in failed if e in g.nodes()])
+                    connected = 0
+                    for sw in g.nodes():
+                        if alg is sssp_conn:
+                            path = paths[sw]
+                            if all(residual.has_edge(src, dst)
+                                   for src, dst in zip(path[:-1], path[1:])) and \
+                               all(node in residual for node in path):
+                                connected += 1
+                        elif (controller in residual and sw in residual and
+                              nx.has_path(residual, controller, sw)):
+                            connected += 1
+                    downtime += prob * (1.0 - float(connected) / g.number_of_nodes())
+            data[controller] = 1.0 - downtime
+        return data
+
+    def check(self, g, link_fail, node_fail, max_fail, alg):
+        conn, data = availability(g, link_fail, node_fail, max_fail, alg)
+        expected = self.brute_force(g, link_fail, node_fail, max_fail, alg)
+        for controller, uptime in expected.iteritems():
+            self.assertAlmostEqual(data[controller], uptime)
+        self.assertAlmostEqual(conn, sum(expected.values()) / len(expected))
+
+    def test_link_failures(self):
+        for g in [nx.complete_graph(4), nx.star_graph(4), loop_graph(5),
+                  nx.path_graph(4)]:
+            for alg in [sssp_conn, any_conn]:
+                for max_fail in [2, 3]:
+                    self.check(g, 0.1, 0, max_fail, alg)
+
+    def test_node_failures(self):
+        for g in [nx.complete_graph(4), loop_graph(5)]:
+            for alg in [sssp_conn, any_conn]:
+                for max_fail in [1, 2]:
+                    self.check(g, 0.05, 0.02, max_fail, alg)
+
+    def test_likely_failures(self):
+        '''Availability should be exact when every state is considered.'''
+        g = nx.complete_graph(3)
+        conn, data = availability(g, 0.5, 0, 3, any_conn)
+        # A switch is cut off iff its direct link and its two-hop path both
+        # fail: 1/2 * 3/4 of the time.
+        self.assertAlmostEqual(conn, (1.0 + 2 * (1.0 - 0.5 * 0.75)) / 3)
+
+    def test_sampled(self):
+        '''Too many states to enumerate should be sampled, near exact.'''
+        g = loop_graph(8)
+        expected = self.brute_force(g, 0.1, 0, 3, sssp_conn)
+        old_max = cc.MAX_ENUMERATED_STATES
+        cc.MAX_ENUMERATED_STATES = 10
+        try:
+            conn, data = cc.availability_multiple(g, 0.1, 0, 3, sssp_conn,
+                                                  samples = 20000)
+        finally:
+            cc.MAX_ENUMERATED_STATES = old_max
+        for controller, uptime in expected.iteritems():
+            self.assertTrue(abs(data[controller] - uptime) < 0.005)
+
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     unittest.main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+'''Validate closed-form and enumerated availability.'''
+
+from itertools import combinations
+import logging
+import unittest
+
+import networkx as nx
+import numpy
+
+import availability_lib
+from availability_lib import AvailabilityModel, FailureStates
+from availability_lib import link_fail_probs, coverage
+from combo_lib import combo_blocks
+from itertools_recipes import choose
+import matrix_lib
+import metrics_lib
+from path_matrix_lib import path_matrix
+from topo.os3e import OS3EGraph
+from os3e_weighted import OS3EWeightedGraph
+
+lg = logging.getLogger("test_availability_lib")
+
+COMBOS = [["Sunnyvale, CA", "Boston"],
+          ["Portland"],
+          ["Sunnyvale, CA", "Salt Lake City"],
+          ["Seattle", "Boston"],
+          ["Seattle", "Portland", "Miami"]]
+
+
+class ExactTest(unittest.TestCase):
+
+    def test_coverage(self):
+        '''Coverage should be a binomial sum for equal probabilities.'''
+        probs = numpy.empty(41)
+        probs.fill(0.01)
+        for max_failures in range(4):
+            expected = sum(choose(41, f) * 0.01 ** f * 0.99 ** (41 - f)
+                           for f in range(max_failures + 1))
+            self.assertAlmostEqual(coverage(probs, max_failures), expected)
+
+    def test_matches_enumerated(self):
+        '''The closed form should match enumerating every failure set.'''
+        g = OS3EWeightedGraph()
+        pm = path_matrix(g)
+        weights = [g[src][dst]['weight'] for src, dst in pm.edges]
+        probs = link_fail_probs(g, pm.edges, True, 0.05 / max(weights))
+        states = FailureStates(pm.edges, probs)
+        for max_failures in range(4):
+            exact = availability_lib.pair_availability(pm, probs, max_failures)
+            enumerated = availability_lib.pair_availability_enumerated(
+                pm, states, max_failures)
+            self.assertTrue(numpy.allclose(exact, enumerated, rtol = 0,
+                                           atol = 1e-12))
+        # With no path edges, a pair survives in every state considered.
+        for i in range(len(pm.nodes)):
+            self.assertAlmostEqual(exact[i][i], coverage(probs, 3))
+
+    def test_high_probs(self):
+        '''Likely failures and deep failure sets should stay accurate.'''
+        g = OS3EGraph()
+        pm = path_matrix(g)
+        n = len(pm.nodes)
+        pairs = numpy.arange(n * n)
+        up = numpy.array([numpy.prod(1.0 - 0.9 * numpy.ones(len(pm.path_edges(s, t))))
+                          for s in range(n) for t in range(n)])
+        for max_failures in [30, g.number_of_edges()]:
+            probs = link_fail_probs(g, pm.edges, False, 0.9)
+            exact = availability_lib.pair_availability(pm, probs, max_failures)
+            direct = up * availability_lib.off_path_polynomials(
+                pm, probs, max_failures, pairs).sum(axis = 1)
+            self.assertTrue(numpy.allclose(exact.ravel(), direct, rtol = 1e-9,
+                                           atol = 0))
+
+    def test_matches_one_combo(self):
+        '''Models should match availability_one_combo on dict paths.'''
+        link_fail_prob = 0.01
+        g = OS3EGraph()
+        apsp = nx.all_pairs_shortest_path_length(g)
+        apsp_paths = nx.all_pairs_shortest_path(g)
+        dm = matrix_lib.dist_matrix(g, apsp)
+        for max_failures in range(3):
+            models = [AvailabilityModel(g, dm, apsp_paths, False,
+                                        link_fail_prob, max_failures, mode)
+                      for mode in ['exact', 'enumerate', 'state_major']]
+            for combo in COMBOS:
+                a, c = metrics_lib.availability_one_combo(g, combo, apsp,
+                    apsp_paths, False, link_fail_prob, max_failures)
+                for model in models:
+                    self.assertAlmostEqual(model.coverage, c)
+                    self.assertAlmostEqual(
+                        model.availability(dm.combo_index(combo)), a)
+
+    def test_off_path_failures(self):
+        '''Pruned enumeration should match visiting every failure set.'''
+        g = OS3EGraph()
+        apsp = nx.all_pairs_shortest_path_length(g)
+        apsp_paths = nx.all_pairs_shortest_path(g)
+        states = availability_lib.get_failure_states(g, False, 0.02)
+        for combo in COMBOS:
+            links = metrics_lib.combo_path_links(g, combo, apsp, apsp_paths)
+            self.assertTrue(len(links) < 2 * g.number_of_edges())
+            for max_failures in range(3):
+                expected = 0.0
+                for failures in range(max_failures + 1):
+                    failed, state_probs = states.level(failures)
+                    for failed_ids, state_prob in zip(failed, state_probs):
+                        expected += state_prob * metrics_lib.connectivity_sssp(
+                            g, combo, apsp, apsp_paths, False,
+                            [states.edges[i] for i in failed_ids])
+                a, c = metrics_lib.availability_one_combo(g, combo, apsp,
+                    apsp_paths, False, 0.02, max_failures)
+                self.assertAlmostEqual(a, expected)
+                self.assertAlmostEqual(c, coverage(states.probs, max_failures))
+
+    def test_state_probs(self):
+        '''Log-space state weights should match direct products.'''
+        g = OS3EWeightedGraph()
+        edges = g.edges()
+        probs = link_fail_probs(g, edges, True, 0.001 / g.number_of_edges())
+        states = FailureStates(edges, probs)
+        for failures in range(3):
+            failed, state_probs = states.level(failures)
+            self.assertEqual(len(failed), choose(len(edges), failures))
+            for ids, state_prob in zip(failed, state_probs):
+                expected = 1.0
+                for i, p in enumerate(probs):
+                    expected *= p if i in ids else 1.0 - p
+                self.assertAlmostEqual(state_prob / expected, 1.0)
+
+    def test_batch(self):
+        '''Batched availability should match one combo at a time.'''
+        g = OS3EWeightedGraph()
+        apsp = nx.all_pairs_dijkstra_path_length(g)
+        apsp_paths = nx.all_pairs_dijkstra_path(g)
+        dm = matrix_lib.dist_matrix(g, apsp)
+        exact = AvailabilityModel(g, dm, apsp_paths, False, 0.01, 2)
+        state_major = AvailabilityModel(g, dm, apsp_paths, False, 0.01, 2,
+                                        'state_major')
+        for combo_size in range(1, 4):
+            for combos in combo_blocks(g.number_of_nodes(), combo_size, 1000):
+                values, half_widths = exact.batch_intervals(combos)
+                self.assertFalse(half_widths.any())
+                for combo_index, value in zip(combos, values):
+                    self.assertAlmostEqual(value, exact.availability(combo_index))
+                values, half_widths = state_major.batch_intervals(combos)
+                self.assertFalse(half_widths.any())
+                for combo_index, value in zip(combos[::50], values[::50]):
+                    self.assertAlmostEqual(value, exact.availability(combo_index))
+
+    def test_run_all_combos(self):
+        '''Availability metrics should batch through run_all_combos.'''
+        g = OS3EGraph()
+        apsp = nx.all_pairs_shortest_path_length(g)
+        apsp_paths = nx.all_pairs_shortest_path(g)
+        extra_params = {'link_fail_prob': 0.01, 'max_failures': 2}
+        metrics = ['latency', 'availability', 'availability_ci']
+        data = {}
+        metrics_lib.run_all_combos(metrics, g, [1, 2], data, apsp, apsp_paths,
+                                   False, True, True, extra_params)
+        for group in ['1', '2']:
+            for point in data['data'][group]['distribution'][::50]:
+                a, c = metrics_lib.availability_one_combo(g, point['combo'],
+                    apsp, apsp_paths, False, 0.01, 2)
+                self.assertAlmostEqual(point['availability'], a)
+                self.assertEqual(point['availability_ci'], 0.0)
+
+    def test_bad_probability(self):
+        g = OS3EGraph()
+        self.assertRaises(Exception, link_fail_probs, g, g.edges(), False, 1.0)
+
+
+class SampleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EGraph()
+        self.apsp = nx.all_pairs_shortest_path_length(self.g)
+        self.apsp_paths = nx.all_pairs_shortest_path(self.g)
+        self.dm = matrix_lib.dist_matrix(self.g, self.apsp)
+
+    def model(self, mode, max_failures, seed = 0):
+        return AvailabilityModel(self.g, self.dm, self.apsp_paths, False, 0.02,
+                                 max_failures, mode, 20000, seed)
+
+    def test_draw(self):
+        '''Draws should have the # failures asked for, at the right rates.'''
+        probs = numpy.array([0.01, 0.02, 0.04, 0.0, 0.08])
+        fail = availability_lib.conditional_fail_probs(probs, 3)
+        rng = numpy.random.RandomState(0)
+        for failures in [1, 2, 3]:
+            failed = availability_lib.draw_failure_sets(fail, failures, 20000, rng)
+            self.assertTrue((failed.sum(axis = 1) == failures).all())
+            self.assertFalse(failed[:, 3].any())
+            # Exact rates of each link failing, given the # failures.
+            sets = list(combinations([0, 1, 2, 4], failures))
+            weights = numpy.array([numpy.prod(probs[list(c)] / (1.0 - probs[list(c)]))
+                                   for c in sets])
+            rates = numpy.zeros(len(probs))
+            for c, weight in zip(sets, weights / weights.sum()):
+                rates[list(c)] += weight
+            self.assertTrue(numpy.allclose(failed.mean(axis = 0), rates,
+                                           atol = 0.015))
+
+    def test_within_interval(self):
+        '''Estimates should land near exact values, within a few CIs.'''
+        for max_failures in [1, 3, 6, 20]:
+            exact = self.model('exact', max_failures)
+            sampled = self.model('sample', max_failures)
+            for combo in COMBOS:
+                combo_index = self.dm.combo_index(combo)
+                expected, zero = exact.interval(combo_index)
+                self.assertEqual(zero, 0.0)
+                estimate, half_width = sampled.interval(combo_index)
+                self.assertTrue(0.0 < half_width < 0.01)
+                self.assertTrue(abs(estimate - expected) < 2 * half_width)
+
+    def test_seed(self):
+        combo_index = self.dm.combo_index(COMBOS[0])
+        first = self.model('sample', 2, 1).interval(combo_index)
+        self.assertEqual(first, self.model('sample', 2, 1).interval(combo_index))
+        self.assertNotEqual(first, self.model('sample', 2, 2).interval(combo_index))
+
+    def test_metric(self):
+        '''The sample engine should be usable through the metrics.'''
+        extra_params = {'link_fail_prob': 0.02, 'max_failures': 2,
+                        'availability_mode': 'sample',
+                        'availability_samples': 1000}
+        combo = COMBOS[0]
+        a = metrics_lib.get_availability(self.g, combo, self.apsp,
+            self.apsp_paths, False, extra_params)
+        ci = metrics_lib.get_availability_ci(self.g, combo, self.apsp,
+            self.apsp_paths, False, extra_params)
+        self.assertTrue(0.0 < ci < 0.05)
+        extra_params['availability_mode'] = 'exact'
+        exact = metrics_lib.get_availability(self.g, combo, self.apsp,
+            self.apsp_paths, False, extra_params)
+        self.assertTrue(abs(a - exact) < 2 * ci)
+
+
+class MultiprocessTest(unittest.TestCase):
+
+    def run_combos(self, extra_params, multiprocess, coarse = True):
+        g = OS3EWeightedGraph()
+        apsp = nx.all_pairs_dijkstra_path_length(g)
+        apsp_paths = nx.all_pairs_dijkstra_path(g)
+        old_coarse = metrics_lib.COARSE
+        metrics_lib.COARSE = coarse
+        try:
+            data = {}
+            metrics_lib.run_all_combos(['availability', 'availability_ci'], g,
+                [1, 2], data, apsp, apsp_paths, True, True, True, extra_params,
+                processes = 2, multiprocess = multiprocess)
+        finally:
+            metrics_lib.COARSE = old_coarse
+        return dict((tuple(point['combo']), point)
+                    for group in data['group']
+                    for point in data['data'][group]['distribution'])
+
+    def check_matches(self, extra_params):
+        '''Workers attach graphs with edges in another order.'''
+        expected = self.run_combos(extra_params, False)
+        for coarse in [True, False]:
+            points = self.run_combos(extra_params, True, coarse)
+            self.assertEqual(sorted(points.keys()), sorted(expected.keys()))
+            for combo, point in points.iteritems():
+                for metric in ['availability', 'availability_ci']:
+                    self.assertAlmostEqual(point[metric], expected[combo][metric])
+
+    def test_exact(self):
+        self.check_matches({'link_fail_prob': 1e-5, 'max_failures': 2})
+
+    def test_sample(self):
+        '''Seeded samples should not depend on the process.'''
+        self.check_matches({'link_fail_prob': 1e-5, 'max_failures': 2,
+                            'availability_mode': 'sample',
+                            'availability_samples': 500})
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+'''Validate resuming interrupted runs from checkpoints.'''
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import networkx as nx
+
+from distribution_lib import get_distribution
+import metrics_lib
+from os3e_weighted import OS3EWeightedGraph
+
+lg = logging.getLogger("test_checkpoint")
+
+METRICS = ['latency', 'wc_latency', 'fairness']
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EWeightedGraph()
+        self.apsp = nx.all_pairs_dijkstra_path_length(self.g)
+        self.apsp_paths = nx.all_pairs_dijkstra_path(self.g)
+        self.dirname = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.dirname, 'checkpoint')
+        self.process_block = metrics_lib.process_block
+        self.interval = metrics_lib.CHECKPOINT_INTERVAL
+
+    def tearDown(self):
+        metrics_lib.process_block = self.process_block
+        metrics_lib.CHECKPOINT_INTERVAL = self.interval
+        shutil.rmtree(self.dirname)
+
+    def run_combos(self, dist_format, incremental, resume = False,
+                   controllers = [1, 2, 3]):
+        data = {}
+        metrics_lib.run_all_combos(METRICS, self.g, controllers, data,
+            self.apsp, self.apsp_paths, True, True, True, median = True,
+            incremental = incremental, dist_format = dist_format,
+            dist_path = os.path.join(self.dirname, 'dist'),
+            checkpoint_path = self.checkpoint_path, resume = resume)
+        return data
+
+    def interrupt_after(self, calls):
+        '''Make process_block fail after some number of calls.'''
+        state = {'calls': 0}
+        def process_block(*args, **kwargs):
+            state['calls'] += 1
+            if state['calls'] > calls:
+                raise Interrupted()
+            return self.process_block(*args, **kwargs)
+        metrics_lib.process_block = process_block
+
+    def check_resume(self, dist_format, incremental, controllers, calls):
+        expected = self.run_combos(dist_format, incremental, False, controllers)
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+        expected_dists = dict((group, get_distribution(expected, group))
+                              for group in expected['group'])
+
+        # Stop partway through the last group, after checkpointing each block.
+        metrics_lib.CHECKPOINT_INTERVAL = 0
+        self.interrupt_after(calls)
+        self.assertRaises(Interrupted, self.run_combos, dist_format,
+                          incremental, False, controllers)
+        metrics_lib.process_block = self.process_block
+        data = self.run_combos(dist_format, incremental, True, controllers)
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+        for group in expected['group']:
+            for metric in METRICS:
+                got = data['data'][group][metric]
+                for key, value in expected['data'][group][metric].iteritems():
+                    if key != 'duration':
+                        self.assertAlmostEqual(got[key], value)
+            dist = get_distribution(data, group)
+            order = dist['id'].argsort()
+            expected_order = expected_dists[group]['id'].argsort()
+            self.assertEqual(list(dist['id'][order]),
+                             list(expected_dists[group]['id'][expected_order]))
+            for metric in METRICS:
+                self.assertEqual(list(dist[metric][order]),
+                                 list(expected_dists[group][metric][expected_order]))
+
+    def test_json(self):
+        self.check_resume('json', False, [1, 2, 3], 4)
+
+    def test_npy(self):
+        self.check_resume('npy', False, [1, 2, 3], 4)
+
+    def test_incremental(self):
+        # Incremental blocks hold whole runs, so use a larger group.
+        self.check_resume('npy', True, [1, 2, 4], 6)
+
+    def test_options_mismatch(self):
+        '''Resuming with different options should fail.'''
+        self.interrupt_after(0)
+        self.assertRaises(Interrupted, self.run_combos, 'json', False)
+        metrics_lib.process_block = self.process_block
+        self.assertRaises(Exception, self.run_combos, 'npy', False, True)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
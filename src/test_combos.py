@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+'''Validate combination enumeration helpers.'''
+
+from itertools import combinations
+import logging
+import unittest
+
+import numpy
+
+from combo_lib import combo_blocks, combo_rank, combo_unrank, random_combos
+from combo_lib import revolving_door, revolving_door_runs
+from itertools_recipes import choose
+
+lg = logging.getLogger("test_combos")
+
+
+class ComboBlocksTest(unittest.TestCase):
+
+    def test_matches_combinations(self):
+        '''Blocks should concatenate to itertools.combinations order.'''
+        for n in range(1, 8):
+            for k in range(1, n + 1):
+                combos = [tuple(c) for block in combo_blocks(n, k, 4)
+                          for c in block]
+                self.assertEqual(combos, list(combinations(range(n), k)))
+
+    def test_ranges(self):
+        '''Blocks over any rank range should match that slice of the order.'''
+        for n in range(1, 8):
+            for k in range(1, n + 1):
+                order = list(combinations(range(n), k))
+                for lo in range(len(order)):
+                    for hi in range(lo + 1, len(order) + 1):
+                        combos = [tuple(c) for block in combo_blocks(n, k, 3, lo, hi)
+                                  for c in block]
+                        self.assertEqual(combos, order[lo:hi])
+
+    def test_rank(self):
+        '''Ranking and unranking should be inverses.'''
+        for n in range(1, 9):
+            for k in range(1, n + 1):
+                for rank, combo in enumerate(combinations(range(n), k)):
+                    self.assertEqual(combo_rank(combo, n), rank)
+                    self.assertEqual(combo_unrank(rank, n, k), combo)
+        # Beyond 64 bits.
+        combo = tuple(range(0, 200, 10))
+        self.assertEqual(combo_unrank(combo_rank(combo, 200), 200, 20), combo)
+
+
+class RandomCombosTest(unittest.TestCase):
+
+    def test_rows(self):
+        '''Rows should be sorted combinations, reproducible from a seed.'''
+        for n in range(1, 8):
+            for k in range(1, n + 1):
+                combos = random_combos(n, k, 50, numpy.random.RandomState(0))
+                self.assertEqual(combos.shape, (50, k))
+                self.assertTrue((numpy.diff(combos, axis = 1) > 0).all())
+                self.assertTrue(((combos >= 0) & (combos < n)).all())
+                self.assertEqual(combos.tolist(), random_combos(n, k, 50,
+                    numpy.random.RandomState(0)).tolist())
+
+    def test_uniform(self):
+        '''Every combination should be about equally likely.'''
+        combos = random_combos(6, 3, 20000, numpy.random.RandomState(0))
+        counts = {}
+        for combo in combos.tolist():
+            counts[tuple(combo)] = counts.get(tuple(combo), 0) + 1
+        self.assertEqual(sorted(counts.keys()), list(combinations(range(6), 3)))
+        for count in counts.values():
+            self.assertTrue(abs(count - 1000) < 150)
+
+
+class RevolvingDoorTest(unittest.TestCase):
+
+    def test_minimal_change(self):
+        '''Every combo appears once, each one swap away from the last.'''
+        for n in range(1, 9):
+            for k in range(1, n + 1):
+                seen = set([])
+                last = None
+                for combo, removed, added in revolving_door(n, k):
+                    self.assertEqual(len(combo), k)
+                    self.assertEqual(list(combo), sorted(combo))
+                    if last is not None:
+                        self.assertEqual(set(last) - set(combo), set([removed]))
+                        self.assertEqual(set(combo) - set(last), set([added]))
+                    seen.add(combo)
+                    last = combo
+                self.assertEqual(len(seen), choose(n, k))
+
+    def test_runs(self):
+        '''Runs over any rank range should match the revolving-door order.'''
+        for depth in [1, 2, 3]:
+            for n in range(1, 8):
+                for k in range(1, n + 1):
+                    order = [c for c, removed, added in revolving_door(n, k)]
+                    total = len(order)
+                    for lo in range(total + 1):
+                        for hi in range(lo, total + 1):
+                            combos = [tuple(sorted(fixed + tuple(t)))
+                                      for fixed, tail in revolving_door_runs(n, k, lo, hi, depth)
+                                      for t in tail]
+                            self.assertEqual(combos, order[lo:hi])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
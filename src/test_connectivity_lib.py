@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+'''Validate any-path connectivity against residual graphs.'''
+
+import logging
+import unittest
+
+import networkx as nx
+
+from availability_lib import get_failure_states
+from connectivity_lib import AnyPathAvailability, bridges, edge_ends
+from connectivity_lib import single_failure_reach
+import matrix_lib
+import metrics_lib
+from lib.graph import loop_graph
+from topo.os3e import OS3EGraph
+
+lg = logging.getLogger("test_connectivity_lib")
+
+COMBOS = [["Sunnyvale, CA", "Boston"],
+          ["Portland"],
+          ["Seattle", "Portland", "Miami"]]
+
+
+def graphs():
+    '''Return graphs with and without bridges, some disconnected.'''
+    g = nx.union(nx.path_graph(4), loop_graph(5), rename = ('a', 'b'))
+    g.add_edge('a3', 'b0')
+    disconnected = nx.union(nx.star_graph(3), nx.complete_graph(4),
+                            rename = ('a', 'b'))
+    return [OS3EGraph(), nx.path_graph(5), nx.star_graph(4), loop_graph(6),
+            g, disconnected]
+
+
+def reachable(g, failed_links, controllers):
+    '''Return the # nodes that reach a controller, from a residual graph.'''
+    residual = g.copy()
+    residual.remove_edges_from(failed_links)
+    reached = set([])
+    for c in controllers:
+        reached |= set(nx.node_connected_component(residual, c))
+    return len(reached)
+
+
+class BridgeTest(unittest.TestCase):
+
+    def test_bridges(self):
+        '''Bridges should be the edges whose removal cuts off their side.'''
+        for g in graphs():
+            nodes = g.nodes()
+            edges = g.edges()
+            cut_off = bridges(len(nodes), edge_ends(nodes, edges))
+            components = nx.number_connected_components(g)
+            for e, (src, dst) in enumerate(edges):
+                residual = g.copy()
+                residual.remove_edge(src, dst)
+                split = nx.number_connected_components(residual) > components
+                self.assertEqual(e in cut_off, split)
+                if split:
+                    side = set(nodes[i] for i in cut_off[e])
+                    self.assertTrue(side in [set(nx.node_connected_component(residual, src)),
+                                             set(nx.node_connected_component(residual, dst))])
+
+    def test_single_failure_reach(self):
+        for g in graphs():
+            for controller in g.nodes():
+                reach = single_failure_reach(g.nodes(), g.edges(), controller)
+                for edge, r in zip(g.edges(), reach):
+                    self.assertEqual(r, reachable(g, [edge], [controller]))
+
+
+class AnyPathTest(unittest.TestCase):
+
+    def test_matches_residual_graphs(self):
+        '''Availability should match components of every residual graph.'''
+        link_fail_prob = 0.02
+        for g in graphs()[1:]:
+            apsp = nx.all_pairs_shortest_path_length(g)
+            dm = matrix_lib.dist_matrix(g, apsp)
+            states = get_failure_states(g, False, link_fail_prob)
+            combos = [[node] for node in g.nodes()] + [g.nodes()[:2]]
+            for max_failures in range(4):
+                model = AnyPathAvailability(g, dm.nodes, False, link_fail_prob,
+                                            max_failures)
+                for combo in combos:
+                    expected = 0.0
+                    for failures in range(max_failures + 1):
+                        failed, state_probs = states.level(failures)
+                        for failed_ids, state_prob in zip(failed, state_probs):
+                            failed_links = [states.edges[i] for i in failed_ids]
+                            expected += state_prob * reachable(g, failed_links,
+                                combo) / float(g.number_of_nodes())
+                    self.assertAlmostEqual(model.availability(
+                        dm.combo_index(combo)), expected)
+
+    def test_os3e(self):
+        '''Any-path availability can only beat SSSP-path availability.'''
+        g = OS3EGraph()
+        apsp = nx.all_pairs_shortest_path_length(g)
+        apsp_paths = nx.all_pairs_shortest_path(g)
+        extra_params = {'link_fail_prob': 0.01, 'max_failures': 2}
+        for combo in COMBOS:
+            any_path = metrics_lib.get_availability_any(g, combo, apsp,
+                apsp_paths, False, extra_params)
+            sssp = metrics_lib.get_availability(g, combo, apsp, apsp_paths,
+                                                False, extra_params)
+            self.assertTrue(sssp < any_path <= 1.0)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
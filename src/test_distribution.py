@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+'''Validate columnar distribution output.'''
+
+import logging
+import shutil
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy
+
+import distribution_lib
+from distribution_lib import DistWriter, get_distribution, read_nodes
+import metrics_lib
+from os3e_weighted import OS3EWeightedGraph
+
+lg = logging.getLogger("test_distribution")
+
+METRICS = ['latency', 'wc_latency', 'fairness']
+CONTROLLERS = [1, 2, 3]
+
+
+class DistWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_chunks(self):
+        '''Rows from several writers should all land in the columns.'''
+        old_chunk_rows = distribution_lib.CHUNK_ROWS
+        distribution_lib.CHUNK_ROWS = 10
+        try:
+            distribution_lib.init_dir(self.dirname, ['a', 'b', 'c'])
+            total = DistWriter(self.dirname, 2, ['x'], True)
+            for first in [0, 25]:
+                writer = DistWriter(self.dirname, 2, ['x'], True)
+                for i in range(first, first + 25, 5):
+                    ids = numpy.arange(i, i + 5)
+                    writer.append(ids, numpy.array([[0, 1]] * 5), {'x': ids * 0.5})
+                writer.flush()
+                total.merge(writer)
+        finally:
+            distribution_lib.CHUNK_ROWS = old_chunk_rows
+        self.assertEqual(distribution_lib.consolidate(self.dirname, 2), 50)
+        self.assertEqual(total.rows, 50)
+        columns = distribution_lib.read_columns(self.dirname, 2)
+        self.assertEqual(sorted(columns.keys()), ['combo', 'id', 'x'])
+        self.assertEqual(sorted(columns['id']), range(50))
+        self.assertTrue((columns['x'] == columns['id'] * 0.5).all())
+        self.assertEqual(columns['combo'].shape, (50, 2))
+        self.assertEqual(read_nodes(self.dirname), ['a', 'b', 'c'])
+
+
+class RunAllCombosTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EWeightedGraph()
+        self.apsp = nx.all_pairs_dijkstra_path_length(self.g)
+        self.apsp_paths = nx.all_pairs_dijkstra_path(self.g)
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def run_combos(self, dist_format, multiprocess = False):
+        data = {}
+        metrics_lib.run_all_combos(METRICS, self.g, CONTROLLERS, data,
+            self.apsp, self.apsp_paths, True, True, True, processes = 2,
+            multiprocess = multiprocess, dist_format = dist_format,
+            dist_path = self.dirname)
+        return data
+
+    def check_matches(self, multiprocess):
+        '''NPY columns should hold the same rows as the JSON distribution.'''
+        expected = self.run_combos('json')
+        data = self.run_combos('npy', multiprocess)
+        nodes = read_nodes(self.dirname)
+        for group in data['group']:
+            dist = expected['data'][group]['distribution']
+            self.assertEqual(data['data'][group]['distribution']['rows'], len(dist))
+            columns = get_distribution(data, group)
+            order = columns['id'].argsort()
+            for i, d in zip(order, sorted(dist, key = lambda d: d['id'])):
+                self.assertEqual(columns['id'][i], d['id'])
+                self.assertEqual([nodes[j] for j in columns['combo'][i]],
+                                 list(d['combo']))
+                for metric in METRICS:
+                    self.assertAlmostEqual(columns[metric][i], d[metric])
+
+    def test_serial(self):
+        self.check_matches(False)
+
+    def test_multiprocess(self):
+        self.check_matches(True)
+
+    def test_json_columns(self):
+        '''JSON distributions should read back as columns too.'''
+        data = self.run_combos('json')
+        columns = get_distribution(data, '2')
+        self.assertEqual(len(columns['latency']), len(data['data']['2']['distribution']))
+        self.assertEqual(columns['wc_latency'].max(),
+                         data['data']['2']['wc_latency']['highest'])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -1,11 +1,16 @@
 #!/usr/bin/env python
+from itertools import combinations
 import logging
 import unittest
 
 import networkx as nx
+import numpy
 
+from combo_lib import combo_blocks, random_combos, revolving_door_runs
 from itertools_recipes import choose
 from lib.graph import set_unit_weights
+import matrix_lib
+import metrics_lib
 from metrics_lib import fairness, availability_one_combo
 from metrics_lib import link_failure_combinations, fraction_within_latency
 from topo.os3e import OS3EGraph
@@ -163,6 +168,137 @@ class LatencyTest(unittest.TestCase):
             self.assertEqual(two, len(combo) / float(g.number_of_nodes()))
 
 
+class MatrixTest(unittest.TestCase):
+
+    def test_matches_dicts(self):
+        '''Ensure matrix-based metrics match the apsp dict-based ones.'''
+        g = OS3EWeightedGraph()
+        apsp = nx.all_pairs_dijkstra_path_length(g)
+        dm = matrix_lib.dist_matrix(g, apsp)
+        dict_fcns = {
+            'latency': lambda combo: metrics_lib.get_total_path_len(g, combo, apsp) / float(g.number_of_nodes()),
+            'latency_2': lambda combo: metrics_lib.get_total_path_len_2(g, combo, apsp) / float(g.number_of_nodes()),
+            'wc_latency': lambda combo: metrics_lib.worst_case_latency(g, combo, apsp),
+            'wc_latency_2': lambda combo: metrics_lib.worst_case_latency_2(g, combo, apsp),
+            'fairness': lambda combo: metrics_lib.controller_split_fairness(g, combo, apsp, True)
+        }
+        for combo_size in range(1, 4):
+            for combo in combinations(g.nodes(), combo_size):
+                combo_index = dm.combo_index(combo)
+                for metric, fcn in dict_fcns.iteritems():
+                    self.assertAlmostEqual(fcn(combo),
+                        matrix_lib.METRIC_FCNS[metric](dm, combo_index))
+
+    def test_batch_matches_single(self):
+        '''Ensure batched metrics match one-combo-at-a-time metrics.'''
+        g = OS3EWeightedGraph()
+        apsp = nx.all_pairs_dijkstra_path_length(g)
+        dm = matrix_lib.dist_matrix(g, apsp)
+        metrics = matrix_lib.BATCH_METRICS
+        for combo_size in range(1, 4):
+            for combos in combo_blocks(g.number_of_nodes(), combo_size, 500):
+                values = matrix_lib.batch_metrics(dm, combos, metrics)
+                for metric in metrics:
+                    self.assertEqual(len(values[metric]), len(combos))
+                    for i, combo_index in enumerate(combos):
+                        self.assertAlmostEqual(values[metric][i],
+                            matrix_lib.METRIC_FCNS[metric](dm, combo_index))
+
+    def test_incremental_matches_batch(self):
+        '''Ensure revolving-door incremental metrics match batched ones.'''
+        g = OS3EWeightedGraph()
+        apsp = nx.all_pairs_dijkstra_path_length(g)
+        dm = matrix_lib.dist_matrix(g, apsp)
+        metrics = matrix_lib.INCREMENTAL_METRICS
+        for combo_size in range(1, 5):
+            state = None
+            for fixed, tail in revolving_door_runs(g.number_of_nodes(), combo_size):
+                if state is None:
+                    state = matrix_lib.NearestState(dm, fixed)
+                else:
+                    removed = set(state.combo) - set(fixed)
+                    added = set(fixed) - set(state.combo)
+                    for r, a in zip(removed, added):
+                        state.swap(r, a)
+                values = state.run_metrics(tail, metrics)
+                combos = numpy.empty((len(tail), combo_size), dtype = int)
+                combos[:, :len(fixed)] = fixed
+                combos[:, len(fixed):] = tail
+                expected = matrix_lib.batch_metrics(dm, combos, metrics)
+                for metric in metrics:
+                    for i in range(len(tail)):
+                        self.assertAlmostEqual(values[metric][i], expected[metric][i])
+
+
+
+class BaselineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EWeightedGraph()
+        self.apsp = nx.all_pairs_dijkstra_path_length(self.g)
+        self.apsp_paths = nx.all_pairs_dijkstra_path(self.g)
+
+    def test_best_worst_n(self):
+        '''Picks should be the best and worst of the seeded samples.'''
+        n = 20
+        nodes = self.g.nodes()
+        for metric in ['latency', 'wc_latency', 'fairness']:
+            data = {}
+            metrics_lib.run_best_n(data, self.g, self.apsp, n, True, metric,
+                                   self.apsp_paths, seed = 1)
+            metrics_lib.run_worst_n(data, self.g, self.apsp, n, True, metric,
+                                    self.apsp_paths, seed = 1)
+            suffix = '' if metric == 'latency' else '-' + metric
+            random = numpy.random.RandomState(1)
+            for k in range(1, len(nodes) + 1):
+                samples = [[nodes[i] for i in combo] for combo in
+                           random_combos(len(nodes), k, n, random)]
+                values = [metrics_lib.METRIC_FCNS[metric](self.g, combo,
+                    self.apsp, self.apsp_paths, True, None) for combo in samples]
+                if metric == 'fairness':
+                    values = [-v for v in values]
+                best = data[unicode(k)]['best-n-%s%s' % (n, suffix)]
+                worst = data[unicode(k)]['worst-n-%s%s' % (n, suffix)]
+                self.assertEqual(best['combo'], samples[numpy.argmin(values)])
+                self.assertEqual(worst['combo'], samples[numpy.argmax(values)])
+                self.assertAlmostEqual(abs(best[metric]), abs(min(values)))
+                self.assertAlmostEqual(abs(worst[metric]), abs(max(values)))
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def run_combos(self, multiprocess, incremental):
+        g = OS3EWeightedGraph()
+        apsp = nx.all_pairs_dijkstra_path_length(g)
+        apsp_paths = nx.all_pairs_dijkstra_path(g)
+        data = {}
+        metrics_lib.run_all_combos(['latency', 'wc_latency', 'fairness'], g,
+            [1, 2, 3], data, apsp, apsp_paths, True, True, True, processes = 3,
+            multiprocess = multiprocess, chunksize = 7, incremental = incremental)
+        return data
+
+    def test_dynamic_matches_serial(self):
+        '''Dynamically scheduled rank ranges should match a serial run.'''
+        coarse = metrics_lib.COARSE
+        metrics_lib.COARSE = False
+        try:
+            for incremental in [False, True]:
+                expected = self.run_combos(False, incremental)
+                data = self.run_combos(True, incremental)
+                for group in expected['data']:
+                    self.assertEqual(data['data'][group]['distribution'],
+                                     expected['data'][group]['distribution'])
+                    for metric in expected['metric']:
+                        got = data['data'][group][metric]
+                        for key, value in expected['data'][group][metric].iteritems():
+                            if key in ['lowest', 'highest', 'mean', 'sum']:
+                                self.assertAlmostEqual(got[key], value)
+                            elif key != 'duration':
+                                self.assertEqual(got[key], value)
+        finally:
+            metrics_lib.COARSE = coarse
+
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     unittest.main()
\ No newline at end of file
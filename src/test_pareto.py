@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+'''Validate online Pareto fronts against the full distribution.'''
+
+import logging
+import unittest
+
+import networkx as nx
+import numpy
+
+from distribution_lib import get_distribution
+import metrics_lib
+from os3e_weighted import OS3EWeightedGraph
+from pareto_lib import MAXIMIZE, ParetoFront, front_key, get_pareto
+from pareto_lib import non_dominated
+
+lg = logging.getLogger("test_pareto")
+
+METRICS = ['latency', 'wc_latency', 'fairness']
+PARETO = [['latency', 'wc_latency'], METRICS]
+CONTROLLERS = [1, 2, 3]
+
+
+def signed(columns, metrics):
+    '''Return points to minimize, negating metrics where higher is better.'''
+    return numpy.column_stack([-columns[m] if m in MAXIMIZE else columns[m]
+                               for m in metrics])
+
+
+def brute_force(points):
+    '''Return indices of non-dominated rows, keeping the first of equal rows.'''
+    keep = []
+    for i, p in enumerate(points):
+        dominated = False
+        for j, q in enumerate(points):
+            if (q <= p).all() and ((q < p).any() or j < i):
+                dominated = True
+                break
+        if not dominated:
+            keep.append(i)
+    return keep
+
+
+class NonDominatedTest(unittest.TestCase):
+
+    def test_random(self):
+        '''Fronts should match brute force, including ties.'''
+        random = numpy.random.RandomState(0)
+        for d in [2, 3]:
+            for m in [0, 1, 5, 50, 300]:
+                points = random.randint(0, 8, (m, d))
+                self.assertEqual(non_dominated(points).tolist(),
+                                 brute_force(points))
+
+    def test_maximize(self):
+        '''Availability should be maximized, not minimized.'''
+        front = ParetoFront(['latency', 'availability'])
+        front.update([[1.0, 0.9], [2.0, 0.99], [2.0, 0.95], [3.0, 0.9]],
+                     [[0], [1], [2], [3]])
+        self.assertEqual(front.combos.tolist(), [[0], [1]])
+
+
+class RunAllCombosTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EWeightedGraph()
+        self.apsp = nx.all_pairs_dijkstra_path_length(self.g)
+        self.apsp_paths = nx.all_pairs_dijkstra_path(self.g)
+
+    def run_combos(self, multiprocess = False, write_dist = False):
+        data = {}
+        metrics_lib.run_all_combos(METRICS, self.g, CONTROLLERS, data,
+            self.apsp, self.apsp_paths, True, write_dist, True, processes = 2,
+            multiprocess = multiprocess, pareto = PARETO)
+        return data
+
+    def test_matches_distribution(self):
+        '''Fronts should be the non-dominated points of the distribution.'''
+        data = self.run_combos(write_dist = True)
+        for group in data['group']:
+            columns = get_distribution(data, group)
+            for metrics in PARETO:
+                points = signed(columns, metrics)
+                expected = [([columns[m][i] for m in metrics],
+                             list(columns['combo'][i]))
+                            for i in non_dominated(points)]
+                self.assertEqual(expected, [
+                    ([point[m] for m in metrics], point['combo'])
+                    for point in data['data'][group]['pareto'][front_key(metrics)]])
+                self.assertEqual(len(brute_force(points)), len(expected))
+
+    def test_multiprocess(self):
+        '''Merged fronts from workers should match a serial run.'''
+        serial = self.run_combos()
+        coarse = self.run_combos(True)
+        metrics_lib.COARSE = False
+        try:
+            fine = self.run_combos(True)
+        finally:
+            metrics_lib.COARSE = True
+        for group in serial['group']:
+            self.assertEqual(coarse['data'][group]['pareto'],
+                             serial['data'][group]['pareto'])
+            self.assertEqual(fine['data'][group]['pareto'],
+                             serial['data'][group]['pareto'])
+
+    def test_get_pareto(self):
+        '''Plots should find a pair front within a stored triple front.'''
+        data = self.run_combos()
+        del data['data']['2']['pareto'][front_key(PARETO[0])]
+        columns = get_pareto(data, '2', ['wc_latency', 'latency'])
+        points = numpy.column_stack([columns['latency'], columns['wc_latency']])
+        pair = points[non_dominated(points)]
+        expected = self.run_combos()['data']['2']['pareto'][front_key(PARETO[0])]
+        self.assertEqual(pair.tolist(), [[point['latency'], point['wc_latency']]
+                                         for point in expected])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
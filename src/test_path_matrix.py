@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+'''Validate predecessor-matrix paths and path-based metrics.'''
+
+from itertools import combinations
+import logging
+import unittest
+
+import networkx as nx
+import numpy
+
+import matrix_lib
+import metrics_lib
+import path_matrix_lib
+from path_matrix_lib import path_matrix, path_matrix_from_paths
+from os3e_weighted import OS3EWeightedGraph
+
+lg = logging.getLogger("test_path_matrix")
+
+
+class PathMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EWeightedGraph()
+        self.apsp = nx.all_pairs_dijkstra_path_length(self.g)
+        self.apsp_paths = nx.all_pairs_dijkstra_path(self.g)
+        self.pm = path_matrix(self.g)
+
+    def test_matches_dicts(self):
+        '''Paths should match nx.all_pairs_dijkstra_path exactly.'''
+        pm_dicts = path_matrix_from_paths(self.g, self.g.nodes(), self.apsp_paths)
+        for src in self.g.nodes():
+            for dst in self.g.nodes():
+                self.assertEqual(self.pm[src][dst], self.apsp_paths[src][dst])
+                self.assertEqual(pm_dicts[src][dst], self.apsp_paths[src][dst])
+
+    def test_path_edges(self):
+        '''Each pair's edge ids should walk its path in order.'''
+        pm = self.pm
+        n = len(pm.nodes)
+        for src in range(n):
+            for dst in range(n):
+                path = pm.path(src, dst)
+                edges = [pm.edges[i] for i in pm.path_edges(src, dst)]
+                self.assertEqual(len(edges), len(path) - 1)
+                for i, (a, b) in enumerate(edges):
+                    self.assertEqual(set([a, b]),
+                                     set([pm.nodes[path[i]], pm.nodes[path[i + 1]]]))
+
+    def test_unreachable(self):
+        g = nx.Graph()
+        g.add_edge(0, 1, weight = 1.0)
+        g.add_node(2)
+        pm = path_matrix(g)
+        self.assertEqual(pm[0][1], [0, 1])
+        self.assertEqual(pm[2][2], [2])
+        self.assertRaises(KeyError, lambda: pm[0][2])
+        self.assertEqual(len(pm.path_edges(pm.index[0], pm.index[2])), 0)
+
+    def test_congestion(self):
+        '''Array congestion should match the dict-based version.'''
+        dm = matrix_lib.dist_matrix(self.g, self.apsp)
+        for combo_size in range(1, 4):
+            combos = list(combinations(self.g.nodes(), combo_size))
+            values, edge_ids = path_matrix_lib.batch_congestion(dm, self.pm,
+                numpy.array([dm.combo_index(combo) for combo in combos]))
+            for combo, value, e in zip(combos, values, edge_ids):
+                congestion, link = path_matrix_lib.congestion(dm, self.pm,
+                                                              dm.combo_index(combo))
+                expected, expected_link = metrics_lib.most_congested_link(
+                    self.g, combo, self.apsp, self.apsp_paths, True)
+                self.assertAlmostEqual(congestion, expected)
+                self.assertAlmostEqual(value, expected)
+                self.assertEqual(link, self.pm.edges[e])
+                self.assertEqual(link, expected_link)
+
+    def test_connectivity(self):
+        '''Array connectivity should match the dict-based version.'''
+        dm = matrix_lib.dist_matrix(self.g, self.apsp)
+        for failed_links in metrics_lib.link_failure_combinations(self.g, 1):
+            failed_ids = self.pm.edge_ids(failed_links)
+            for combo in combinations(self.g.nodes(), 2):
+                self.assertAlmostEqual(
+                    path_matrix_lib.connectivity(dm, self.pm,
+                        dm.combo_index(combo), failed_ids),
+                    metrics_lib.connectivity_sssp(self.g, combo, self.apsp,
+                        self.apsp_paths, True, failed_links))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
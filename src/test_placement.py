@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+'''Validate placement solvers against exhaustive enumeration.'''
+
+import logging
+import unittest
+
+import networkx as nx
+import numpy
+
+from combo_lib import combo_blocks
+import matrix_lib
+from path_matrix_lib import path_matrix
+from placement_lib import bnb_optimal, run_bnb, kcenter_optimal, CoverSets
+from placement_lib import assignment_loads, capacitated_assignment
+from placement_lib import capacitated_placement, run_capacitated
+from placement_lib import greedy, lazy_greedy
+import metrics_lib
+from metrics_lib import get_total_path_len
+from os3e_weighted import OS3EWeightedGraph
+
+lg = logging.getLogger("test_placement")
+
+
+def brute_force(dm, combo_size, metric):
+    '''Return lowest metric value over all combos.'''
+    lowest = None
+    for combos in combo_blocks(len(dm.nodes), combo_size, 4096):
+        values = matrix_lib.batch_metrics(dm, combos, [metric])[metric]
+        if lowest is None or values.min() < lowest:
+            lowest = values.min()
+    return lowest
+
+
+class BranchAndBoundTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EWeightedGraph()
+        self.apsp = nx.all_pairs_dijkstra_path_length(self.g)
+        self.dm = matrix_lib.dist_matrix(self.g, self.apsp)
+
+    def test_matches_brute_force(self):
+        '''Optimal values should match exhaustive search.'''
+        for combo_size in range(1, 5):
+            for metric in ['latency', 'wc_latency']:
+                value, combo = bnb_optimal(self.dm, combo_size, metric)
+                self.assertEqual(len(combo), combo_size)
+                self.assertAlmostEqual(value, brute_force(self.dm, combo_size, metric))
+                self.assertAlmostEqual(value,
+                    matrix_lib.METRIC_FCNS[metric](self.dm, combo))
+
+    def test_run_bnb(self):
+        '''run_bnb should write lowest values and combos.'''
+        data = {}
+        run_bnb(['latency', 'wc_latency'], self.g, [2, 3], data, self.apsp)
+        self.assertEqual(data['group'], ['2', '3'])
+        for combo_size in [2, 3]:
+            for metric in ['latency', 'wc_latency']:
+                entry = data['data'][unicode(combo_size)][metric]
+                combo_index = self.dm.combo_index(entry['lowest_combo'])
+                self.assertAlmostEqual(entry['lowest'],
+                    matrix_lib.METRIC_FCNS[metric](self.dm, combo_index))
+
+    def test_unsupported_metric(self):
+        self.assertRaises(Exception, run_bnb, ['fairness'], self.g, [2], {},
+                          self.apsp)
+
+
+class LazyGreedyTest(unittest.TestCase):
+
+    def test_matches_greedy(self):
+        '''Lazy gains should pick the same order as recomputing every gain.'''
+        random = numpy.random.RandomState(0)
+        graphs = [OS3EWeightedGraph(), nx.grid_2d_graph(4, 5),
+                  nx.path_graph(7), nx.star_graph(5)]
+        for g in graphs:
+            for u, v in g.edges():
+                g[u][v].setdefault('weight', float(random.randint(1, 4)))
+            dm = matrix_lib.dist_matrix(g, nx.all_pairs_dijkstra_path_length(g))
+            n = len(dm.nodes)
+            self.assertEqual(list(lazy_greedy(dm.dist)),
+                             greedy(dm.dist, 'latency', n))
+
+    def test_greedy_informed(self):
+        '''run_greedy_informed should match the greedy over path lengths.'''
+        g = OS3EWeightedGraph()
+        apsp = nx.all_pairs_dijkstra_path_length(g)
+        data = {}
+        metrics_lib.run_greedy_informed(data, g, apsp, True)
+        soln = []
+        for combo_size in range(1, g.number_of_nodes() + 1):
+            totals = [(get_total_path_len(g, soln + [n], apsp), i, n)
+                      for i, n in enumerate(g.nodes()) if n not in soln]
+            soln.append(min(totals)[2])
+            entry = data[unicode(combo_size)]['greedy-informed']
+            self.assertEqual(entry['combo'][:combo_size], soln)
+
+
+class KCenterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EWeightedGraph()
+        apsp = nx.all_pairs_dijkstra_path_length(self.g)
+        self.dm = matrix_lib.dist_matrix(self.g, apsp)
+
+    def test_matches_brute_force(self):
+        '''Optimal wc_latency should match exhaustive search.'''
+        for combo_size in range(1, 5):
+            value, combo = kcenter_optimal(self.dm, combo_size)
+            self.assertEqual(len(combo), combo_size)
+            self.assertAlmostEqual(value,
+                brute_force(self.dm, combo_size, 'wc_latency'))
+            self.assertAlmostEqual(value, matrix_lib.wc_latency(self.dm, combo))
+
+    def test_find_cover(self):
+        '''Covers exist exactly at and above the optimal wc_latency.'''
+        for combo_size in range(1, 5):
+            value, combo = kcenter_optimal(self.dm, combo_size)
+            cover = CoverSets(self.dm, value).find_cover(combo_size)
+            self.assertTrue(cover is not None)
+            self.assertTrue(len(cover) <= combo_size)
+            self.assertTrue(matrix_lib.wc_latency(self.dm, cover) <= value)
+            below = self.dm.dist[self.dm.dist < value].max()
+            self.assertEqual(CoverSets(self.dm, below).find_cover(combo_size), None)
+
+    def test_fraction_within_latency(self):
+        '''Bitset coverage should match the matrix-based metric.'''
+        for lat_bound in [500, 1000, 2000]:
+            cover_sets = CoverSets(self.dm, lat_bound)
+            for combos in combo_blocks(len(self.dm.nodes), 2, 4096):
+                for combo_index in combos:
+                    self.assertAlmostEqual(
+                        cover_sets.fraction_within_latency(combo_index),
+                        matrix_lib.fraction_within_latency(self.dm, combo_index,
+                                                           lat_bound))
+
+
+class CapacitatedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EWeightedGraph()
+        self.apsp = nx.all_pairs_dijkstra_path_length(self.g)
+        self.dm = matrix_lib.dist_matrix(self.g, self.apsp)
+        self.pm = path_matrix(self.g, self.dm.nodes)
+
+    def test_assignment(self):
+        '''Two controllers split switches by their difference in distance.'''
+        dist = self.dm.dist
+        n = dist.shape[0]
+        for combo in [[0, 1], [3, 20], [10, 33]]:
+            for capacity in [17, 20, n]:
+                total, assignment = capacitated_assignment(dist, combo, capacity)
+                counts = [(assignment == c).sum() for c in combo]
+                self.assertTrue(max(counts) <= capacity)
+                # The first controller takes the switches that gain most by
+                # it, up to its capacity, and at least as many as it must.
+                diffs = numpy.sort(dist[:, combo[0]] - dist[:, combo[1]])
+                first = max(min((diffs < 0).sum(), capacity), n - capacity)
+                expected = dist[:, combo[1]].sum() + diffs[:first].sum()
+                self.assertAlmostEqual(total / expected, 1.0)
+
+    def test_infeasible(self):
+        total, assignment = capacitated_assignment(self.dm.dist, [0, 1], 16)
+        self.assertEqual(assignment, None)
+
+    def test_uncapacitated(self):
+        '''With room for every switch, placements are as good as swaps get.'''
+        n = len(self.dm.nodes)
+        for k in [1, 2, 3]:
+            value, combo, assignment = capacitated_placement(self.dm, k, n)
+            self.assertAlmostEqual(value, matrix_lib.latency(self.dm, combo))
+            self.assertTrue(value >= bnb_optimal(self.dm, k, 'latency')[0] - 1e-9)
+
+    def test_limits(self):
+        '''Capacity and link budgets should hold for the placements found.'''
+        n = len(self.dm.nodes)
+        for k, capacity, link_budget in [(2, 17, None), (3, 12, 0.3),
+                                         (4, 10, 0.2)]:
+            value, combo, assignment = capacitated_placement(self.dm, k,
+                capacity, self.pm, link_budget)
+            self.assertEqual(len(combo), k)
+            self.assertTrue(numpy.bincount(assignment).max() <= capacity)
+            self.assertEqual(set(assignment), set(combo))
+            if link_budget:
+                self.assertTrue(assignment_loads(self.pm, assignment).max() / n
+                                <= link_budget)
+            unlimited = capacitated_placement(self.dm, k, n)[0]
+            self.assertTrue(value >= unlimited - 1e-9)
+
+    def test_run_capacitated(self):
+        data = {}
+        run_capacitated(self.g, [1, 2, 3], data, self.apsp, self.pm, 12)
+        # One or two controllers cannot take 34 switches.
+        self.assertEqual(sorted(data.keys()), ['3'])
+        entry = data['3']['capacitated']
+        self.assertEqual(entry['capacity'], 12)
+        self.assertTrue(0.0 < entry['fairness'] <= 1.0)
+        self.assertTrue(0.0 < entry['congestion'] <= 1.0)
+        # Capacity only ever moves switches off their closest controller.
+        self.assertTrue(entry['latency'] >= matrix_lib.latency(self.dm,
+            self.dm.combo_index(entry['combo'])))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
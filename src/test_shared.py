@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+'''Validate graph data shared with worker processes.'''
+
+import glob
+import logging
+import os
+import unittest
+
+import networkx as nx
+
+import matrix_lib
+import metrics_lib
+import shared_lib
+from shared_lib import publish_graph, attach_graph
+from os3e_weighted import OS3EWeightedGraph
+
+lg = logging.getLogger("test_shared")
+
+
+class SharedGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g = OS3EWeightedGraph()
+        self.apsp = nx.all_pairs_dijkstra_path_length(self.g)
+        self.apsp_paths = nx.all_pairs_dijkstra_path(self.g)
+        self.nodes = self.g.nodes()
+        dm = matrix_lib.dist_matrix(self.g, self.apsp)
+        self.shared = publish_graph(self.g, self.nodes, dm, self.apsp_paths)
+
+    def tearDown(self):
+        self.shared.close()
+
+    def test_matches_dicts(self):
+        '''Attached data should match the original graph and apsp dicts.'''
+        g, dm, apsp, apsp_paths = attach_graph(self.shared.dirname, self.nodes)
+        self.assertEqual(sorted(g.nodes()), sorted(self.nodes))
+        self.assertEqual(g.number_of_edges(), self.g.number_of_edges())
+        for src, dst in self.g.edges():
+            self.assertEqual(g[src][dst]['weight'], self.g[src][dst]['weight'])
+        self.assertEqual(dm.nodes, self.nodes)
+        # Published paths keep the original edge order.
+        self.assertEqual(list(apsp_paths.edges), self.g.edges())
+        for src in self.nodes:
+            self.assertEqual(dict(apsp[src].iteritems()), self.apsp[src])
+            for dst in self.nodes:
+                self.assertEqual(apsp[src][dst], self.apsp[src][dst])
+                self.assertEqual(apsp_paths[src][dst], self.apsp_paths[src][dst])
+
+    def test_missing_paths(self):
+        '''Unreachable pairs should raise KeyError, like the dicts.'''
+        g = nx.Graph()
+        g.add_edge(0, 1, weight = 1.0)
+        g.add_node(2)
+        apsp = nx.all_pairs_dijkstra_path_length(g)
+        apsp_paths = nx.all_pairs_dijkstra_path(g)
+        nodes = g.nodes()
+        shared = publish_graph(g, nodes, matrix_lib.dist_matrix(g, apsp), apsp_paths)
+        g2, dm, apsp2, apsp_paths2 = attach_graph(shared.dirname, nodes)
+        shared.close()
+        self.assertEqual(apsp2[0][1], 1.0)
+        self.assertEqual(apsp_paths2[0][1], [0, 1])
+        self.assertRaises(KeyError, lambda: apsp2[0][2])
+        self.assertRaises(KeyError, lambda: apsp_paths2[0][2])
+        self.assertEqual(apsp_paths2[0].get(2), None)
+
+
+class CleanupTest(unittest.TestCase):
+
+    def test_worker_error(self):
+        '''Published arrays should be removed even if a worker fails.'''
+        g = OS3EWeightedGraph()
+        apsp = nx.all_pairs_dijkstra_path_length(g)
+        apsp_paths = nx.all_pairs_dijkstra_path(g)
+        pattern = os.path.join(shared_lib.SHARED_DIR or '/tmp', 'cpp_shared_*')
+        before = set(glob.glob(pattern))
+        # Availability without its extra params fails in every worker.
+        self.assertRaises(AssertionError, metrics_lib.run_all_combos,
+                          ['availability'], g, [1], {}, apsp, apsp_paths,
+                          True, extra_params = {}, processes = 2,
+                          multiprocess = True)
+        self.assertEqual(set(glob.glob(pattern)), before)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
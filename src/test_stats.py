@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+'''Validate streaming quantile sketches.'''
+
+import logging
+import unittest
+
+import numpy
+
+from stats_lib import QuantileSketch
+
+lg = logging.getLogger("test_stats")
+
+
+def rank_error(values, q, estimate):
+    '''Return how far estimate's rank in values is from q, as a fraction.'''
+    values = numpy.sort(values)
+    lo = values.searchsorted(estimate, 'left') / float(len(values))
+    hi = values.searchsorted(estimate, 'right') / float(len(values))
+    if lo <= q <= hi:
+        return 0.0
+    return min(abs(lo - q), abs(hi - q))
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def test_exact_when_small(self):
+        '''Before any compaction, quantiles match NumPy exactly.'''
+        values = numpy.random.RandomState(1).rand(500)
+        sketch = QuantileSketch()
+        for value in values:
+            sketch.update(value)
+        self.assertEqual(sketch.quantile(0.5), numpy.median(values))
+        self.assertEqual(sketch.quantile(0.05), numpy.percentile(values, 5))
+
+    def test_bounded_accuracy(self):
+        '''Many values should fit in bounded space with small rank error.'''
+        rng = numpy.random.RandomState(2)
+        values = numpy.concatenate([rng.exponential(size = 100000),
+                                    rng.rand(100000) * 10])
+        sketch = QuantileSketch(k = 256)
+        for block in numpy.array_split(values, 300):
+            sketch.update(block)
+        self.assertTrue(sketch.size() < 3 * 256 + 256)
+        for q in [0.05, 0.25, 0.5, 0.75, 0.95]:
+            self.assertTrue(rank_error(values, q, sketch.quantile(q)) < 0.02)
+
+    def test_merge(self):
+        '''Merged sketches should be as accurate as a single one.'''
+        rng = numpy.random.RandomState(3)
+        parts = [rng.normal(loc = i, size = 20000) for i in range(8)]
+        merged = QuantileSketch(k = 256)
+        for part in parts:
+            sketch = QuantileSketch(k = 256)
+            sketch.update(part)
+            merged.merge(sketch)
+        values = numpy.concatenate(parts)
+        self.assertEqual(merged.num, len(values))
+        for q in [0.05, 0.5, 0.95]:
+            self.assertTrue(rank_error(values, q, merged.quantile(q)) < 0.02)
+
+    def test_empty(self):
+        self.assertTrue(numpy.isnan(QuantileSketch().quantile(0.5)))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
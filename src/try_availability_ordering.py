@@ -42,7 +42,11 @@ DIST_ONLY = True
 # Additional args to pass to metrics functions.
 extra_params = {
     'link_fail_prob': 0.01,
-    'max_failures': 2
+    'max_failures': 2,
+    # One of availability_lib.AVAILABILITY_MODES; 'sample' estimates large
+    # failure models, with availability_samples states.
+    'availability_mode': 'exact',
+    'availability_samples': 10000
 }
 
 # Write out combinations?